@@ -32,6 +32,8 @@ from misc import get_config, check_dirs, CAMSTIM_DIR, get_platform_info,\
 from experiment import EObject, Timetrials, Experiment, ETimer
 from lims import LimsInterface, LimsError, BehaviorTriggerFile
 from synchro import SyncPulse, SyncSquare
+from logqueue import AsyncLogging
+from timing import GCControl
 
 import logging
 
@@ -281,6 +283,12 @@ class Behavior(BehaviorBase):
         self.window = window
         self.stimuli = OrderedDict()
 
+        # log records are written from a background thread while running
+        self._async_logging = AsyncLogging()
+        # if gc_mode is "blank", the garbage collector is only run in splash
+        #   screens, between trials and on frames with every stimulus off
+        self._gc = GCControl(self.config['behavior'].get('gc_mode', "auto"))
+
         self.behavior_text = ""
         self.behavior_path = ""
 
@@ -368,29 +376,42 @@ class Behavior(BehaviorBase):
         if self.sync_sqr:
             self.sync_sqr.update(index)
 
+        if not self._showing_stimulus():
+            self._gc.idle()
+
         if self.auto_update:
             if self.window:
                 if self.frame_pulse:
-                    self.frame_pulse.set_high()
+                    self.frame_pulse.frame_start()
                 self.window.flip()
                 if self.frame_pulse:
-                    self.frame_pulse.set_low()
+                    self.frame_pulse.frame_end()
 
         self._check_keys()
 
+    def _showing_stimulus(self):
+        """ Whether any stimulus is turned on.
+        """
+        for stimulus in self.stimuli.values():
+            if getattr(stimulus, "_on", True):
+                return True
+        return False
+
     def _splash(self):
         """ Grey splash screen if we have sync square.
         """
         if self.sync_sqr:
-            nom_freq = self.sync_sqr.frequency
-            self.sync_sqr.frequency = 5
+            self.sync_sqr.start_segment("splash", 30, frequency=5)
             for i in range(30):
                 self.sync_sqr.update(i)
+                self._gc.idle("splash")
                 self.window.flip()
-            self.sync_sqr.frequency = nom_freq
+            self.sync_sqr.start_segment("task")
 
     def start(self):
+        self._async_logging.start()
         super(Behavior, self).start()
+        self._gc.freeze()
         self._splash()
         if self.trigger_output:
             self.trigger_output.set_high()
@@ -409,6 +430,8 @@ class Behavior(BehaviorBase):
             self.window.setRecordFrameIntervals(False)
             try:
                 self._splash()
+                if self.sync_sqr:
+                    self.sync_square_edges = self.sync_sqr.expected_edges()
                 self.intervalsms = np.array(self.window.frameIntervals)*1000
                 self._print_frame_report()
                 self.window.close()
@@ -416,6 +439,10 @@ class Behavior(BehaviorBase):
             except:
                 #window is already closed...
                 pass
+        self._gc.restore()
+        if self._gc.enabled:
+            self.gc_collections = self._gc.to_dict()
+        self._async_logging.stop()
         logging.info("Task closed.")
 
     def _print_frame_report(self):
@@ -450,18 +477,19 @@ class Behavior(BehaviorBase):
         self.frame_pulse = None
         self.trigger_output = None
         try:
+            backend = cfg.get('pulse_backend', "nidaq")
             if cfg['frame_pulse']:
                 device, port, line = cfg['frame_pulse']
-                self.frame_pulse = SyncPulse(device,
-                                             port,
-                                             line)
+                self.frame_pulse = SyncPulse(device, port, line,
+                                             backend=backend)
                 self.frame_pulse.set_low()
                 logging.debug("Frame pulse configured on port {}, line {}".format(port, line))
             if cfg['acq_on_pulse']:
                 device, port, line = cfg['acq_on_pulse']
                 self.trigger_output = SyncPulse(device,
                                                 port,
-                                                line)
+                                                line,
+                                                backend=backend)
                 self.trigger_output.set_low()
                 logging.debug("Trigger output configured on port {}, line {}".format(port, line))
         except Exception as e:
@@ -783,11 +811,10 @@ class VisualObject(EObject):
         """
         On draw events.
         """
-        for k, v in self.on_draw.iteritems():
-            if k == "TF":
-                v = float(v)
-                self.stimulus.setPhase(v*self.update_count/self.fps)
-        
+        tf = self.on_draw.get("TF")
+        if tf is not None:
+            self.stimulus.setPhase(tf*self.update_count/self.fps)
+
         if self._to_draw():
             self.draw_log.append(1)
             self.stimulus.draw()
@@ -865,7 +892,7 @@ class VisualObject(EObject):
         if self.correct_table is not None:
             new = random.choice(self.correct_table)
             self._update_stimulus(new)
-            logging.debug("Stimulus updated: {}".format(new))
+            logging.debug("Stimulus updated: %s", new)
         else:
             logging.warning("Stimulus could not be changed: No correct value table.")
         self._current_correct = True
@@ -876,7 +903,7 @@ class VisualObject(EObject):
         if self.incorrect_table is not None:
             new = random.choice(self.incorrect_table)
             self._update_stimulus(new)
-            logging.debug("Stimulus updated: {}".format(new))
+            logging.debug("Stimulus updated: %s", new)
         else:
             logging.warning("Stimulus could not be changed: No incorrect value table.")
         self._current_correct = False
@@ -899,15 +926,14 @@ class VisualObject(EObject):
                 elif k == "PosY":
                     self.stimulus.setPos((self.stimulus.pos[0], v))
                 elif k == "TF":
-                    self.on_draw[k] = v
+                    self.on_draw[k] = float(v)
                 else:
                     logging.warning("Foraging stimulus object param incorrectly formatted: %s->%s" % (k, v))
         self._current_params = values
         self.stimulus_changed.emit((self.param_names, values))
         self.log.append((values, self.update_count))
-        logging.debug("Stimulus changed: {} {} {}".format(values,
-                                                          self._current_correct,
-                                                          self.update_count))
+        logging.debug("Stimulus changed: %s %s %s", values,
+                      self._current_correct, self.update_count)
 
     def set_param_sequence(self, names, sequence):
         """ Sets a parameter sequence.  Sequence is configured the same way as the
@@ -1038,7 +1064,7 @@ class Epoch(EObject):
         else:
             self._start_timer.start(self.delay)
             return
-        logging.debug("Entering epoch: {}".format(self.name))
+        logging.debug("Entering epoch: %s", self.name)
         self._on_entry()
 
         t = time.clock()
@@ -1054,7 +1080,7 @@ class Epoch(EObject):
         self.enter(immediately=True)
 
     def reset(self):
-        logging.debug("Epoch timer reset: {}".format(self.name))
+        logging.debug("Epoch timer reset: %s", self.name)
         self._epoch_timer.start(self.duration)
         # should this send the enter signal again?
 
@@ -1070,7 +1096,7 @@ class Epoch(EObject):
 
     def exit(self):
         """ Exits the epoch. """
-        logging.debug("Exitting epoch: {}".format(self.name))
+        logging.debug("Exitting epoch: %s", self.name)
         self.kill()
         t = time.clock()
         self.exits.append(t)
@@ -1198,6 +1224,7 @@ class AFCForaging(Behavior):
             self.stim_sequence.append(stim_index)
         else:
             stim_index = self.stim_sequence[index]
+        self._gc.idle("trial")
         # THIS WILL ONLY WORK WITH 2 STIMULI
         self.stimuli[stim_index].enabled = True
         self.stimuli[stim_index-1].enabled = False
@@ -1448,7 +1475,7 @@ class FlashStimulus(VisualObject):
             self._extension_time += self.extension_duration
         else:
             self._extension_time += ms
-        logging.debug("Trial extended by {} ms".format(ms))
+        logging.debug("Trial extended by %s ms", ms)
 
     def flash(self):
         """
@@ -1456,7 +1483,7 @@ class FlashStimulus(VisualObject):
         """
         self._pre_flash_timer.start(self.pre_flash_duration + self._extension_time)
         self._extension_time = 0
-        logging.info("Flash sequence started: {}".format(len(self.flash_starts)))
+        logging.info("Flash sequence started: %s", len(self.flash_starts))
         self.flash_starts.append(self.update_count)
 
     def _pre_flash_ended(self):
@@ -1732,7 +1759,7 @@ class GNGFlashStimulus(FlashStimulus):
         self._no_lick_timer.stop()
         self._no_lick = False
         self.sigAbort.emit()
-        logging.info("Trial aborted @ {}".format(self.update_count))
+        logging.info("Trial aborted @ %s", self.update_count)
 
     def hit(self):
         """
@@ -1740,14 +1767,14 @@ class GNGFlashStimulus(FlashStimulus):
         """
         self._available = False
         self.sigHit.emit()
-        logging.debug("Hit @ {}".format(self.update_count))
+        logging.debug("Hit @ %s", self.update_count)
 
     def miss(self):
         """
         A miss occurred.
         """
         self.sigMiss.emit()
-        logging.debug("Miss @ {}".format(self.update_count))
+        logging.debug("Miss @ %s", self.update_count)
 
     def stop(self):
         """
@@ -2037,7 +2064,7 @@ class _BaseReward(EObject):
         t = time.clock()
         self.reward_times.append((t, self._update_count))
         self._rewards_since_last_packet.append((t, self._update_count))
-        logging.debug("Reward triggered at {}".format(self.reward_times[-1]))
+        logging.debug("Reward triggered at %s", self.reward_times[-1])
 
     def set_periodic_reward(self, period_ms):
         """
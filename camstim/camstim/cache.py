@@ -0,0 +1,223 @@
+"""
+cache.py
+
+On-disk cache of warp meshes.
+
+Entries are content addressed: the key is a hash of everything a mesh is
+    built from.  Each entry is a folder of .npy files, so arrays are memory
+    mapped when they are loaded.  The cache is kept under a maximum size by
+    evicting the least recently used entries.
+
+Inspect or purge the cache from the command line:
+
+    camstim_cache list
+    camstim_cache purge [--all] [--max-mb MB]
+
+Another cache folder can be given with --path.
+
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+from misc import CAMSTIM_DIR
+
+WARP_CACHE_DIR = os.path.join(CAMSTIM_DIR, "warp_cache")
+MAX_WARP_CACHE_MB = 256
+CACHE_VERSION = 1
+
+
+class ArrayCache(object):
+    """
+    Content-addressed store of named numpy arrays.
+
+    Args:
+        path (str): cache folder.
+        max_mb (float): size limit.  Least recently used entries are evicted
+            when a save takes the cache over this size.
+
+    """
+    def __init__(self, path=WARP_CACHE_DIR, max_mb=MAX_WARP_CACHE_MB):
+        self.path = path
+        self.max_mb = max_mb
+
+    @staticmethod
+    def key(*parts):
+        """
+        Hash of a set of values.  Handles nested lists, tuples and dicts of
+            numbers, strings and numpy arrays.
+        """
+        digest = hashlib.sha1()
+        _update_digest(digest, (CACHE_VERSION,) + parts)
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def load(self, key):
+        """
+        Loads an entry.  Returns a dictionary of memory mapped arrays, or
+            None if the key isn't cached.
+        """
+        entry = self._entry_path(key)
+        if not os.path.isdir(entry):
+            return None
+        try:
+            arrays = {}
+            for filename in os.listdir(entry):
+                name, ext = os.path.splitext(filename)
+                if ext == ".npy":
+                    arrays[name] = np.load(os.path.join(entry, filename),
+                                           mmap_mode='r')
+            os.utime(entry, None)  # mark as recently used
+        except (IOError, OSError, ValueError) as e:
+            logging.warning("Failed to load cache entry %s: %s", key, e)
+            return None
+        return arrays
+
+    def save(self, key, arrays):
+        """
+        Saves a dictionary of arrays under a key, then trims the cache to its
+            maximum size.
+        """
+        entry = self._entry_path(key)
+        if os.path.isdir(entry):
+            return
+        # write to a temporary folder first so that readers never see a
+        #   partial entry
+        temp = os.path.join(self.path, ".%s-%s" % (key, uuid.uuid4().hex))
+        try:
+            os.makedirs(temp)
+            for name, array in arrays.iteritems():
+                np.save(os.path.join(temp, name + ".npy"), np.asarray(array))
+            os.rename(temp, entry)
+        except (IOError, OSError) as e:
+            logging.warning("Failed to save cache entry %s: %s", key, e)
+            shutil.rmtree(temp, ignore_errors=True)
+            return
+        self.trim()
+
+    def entries(self):
+        """
+        Lists cached entries, most recently used first.
+
+        Returns:
+            list: (key, size in bytes, last used timestamp) tuples.
+
+        """
+        if not os.path.isdir(self.path):
+            return []
+        entries = []
+        for key in os.listdir(self.path):
+            entry = self._entry_path(key)
+            if key.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f))
+                       for f in os.listdir(entry))
+            entries.append((key, size, os.path.getmtime(entry)))
+        return sorted(entries, key=lambda e: e[2], reverse=True)
+
+    def remove(self, key):
+        """
+        Removes a single entry.
+        """
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def trim(self, max_mb=None):
+        """
+        Evicts least recently used entries until the cache fits in `max_mb`.
+
+        Returns:
+            list: keys that were evicted.
+
+        """
+        if max_mb is None:
+            max_mb = self.max_mb
+        max_bytes = max_mb * 1024 * 1024
+        total = 0
+        evicted = []
+        for key, size, _ in self.entries():
+            total += size
+            if total > max_bytes:
+                self.remove(key)
+                evicted.append(key)
+        return evicted
+
+    def purge(self):
+        """
+        Removes every entry.
+        """
+        return self.trim(max_mb=0)
+
+
+def _update_digest(digest, obj):
+    if isinstance(obj, np.ndarray):
+        digest.update("array%s%s" % (obj.dtype.str, obj.shape))
+        digest.update(np.ascontiguousarray(obj).tostring())
+    elif isinstance(obj, dict):
+        digest.update("dict%d" % len(obj))
+        for k in sorted(obj.keys()):
+            _update_digest(digest, k)
+            _update_digest(digest, obj[k])
+    elif isinstance(obj, (list, tuple)):
+        digest.update("seq%d" % len(obj))
+        for item in obj:
+            _update_digest(digest, item)
+    else:
+        digest.update("%s:%r" % (type(obj).__name__, obj))
+
+
+_warp_cache = None
+
+
+def get_warp_cache():
+    """
+    The cache windows use to store their warp meshes.
+    """
+    global _warp_cache
+    if _warp_cache is None:
+        _warp_cache = ArrayCache(WARP_CACHE_DIR, MAX_WARP_CACHE_MB)
+    return _warp_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect or purge the warp mesh cache.")
+    parser.add_argument("--path", default=WARP_CACHE_DIR,
+                        help="cache folder")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("list", help="list cached entries")
+    purge = subparsers.add_parser(
+        "purge", help="evict least recently used entries")
+    purge.add_argument("--all", action="store_true",
+                       help="remove every cached entry")
+    purge.add_argument("--max-mb", type=float, default=None,
+                       help="size to trim the cache to.  Defaults to the "
+                            "cache's own limit")
+    args = parser.parse_args()
+
+    cache = ArrayCache(args.path)
+    if args.command == "list":
+        entries = cache.entries()
+        for key, size, last_used in entries:
+            print("{}  {:10.1f} kB  {}".format(
+                key, size / 1024.0,
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used))))
+        print("{} entries, {:.1f} MB in {}".format(
+            len(entries), sum(e[1] for e in entries) / 1024.0**2, cache.path))
+    elif args.command == "purge":
+        if args.all:
+            evicted = cache.purge()
+        else:
+            evicted = cache.trim(args.max_mb)
+        print("Removed {} cached entries.".format(len(evicted)))
+
+
+if __name__ == '__main__':
+    main()
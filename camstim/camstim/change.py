@@ -218,7 +218,7 @@ class DoCTask(Task):
         
     def _setup_trial(self, trial):
         """ Sets up trial parameters """
-        logging.debug("trial params: {}".format(trial))
+        logging.debug("trial params: %s", trial)
         self._current_trial_data.update({"trial_params": trial})
         if trial.get("catch", False):
             self._start_catch_trial()
@@ -376,7 +376,7 @@ class DoCTask(Task):
         if self.rewards:
             self.rewards[index].reward(volume)
         else:
-            logging.warning("Issued reward to virtual reward line {}".format(index))
+            logging.warning("Issued reward to virtual reward line %s", index)
 
     def _end_trial(self):
         """ trial is over. cleanup, log, and start the next one. """
@@ -399,6 +399,7 @@ class DoCTask(Task):
     def _trial_ended(self):
         """ called at the end of a trial (regardless of how it ended.) """
         logging.debug("Trial ended.")
+        self._gc.idle("trial")
         self.trialEnded.emit()
 
     def _log_trial(self):
@@ -423,7 +424,7 @@ class DoCTask(Task):
             ######################################## 
             self._remote_interface.publish(trial_data)
             logging.debug("Published trial to sink.")
-        logging.info("Trial data: {}".format(self._current_trial_data))
+        logging.info("Trial data: %s", self._current_trial_data)
         self._clear_trial_data()
 
     def _clear_trial_data(self):
@@ -597,7 +598,7 @@ class DoCMinNoLickEpoch(DoCEpoch):
 
     def enter(self):
         """ Epoch entry override because duration is dependent on last lick. """
-        logging.debug("Entering epoch: {}".format(self.name))
+        logging.debug("Entering epoch: %s", self.name)
         self._active = True
         self._on_entry()
 
@@ -928,7 +929,7 @@ class DoCStimulus(VisualObject):
         group = self.stim_groups[group_name]
         self._current_group = group_name
         new_val = self.tweak(next_flash_start=False)
-        logging.debug("Stim group set to: {}".format(group_name))
+        logging.debug("Stim group set to: %s", group_name)
         return new_val
 
     def set_stim_param(self, param, value):
@@ -939,7 +940,7 @@ class DoCStimulus(VisualObject):
         except AttributeError:
             logging.warning("Tried to set visual stim property.")
         self._tweak_log.append((value, self.update_count, time.clock()))
-        logging.debug("Stimulus {} set to: {}".format(param, value))
+        logging.debug("Stimulus %s set to: %s", param, value)
 
 
 class DoCGratingStimulus(DoCStimulus):
@@ -1095,7 +1096,7 @@ class DoCImageStimulus(DoCStimulus):
             logging.warning("Tried to set visual stim property.")
         self._current_value = image_name
         self._tweak_log.append((image_name, self.update_count, time.clock()))
-        logging.debug("Stimulus {} set to: {}".format(param, image_name))
+        logging.debug("Stimulus %s set to: %s", param, image_name)
 
     def change(self, group_name="", next_flash_start=True):
         """ Change the stimulus group.
@@ -0,0 +1,270 @@
+"""
+commands.py
+
+Control commands for a running experiment.
+
+Commands arrive as UDP datagrams, either JSON:
+
+    {"cmd": "SET", "target": "stimuli.0.stim.ori", "value": 45}
+    {"cmd": "RUN", "target": "stop", "args": []}
+    [{"cmd": "SET", ...}, {"cmd": "SET", ...}]
+
+or the older text format:
+
+    SET stimuli.0.stim.ori 45
+
+A JSON list is a batch, and is applied all at once between two frames.
+    Values in the text format are parsed with `ast.literal_eval`, so only
+    python literals are accepted.
+
+Targets are attribute paths from the experiment object.  `CommandTable`
+    only accepts targets that were registered ahead of time, unless it is
+    created with strict=False.  Each target is validated and its cast picked
+    when it is registered, so applying a command is an attribute set or method
+    call.
+
+"""
+import ast
+import json
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+COMMANDS = ("SET", "GET", "RUN")
+
+Command = namedtuple("Command", ["name", "target", "value"])
+
+
+def parse_commands(data):
+    """
+    Parses a datagram into a list of commands.
+
+    Raises:
+        ValueError: if the datagram isn't a valid command or batch.
+
+    """
+    data = data.strip()
+    if data[:1] in ("{", "["):
+        decoded = json.loads(data)
+        if isinstance(decoded, dict):
+            decoded = [decoded]
+        if not isinstance(decoded, list):
+            raise ValueError("Command batch must be a list: %r" % data)
+        return [_command_from_json(c) for c in decoded]
+    parts = data.split(None, 2)
+    if len(parts) < 2:
+        raise ValueError("Couldn't parse command: %r" % data)
+    name, target = parts[0].upper(), parts[1]
+    if name == "SET":
+        if len(parts) < 3:
+            raise ValueError("SET needs a value: %r" % data)
+        value = ast.literal_eval(parts[2])
+    elif name == "RUN" and len(parts) == 3:
+        value = list(ast.literal_eval("(%s,)" % parts[2]))
+    else:
+        value = None
+    return [_validate(Command(name, target, value))]
+
+
+def _command_from_json(obj):
+    if not isinstance(obj, dict):
+        raise ValueError("Command must be an object: %r" % obj)
+    try:
+        name, target = str(obj["cmd"]).upper(), str(obj["target"])
+    except KeyError as e:
+        raise ValueError("Command is missing %s: %r" % (e, obj))
+    if name == "RUN":
+        value = obj.get("args", [])
+    else:
+        value = obj.get("value")
+    return _validate(Command(name, target, value))
+
+
+def _validate(command):
+    if command.name not in COMMANDS:
+        raise ValueError("Unknown command: %s" % command.name)
+    return command
+
+
+class CommandTable(object):
+    """
+    Attribute setters and methods that commands can use.
+
+    Args:
+        root (object): object that targets are resolved from.
+        strict (bool): only allow registered targets.  Otherwise an
+            unregistered target is resolved on first use and kept.
+
+    Targets are dotted paths.  Each part is an attribute name, or an index
+        if it is an integer.  Private attributes can't be targeted.  If an
+        object along a path is replaced, for example a stimulus in a list,
+        the target is applied to the new object.
+
+    """
+    def __init__(self, root, strict=True):
+        self.root = root
+        self.strict = strict
+        self._attributes = {}
+        self._methods = {}
+
+    def _walk(self, parts):
+        owner = self.root
+        for part in parts:
+            if part.isdigit():
+                owner = owner[int(part)]
+            else:
+                owner = getattr(owner, part)
+        return owner
+
+    def _resolve(self, target):
+        parts = target.split(".")
+        if any(p.startswith("_") for p in parts):
+            raise AttributeError("Can't access private attribute: %s" % target)
+        owner = self._walk(parts[:-1])
+        if not hasattr(owner, parts[-1]):
+            raise AttributeError("%s has no attribute %s" % (
+                type(owner).__name__, target))
+        return owner, parts[-1]
+
+    def _live_owner(self, target, owner):
+        """
+        The object that now holds a target's attribute.  Usually the one it
+            was resolved to.
+        """
+        live = self._walk(target.split(".")[:-1])
+        if live is not owner:
+            logging.info("Command target %s has a new owner", target)
+        return live
+
+    def register_attribute(self, target, cast=None):
+        """
+        Allows SET and GET on an attribute.
+
+        Args:
+            target (str): attribute path.
+            cast (callable): converts new values.  Defaults to the type of the
+                attribute's current value.
+
+        """
+        owner, name = self._resolve(target)
+        if cast is None:
+            current = getattr(owner, name)
+            if isinstance(current, np.ndarray):
+                cast = np.asarray
+            elif current is not None:
+                cast = type(current)
+        self._attributes[target] = [owner, name, cast]
+
+    def register_method(self, target, method=None):
+        """
+        Allows RUN on a method.
+
+        Args:
+            target (str): name commands use.  Also the method's path if
+                `method` isn't given.
+            method (callable): function to call.
+
+        """
+        owner = None
+        if method is None:
+            owner, name = self._resolve(target)
+            method = getattr(owner, name)
+        if not callable(method):
+            raise TypeError("%s is not callable" % target)
+        self._methods[target] = [owner, method]
+
+    def _attribute(self, target):
+        if target not in self._attributes:
+            if self.strict:
+                raise KeyError("Unregistered attribute: %s" % target)
+            self.register_attribute(target)
+        entry = self._attributes[target]
+        entry[0] = self._live_owner(target, entry[0])
+        return entry
+
+    def set(self, target, value):
+        """
+        Sets an attribute.  Returns the value it was set to, after casting.
+        """
+        owner, name, cast = self._attribute(target)
+        if cast is not None and not (isinstance(cast, type) and
+                                     isinstance(value, cast)):
+            try:
+                value = cast(value)
+            except (TypeError, ValueError):
+                raise TypeError('Old value is %s, new value is %s' % (
+                    cast, type(value)))
+        setattr(owner, name, value)
+        return value
+
+    def get(self, target):
+        """
+        Gets an attribute.
+        """
+        owner, name, _ = self._attribute(target)
+        return getattr(owner, name)
+
+    def run(self, target, args=()):
+        """
+        Calls a method.  Returns its result.
+        """
+        if target not in self._methods:
+            if self.strict:
+                raise KeyError("Unregistered method: %s" % target)
+            self.register_method(target)
+        entry = self._methods[target]
+        owner = entry[0]
+        if owner is not None:
+            live = self._live_owner(target, owner)
+            if live is not owner:
+                entry[:] = [live, getattr(live, target.split(".")[-1])]
+        return entry[1](*(args or ()))
+
+    def execute(self, command):
+        """
+        Applies a command.  Returns the value it read or set, or the method's
+            result.
+        """
+        if command.name == "SET":
+            return self.set(command.target, command.value)
+        elif command.name == "GET":
+            return self.get(command.target)
+        elif command.name == "RUN":
+            return self.run(command.target, command.value)
+        raise ValueError("Unknown command: %s" % command.name)
+
+
+class CommandLog(object):
+    """
+    Record of every command applied, with the vsync it was applied on.
+    """
+    def __init__(self):
+        self.vsync = []
+        self.name = []
+        self.target = []
+        self.value = []
+        self.ok = []
+
+    def __len__(self):
+        return len(self.vsync)
+
+    def append(self, vsync, command, value, ok=True):
+        self.vsync.append(vsync)
+        self.name.append(command.name)
+        self.target.append(command.target)
+        self.value.append(value)
+        self.ok.append(ok)
+
+    def to_dict(self):
+        """
+        Column arrays for output files.  Values stay a list since they can be
+            of any type.
+        """
+        return {
+            'vsync': np.array(self.vsync, dtype=np.int64),
+            'name': np.array(self.name, dtype="S3"),
+            'target': list(self.target),
+            'value': list(self.value),
+            'ok': np.array(self.ok, dtype=bool),
+        }
@@ -0,0 +1,145 @@
+"""
+logqueue.py
+
+Asynchronous logging for the render loop.
+
+While `AsyncLogging` is running, the root logger's handlers are replaced by
+    one that puts records on a bounded queue.  A writer thread formats them and
+    passes them on to the original handlers, so console and disk I/O never
+    happen on the frame thread.  If the queue fills up, records are dropped and
+    counted instead of blocking.
+
+Formatting only moves off the frame thread for lazy arguments:
+
+    logging.info("Trial data: %s", trial_data)
+
+rather than "Trial data: {}".format(trial_data).
+
+    with AsyncLogging():
+        run_frames()
+
+"""
+import copy
+import logging
+import threading
+import Queue
+
+_STOP = object()
+
+
+class QueueHandler(logging.Handler):
+    """
+    Logging handler that puts records on a queue without blocking.
+
+    Records are formatted later, on the writer thread.  Dicts, lists and
+        sets among the arguments are copied when the record is queued, so
+        they are logged as they were when the call was made.  The copy is
+        shallow: changes to objects nested inside them can still show up.
+
+    """
+    def __init__(self, queue):
+        super(QueueHandler, self).__init__()
+        self.queue = queue
+        self.dropped = {}
+
+    def emit(self, record):
+        if record.exc_info:
+            # tracebacks don't outlive the frame that raised them
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        if isinstance(record.args, tuple):
+            record.args = tuple(_snapshot(arg) for arg in record.args)
+        else:
+            record.args = _snapshot(record.args)
+        try:
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            level = record.levelname
+            self.dropped[level] = self.dropped.get(level, 0) + 1
+
+
+def _snapshot(value):
+    if isinstance(value, (dict, list, set)):
+        return copy.copy(value)
+    return value
+
+
+class AsyncLogging(object):
+    """
+    Routes a logger's records through a queue and a writer thread.
+
+    Args:
+        logger (logging.Logger): logger to take over.  Defaults to the root
+            logger.
+        maxsize (int): maximum number of queued records.
+
+    `start` and `stop` can be called more than once.  `stop` writes
+        everything still queued before returning.
+
+    """
+    def __init__(self, logger=None, maxsize=10000):
+        self.logger = logger or logging.getLogger()
+        self.maxsize = maxsize
+        self._handler = None
+        self._handlers = []
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    @property
+    def dropped(self):
+        """
+        Number of records dropped because the queue was full, by level.
+        """
+        if self._handler is None:
+            return {}
+        return dict(self._handler.dropped)
+
+    def start(self):
+        """
+        Starts queueing records.
+        """
+        if self.running or not self.logger.handlers:
+            return
+        self._handlers = self.logger.handlers[:]
+        self._handler = QueueHandler(Queue.Queue(self.maxsize))
+        self.logger.handlers = [self._handler]
+        self._thread = threading.Thread(target=self._write,
+                                        name="AsyncLogging")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Writes any queued records and restores the original handlers.
+        """
+        if not self.running:
+            return
+        self.logger.handlers = self._handlers
+        self._handler.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        dropped = sum(self._handler.dropped.values())
+        if dropped:
+            self.logger.warning("Dropped {} log records: {}".format(
+                dropped, self._handler.dropped))
+
+    def _write(self):
+        queue = self._handler.queue
+        while True:
+            record = queue.get()
+            if record is _STOP:
+                return
+            for handler in self._handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -8,7 +8,6 @@ This is just a set of random helper functions that are used by a lot of other fi
     as well as the default configuration of various components.
 
 """
-import itertools
 import logging
 import os
 import sys
@@ -23,6 +22,7 @@ import numpy
 from psychopy import visual, monitors
 
 import camstim
+from schedule import SweepTable, build_sweep_order, sweep_frame_bounds
 
 CAMSTIM_DIR = os.path.expanduser('~/camstim/')
 
@@ -51,6 +51,10 @@ triggerdiline = 0
 trigger_delay_sec = 0.0
 savesweeptable = True
 eyetracker = False
+frame_profiler = True                 # record how long each phase of a frame takes
+frame_policy = "keep"                 # after dropped frames: "keep" every frame, "skip" to catch up, or "skip_blank" (only skip blank frames)
+gc_mode = "auto"                      # "auto" or "blank" (garbage collect only on frames without sweeps)
+alloc_profiler = False                # frame profiler counts allocations per phase instead of time
 
 [Sync]
 sync_sqr = False
@@ -60,6 +64,7 @@ sync_sqr_size = (100,100)
 sync_sqr_color_sequence = [-1,1]
 frame_pulse = None                    # (device, port, line) high during each call to window.flip()
 acq_on_pulse = None                   # (device, port, line) high while session is running                                     
+pulse_backend = "nidaq"               # "nidaq" or "simulated" (no hardware, records edge times)
 
 [Behavior]
 nidevice = "Dev1"
@@ -68,6 +73,7 @@ task_id = "dummy_task"
 volume_limit = None
 lims_upload = False
 default_monitor_calibration = 'testMonitor' # if no window is passed
+gc_mode = "auto"                     # "auto" or "blank" (garbage collect only in splash screens, between trials and while stimuli are off)
 
 [DetectionOfChange]
 abort_on_cycle_end = True            
@@ -167,6 +173,10 @@ def buildSweepTable(sweep, runs=1, blanksweeps=0):
         The possible values are self explanatory.  The column number is what
             column of the table this parameter goes in.
 
+        The table is a lazy `SweepTable`.  Index it like the old list of
+            tuples, or call `tolist()` to get one.  The sweep order is an int32
+            array with -1 for blank sweeps.
+
     """
     sweepcount = 1
     dimensions = len(sweep)
@@ -203,21 +213,10 @@ def buildSweepTable(sweep, runs=1, blanksweeps=0):
                 dimnames.append(k)  # get ordered name array
 
     dimlist = [sweep[k][0] for k in dimnames]  # get ordered value array
-    sweeptable = list(itertools.product(*dimlist))  # get full ordered table
-    sweeporder = range(sweepcount)
-
-    # Add blank sweeps
-    if blanksweeps is not 0:
-        segments = [sweeporder[i:i + blanksweeps]
-                    for i in range(0, len(sweeporder), blanksweeps)]
-        sweeporder = []
-        for x in segments:
-            for y in x:
-                sweeporder.append(y)  # insert segments
-            if len(x) == blanksweeps:
-                sweeporder.append(-1)  # insert blank sweeps
+    sweeptable = SweepTable(dimlist)  # get full ordered table (lazy)
+    sweeporder = build_sweep_order(sweepcount, runs, blanksweeps)
 
-    return sweeptable, sweeporder * runs, dimnames
+    return sweeptable, sweeporder, dimnames
 
 
 def get_monitor_info(monitor):
@@ -302,13 +301,9 @@ def printHeader():
 
 def getSweepFrames(sweeporder, sweeptime, preexpsec, postexpsec, postsweepsec, fps):
     """ Gets the sweep frame (start,stop) list in frame domain """
-    sweepframelist = []
-    frame = int(preexpsec * fps)
-    for i in range(len(sweeporder)):
-        frames = (frame, frame + int(fps * sweeptime) - 1)
-        sweepframelist.append(frames)
-        frame = frames[1] + int(fps) * postsweepsec + 1
-    return sweepframelist
+    starts, stops = sweep_frame_bounds(len(sweeporder), sweeptime,
+                                       postsweepsec, fps, preexpsec)
+    return zip(starts.tolist(), stops.tolist())
 
 
 class prettyfloat(float):
@@ -510,10 +505,13 @@ class SyncSquare(visual.GratingStim):
         self.colorSequence = colorSequence
         self.seq_length = len(self.colorSequence)
         self.index = 0
+        self._shown = 0
 
     def flip(self, vsync=1):
         if vsync % self.frequency == 0:
-            self.setColor(self.colorSequence[self.index])
+            if self.index != self._shown:  # only set the color when it changes
+                self.setColor(self.colorSequence[self.index])
+                self._shown = self.index
             self.index += 1
             if self.index >= self.seq_length:
                 self.index = 0
@@ -0,0 +1,164 @@
+"""
+poller.py
+
+Collects keyboard events and control commands off the render thread.
+
+A background thread waits on the control sockets and queues any commands that
+    arrive.  Key presses are queued by a handler on the window, as pyglet
+    dispatches them during the flip.  The frame loop just drains the queue
+    between frames, and the time between each event's arrival and its handling
+    is recorded.
+
+"""
+import collections
+import logging
+import select
+import socket
+import threading
+from timeit import default_timer
+
+
+class InputPoller(object):
+    """
+    Queue of input events, filled from a background thread and drained by
+        the frame loop.
+
+    Args:
+        timeout (float): how long the thread waits on its sockets before
+            checking whether it has been stopped.
+        clock (callable): clock used to timestamp events, in seconds.
+
+    Events are (kind, payload) pairs.  Handlers for each kind are registered
+        with `register`, and are called by `drain` on the thread that drains
+        the queue.
+
+    """
+    def __init__(self, timeout=0.05, clock=default_timer):
+        self.timeout = timeout
+        self._clock = clock
+        # deque appends and pops are atomic, so no lock is needed between
+        #   the poller thread and the frame loop
+        self._events = collections.deque()
+        self._sockets = {}
+        self._handlers = {}
+        self._thread = None
+        self._running = False
+        self._poll_keys = False
+        self.latencies = []
+
+    def register(self, kind, handler):
+        """
+        Sets the function that handles events of a kind.  It is called with
+            the event payload.
+        """
+        self._handlers[kind] = handler
+
+    def put(self, kind, payload):
+        """
+        Queues an event.  Safe to call from any thread.
+        """
+        self._events.append((kind, payload, self._clock()))
+
+    def add_socket(self, sock, kind="command", parse=None, bufsize=65507):
+        """
+        Queues datagrams received on a socket as events of `kind`.
+
+        Args:
+            sock (socket.socket): datagram socket.
+            kind (str): event kind.
+            parse (callable): converts a datagram to the event payload, on the
+                poller thread.  Datagrams it raises ValueError for are
+                dropped.  Defaults to splitting on spaces.
+            bufsize (int): maximum datagram size.
+
+        """
+        if parse is None:
+            parse = lambda data: data.split(' ')
+        self._sockets[sock] = (kind, parse, bufsize)
+
+    def watch_keys(self, window):
+        """
+        Queues key presses on a window as "key" events.  The payload is the
+            key name as psychopy reports it.
+
+        pyglet only delivers window events on the thread that created the
+            window, so key presses are queued by a handler that runs when the
+            window's flip dispatches its events.  For other window types the
+            keys are polled with `psychopy.event.getKeys` when draining.
+        """
+        win_handle = getattr(window, "winHandle", None)
+        if getattr(window, "winType", None) != "pyglet" or win_handle is None:
+            self._poll_keys = True
+            return
+        from pyglet.window import key
+
+        # returns None, so psychopy's own handler still sees the key
+        def on_key_press(symbol, modifiers):
+            self.put("key", key.symbol_string(symbol).lower())
+
+        win_handle.push_handlers(on_key_press=on_key_press)
+
+    def start(self):
+        """
+        Starts the poller thread.
+        """
+        if self._thread is not None or not self._sockets:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run,
+                                        name="InputPoller")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the poller thread.
+        """
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(self.timeout * 4)
+            self._thread = None
+
+    def _run(self):
+        sockets = list(self._sockets)
+        while self._running:
+            try:
+                readable, _, _ = select.select(sockets, [], [], self.timeout)
+            except (select.error, socket.error, ValueError) as e:
+                logging.warning("Input poller stopped: {}".format(e))
+                return
+            for sock in readable:
+                kind, parse, bufsize = self._sockets[sock]
+                try:
+                    data, _ = sock.recvfrom(bufsize)
+                except socket.error:
+                    continue
+                if not data:
+                    continue
+                try:
+                    self.put(kind, parse(data))
+                except (ValueError, SyntaxError) as e:
+                    logging.warning("Dropped {} {!r}: {}".format(kind, data, e))
+
+    def drain(self, frame):
+        """
+        Handles every queued event.  Called by the frame loop between frames.
+
+        Args:
+            frame (int): current frame, recorded with each event's latency.
+
+        """
+        if self._poll_keys:
+            from psychopy import event
+            for key in event.getKeys():
+                self.put("key", key)
+        events = self._events
+        while events:
+            kind, payload, arrived = events.popleft()
+            handler = self._handlers.get(kind)
+            if handler is None:
+                logging.warning("No handler for {} event: {}".format(
+                    kind, payload))
+                continue
+            self.latencies.append((kind, frame, self._clock() - arrived))
+            handler(payload)
@@ -0,0 +1,874 @@
+"""
+schedule.py
+
+Vectorized compilers for stimulus frame schedules.
+
+Turns a sweep order plus timing parameters into the per-frame schedule used by
+    `sweepstim.Stimulus`.  Everything here is plain numpy so that building the
+    schedule for a long session costs a handful of array operations instead of
+    one python list append per display frame.
+
+Schedules are stored run-length encoded as a `FrameSchedule`: one
+    (start_frame, length, sweep_index) segment per sweep presentation.  Frames
+    that are not covered by any segment are blank (-1).
+
+Sweep tables are stored as a `SweepTable`, which decodes rows from their
+    mixed-radix index instead of holding every combination of parameters.
+
+"""
+import bisect
+import itertools
+
+import numpy as np
+
+
+class SweepTable(object):
+    """
+    Lazy table of every combination of a set of sweep dimensions.
+
+    Args:
+        dimvalues (iterable): possible values for each dimension, in column
+            order.
+
+    Rows are in the same order as `itertools.product(*dimvalues)`, so the last
+        dimension changes fastest.  Row `i` is decoded from the digits of `i`
+        in the mixed radix given by the dimension sizes, so memory use scales
+        with the sum of the dimension sizes, not their product.
+
+    """
+    def __init__(self, dimvalues):
+        self.values = [list(v) for v in dimvalues]
+        self.sizes = np.array([len(v) for v in self.values], dtype=np.int64)
+        self.strides = np.ones(len(self.values), dtype=np.int64)
+        if len(self.values) > 1:
+            self.strides[:-1] = np.cumprod(self.sizes[:0:-1])[::-1]
+        self._length = 1
+        for size in self.sizes:
+            self._length *= int(size)
+        self._codes = [value_codes(v) for v in self.values]
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return itertools.product(*self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(self._length))]
+        index = int(index)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Sweep %s is outside of the sweep table." % index)
+        return tuple(values[digit] for values, digit in
+                     zip(self.values, self.digits(index)))
+
+    def digits(self, index):
+        """
+        Value index in each dimension for a row, or for an array of rows.
+
+        Returns:
+            ndarray: (dimensions,) for a single row, (rows, dimensions)
+                otherwise.
+
+        """
+        index = np.asarray(index, dtype=np.int64)
+        return (index[..., np.newaxis] // self.strides) % self.sizes
+
+    def changes(self, rows):
+        """
+        Which columns differ from the previous row, for a sequence of rows.
+            Columns of the first row are always marked as changed.
+
+        Returns:
+            ndarray: (rows, dimensions) boolean mask.
+
+        """
+        codes = self.digits(np.asarray(rows, dtype=np.int64).ravel())
+        for dimension, dimension_codes in enumerate(self._codes):
+            codes[:, dimension] = dimension_codes[codes[:, dimension]]
+        changed = np.ones(codes.shape, dtype=bool)
+        changed[1:] = codes[1:] != codes[:-1]
+        return changed
+
+    def column(self, dimension, rows=None):
+        """
+        Values of one dimension as an array.
+
+        Args:
+            dimension (int): column number.
+            rows (iterable): rows to get.  Defaults to the whole table.
+
+        """
+        if rows is None:
+            rows = np.arange(self._length)
+        index = (np.asarray(rows, dtype=np.int64) // self.strides[dimension]
+                 ) % self.sizes[dimension]
+        return np.asarray(self.values[dimension])[index]
+
+    def tolist(self):
+        """
+        Expands the table to a list of tuples, the format sweep tables have
+            always been saved in.
+        """
+        return list(self)
+
+
+class FrameSchedule(object):
+    """
+    Run-length encoded frame schedule.
+
+    Args:
+        starts (iterable): first frame of each segment.  Must be increasing.
+        lengths (iterable): number of frames in each segment.
+        sweeps (iterable): sweep index displayed during each segment.
+        total_frames (int): length of the schedule in frames.
+
+    Segments must not overlap.  `schedule[frame]` works like indexing the old
+        dense frame list, `advance(frame)` is the cursor lookup used during
+        playback.
+
+    """
+    def __init__(self, starts, lengths, sweeps, total_frames):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.sweeps = np.asarray(sweeps, dtype=np.int32)
+        self.ends = self.starts + self.lengths
+        self.total_frames = int(total_frames)
+
+        self._cursor = 0
+        self._last_frame = 0
+
+    @staticmethod
+    def from_array(frame_list):
+        """
+        Builds a schedule from a dense frame list.  Consecutive frames with
+            the same sweep index become one segment.
+        """
+        frame_list = np.asarray(frame_list, dtype=np.int32)
+        if len(frame_list) == 0:
+            return FrameSchedule([], [], [], 0)
+        edges = np.flatnonzero(np.diff(frame_list)) + 1
+        starts = np.concatenate(([0], edges))
+        lengths = np.diff(np.append(starts, len(frame_list)))
+        sweeps = frame_list[starts]
+        shown = sweeps != -1
+        return FrameSchedule(starts[shown], lengths[shown], sweeps[shown],
+                             len(frame_list))
+
+    @staticmethod
+    def from_dict(data):
+        """
+        Rebuilds a schedule from the output of `to_dict`.
+        """
+        return FrameSchedule(data['starts'], data['lengths'], data['sweeps'],
+                             data['total_frames'])
+
+    def to_dict(self):
+        """
+        Plain dictionary of arrays.  This is what ends up in output files so
+            that they can be read without camstim.
+        """
+        return {
+            'starts': self.starts,
+            'lengths': self.lengths,
+            'sweeps': self.sweeps,
+            'total_frames': self.total_frames,
+        }
+
+    def to_array(self):
+        """
+        Expands the schedule to a dense int32 frame list.  Array is -1 for
+            blank periods, and sweep # otherwise.
+        """
+        frame_list = np.full(self.total_frames, -1, dtype=np.int32)
+        frame_list[segment_positions(self.starts, self.lengths)] = np.repeat(
+            self.sweeps, self.lengths)
+        return frame_list
+
+    def __len__(self):
+        return self.total_frames
+
+    def __getitem__(self, frame):
+        if frame < 0:
+            frame += self.total_frames
+        if not 0 <= frame < self.total_frames:
+            raise IndexError("Frame %s is outside of the schedule." % frame)
+        segment = self.find(frame)
+        if segment == -1:
+            return -1
+        return self.sweeps[segment]
+
+    def find(self, frame):
+        """
+        Segment index shown on a frame, or -1 if the frame is blank.  Binary
+            search, O(log n).
+        """
+        segment = int(np.searchsorted(self.ends, frame, side='right'))
+        if segment < len(self.starts) and self.starts[segment] <= frame:
+            return segment
+        return -1
+
+    def advance(self, frame):
+        """
+        Segment index shown on a frame, or -1 if the frame is blank.  Keeps a
+            cursor so that lookups for increasing frames are O(1) amortized.
+        """
+        if frame < self._last_frame:
+            self._cursor = int(np.searchsorted(self.ends, frame, side='right'))
+        self._last_frame = frame
+        segment = self._cursor
+        ends = self.ends
+        count = len(ends)
+        while segment < count and ends[segment] <= frame:
+            segment += 1
+        self._cursor = segment
+        if segment < count and self.starts[segment] <= frame:
+            return segment
+        return -1
+
+    def first_frame(self):
+        """
+        First frame that displays a sweep, None if nothing is ever shown.
+        """
+        if len(self.starts) == 0:
+            return None
+        return int(self.starts[0])
+
+    def last_frame(self):
+        """
+        Last frame that displays a sweep, None if nothing is ever shown.
+        """
+        if len(self.starts) == 0:
+            return None
+        return int(self.ends[-1]) - 1
+
+    def content_mask(self, frames=None):
+        """
+        Bool array, True for each frame that displays a sweep.
+
+        Args:
+            frames (int): length of the mask.  Defaults to the schedule's
+                total frames.
+
+        """
+        if frames is None:
+            frames = self.total_frames
+        counts = np.zeros(frames + 1, dtype=np.int64)
+        np.add.at(counts, np.minimum(self.starts, frames), 1)
+        np.add.at(counts, np.minimum(self.ends, frames), -1)
+        return np.cumsum(counts[:-1]) > 0
+
+
+class ActiveIndex(object):
+    """
+    Finds which of a set of (first_frame, last_frame) intervals contain a
+        frame, for frames that are visited in increasing order.
+
+    Args:
+        intervals (iterable): (first_frame, last_frame) for each item, both
+            inclusive.  None for items that are never active.
+
+    `active(frame)` returns the indices of the active items in their original
+        order.  Items are added when their first frame comes up and dropped
+        after their last frame, so the cost per frame depends on how many
+        items are active, not on how many there are.
+
+    """
+    def __init__(self, intervals):
+        self.intervals = list(intervals)
+        shown = [i for i, interval in enumerate(self.intervals)
+                 if interval is not None]
+        self._order = sorted(shown, key=lambda i: self.intervals[i][0])
+        self.reset()
+
+    def reset(self):
+        """
+        Starts over from frame 0.
+        """
+        self._next = 0
+        self._active = []
+        self._expiry = float('inf')
+        self._frame = -1
+
+    def active(self, frame):
+        """
+        Indices of the items active on a frame.  Starts over if the frame is
+            before the previous one.
+        """
+        if frame < self._frame:
+            self.reset()
+        self._frame = frame
+        intervals = self.intervals
+        order = self._order
+        while self._next < len(order) and \
+                intervals[order[self._next]][0] <= frame:
+            item = order[self._next]
+            bisect.insort(self._active, item)
+            self._expiry = min(self._expiry, intervals[item][1])
+            self._next += 1
+        if frame > self._expiry:
+            self._active = [i for i in self._active
+                            if intervals[i][1] >= frame]
+            self._expiry = min([intervals[i][1] for i in self._active] or
+                               [float('inf')])
+        return self._active
+
+
+def new_seed():
+    """
+    A fresh random seed for a sweep order.
+    """
+    return int(np.random.RandomState().randint(2**31 - 1))
+
+
+def insert_blank_sweeps(sweep_order, blank_sweeps):
+    """
+    Inserts a blank sweep (-1) after every `blank_sweeps` sweeps.  No blank
+        is added after a trailing partial group.
+    """
+    sweep_order = np.asarray(sweep_order, dtype=np.int32)
+    if not blank_sweeps:
+        return sweep_order
+    positions = np.arange(blank_sweeps, len(sweep_order) + 1, blank_sweeps)
+    return np.insert(sweep_order, positions, -1)
+
+
+def build_sweep_order(sweep_count, runs=1, blank_sweeps=0):
+    """
+    Ordered sweep indices with blank sweeps inserted, repeated for each run.
+    """
+    run = insert_blank_sweeps(np.arange(sweep_count, dtype=np.int32),
+                              blank_sweeps)
+    return np.tile(run, runs)
+
+
+def shuffle_sweep_order(sweep_order, rng, runs=1, block=False,
+                        no_repeats=False):
+    """
+    Shuffles a sweep order.
+
+    Args:
+        sweep_order (ndarray): order to shuffle.  Not modified.
+        rng (numpy.random.RandomState): random number generator.
+        runs (int): number of runs in the order.  Used for block shuffles.
+        block (bool): shuffle within each run instead of across the whole
+            order.
+        no_repeats (bool): make sure no sweep is shown twice in a row.  Blank
+            sweeps may still repeat.
+
+    Returns:
+        ndarray: the shuffled order.
+
+    """
+    sweep_order = np.array(sweep_order, dtype=np.int32)
+    if block and runs > 1:
+        if len(sweep_order) % runs:
+            raise ValueError("Sweep order doesn't divide into %s runs." % runs)
+        blocks = sweep_order.reshape(runs, -1)
+        for run in blocks:
+            rng.shuffle(run)
+        block_length = blocks.shape[1]
+    else:
+        rng.shuffle(sweep_order)
+        block_length = len(sweep_order)
+    if no_repeats:
+        _break_repeats(sweep_order, rng, block_length)
+    return sweep_order
+
+
+def _break_repeats(sweep_order, rng, block_length, attempts=100):
+    """
+    Swaps repeated sweeps with random positions in the same block until no
+        sweep follows itself.  Works in place.
+    """
+    count = len(sweep_order)
+
+    def fits(position, sweep, ignore):
+        # would `sweep` at `position` differ from its neighbours?
+        if sweep == -1:
+            return True
+        for neighbour in (position - 1, position + 1):
+            if 0 <= neighbour < count and neighbour != ignore and \
+                    sweep_order[neighbour] == sweep:
+                return False
+        return True
+
+    for _ in xrange(attempts):
+        repeats = np.flatnonzero((sweep_order[1:] == sweep_order[:-1]) &
+                                 (sweep_order[1:] != -1)) + 1
+        if len(repeats) == 0:
+            return
+        for position in repeats:
+            sweep = sweep_order[position]
+            if sweep != sweep_order[position - 1]:
+                continue  # fixed by an earlier swap
+            block_start = position - position % block_length
+            block_stop = min(block_start + block_length, count)
+            for other in rng.randint(block_start, block_stop, 16):
+                swapped = sweep_order[other]
+                if swapped == sweep:
+                    continue
+                if fits(position, swapped, other) and \
+                        fits(other, sweep, position):
+                    sweep_order[position] = swapped
+                    sweep_order[other] = sweep
+                    break
+    raise ValueError("Couldn't build a sweep order without repeats.")
+
+
+def value_codes(values):
+    """
+    Code for each value in a list, equal values share a code.  Values that
+        can't be hashed (arrays, for example) each get their own code.
+    """
+    codes = np.arange(len(values), dtype=np.int64)
+    first = {}
+    try:
+        for index, value in enumerate(values):
+            codes[index] = first.setdefault(value, index)
+    except TypeError:
+        codes = np.arange(len(values), dtype=np.int64)
+    return codes
+
+
+def segment_positions(starts, lengths):
+    """
+    Frame numbers covered by each segment, concatenated.
+    """
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def sweep_frame_bounds(sweep_count, sweep_length, blank_length, fps,
+                       start_sec=0.0):
+    """
+    Computes the (start, stop) frame of every sweep.  Vectorized version of
+        `misc.getSweepFrames`.
+
+    Args:
+        sweep_count (int): number of sweeps in the sweep order.
+        sweep_length (float): seconds per sweep.
+        blank_length (float): seconds of blank after each sweep.
+        fps (float): display frame rate.
+        start_sec (float): delay before the first sweep.
+
+    Returns:
+        tuple: (starts, stops) arrays.  Stops are inclusive.
+
+    """
+    first = int(start_sec * fps)
+    sweep_frames = int(fps * sweep_length)
+    # getSweepFrames spaces sweeps by int(fps)*blank, not int(fps*blank)
+    step = sweep_frames + int(fps) * blank_length
+    starts = first + np.arange(sweep_count) * step
+    stops = starts + sweep_frames - 1
+    return starts, stops
+
+
+def sweep_frame_counts(starts, stops):
+    """
+    Number of frames each sweep is displayed for, given its bounds.
+    """
+    return np.maximum((stops - starts + 1).astype(np.int64), 0)
+
+
+def tf_phases(schedule, tf, fps):
+    """
+    Phase of a stimulus drifting at a temporal frequency on each frame.
+
+    Args:
+        schedule (FrameSchedule): frame schedule of the stimulus.
+        tf (array-like): temporal frequency in cycles per second for each
+            segment of the schedule.
+        fps (float): display refresh rate.
+
+    Returns:
+        numpy.ndarray: phase in cycles for each frame, `tf * frame / fps` as
+            it has always been computed at draw time.  NaN on blank frames.
+
+    """
+    phases = np.full(schedule.total_frames, np.nan)
+    frames = np.flatnonzero(schedule.content_mask())
+    tf = np.repeat(np.asarray(tf, dtype=np.float64), schedule.lengths)
+    phases[frames] = tf[:len(frames)] * frames / fps
+    return phases
+
+
+def drift_phases(drift_rates, drift_coefficients, fps, period=360.0):
+    """
+    Phase sequences for gratings whose drift rate changes every frame.
+
+    Args:
+        drift_rates (array-like): drift rate on each frame, from -1 to 1.
+        drift_coefficients (array-like): maximum speeds in degrees per second.
+            Each one gives a sequence.
+        fps (float): display refresh rate.
+        period (float): phases wrap at this value.
+
+    Returns:
+        numpy.ndarray: phase on each frame, starting at 0 for every
+            coefficient, the sequences one after another.
+
+    """
+    rates = np.asarray(drift_rates, dtype=np.float64)
+    coefficients = np.asarray(drift_coefficients, dtype=np.float64)
+    steps = coefficients[:, np.newaxis] * rates / fps
+    return np.mod(np.cumsum(steps, axis=1), period).ravel()
+
+
+def sync_square_schedule(vsyncs, frequency, sequence_length, start_index=0):
+    """
+    Color a sync square shows after each update.
+
+    The square moves on to the next color in its sequence whenever it is
+        updated with a vsync that is a multiple of `frequency`.
+
+    Args:
+        vsyncs (int or array-like): vsyncs the square is updated with, in
+            order.  An int `n` means vsyncs 0 to `n - 1`.
+        frequency (int): half period in frames.
+        sequence_length (int): number of colors in the sequence.
+        start_index (int): index of the next color in the sequence when the
+            first update happens.
+
+    Returns:
+        numpy.ndarray: color sequence index shown after each update.
+
+    """
+    if np.isscalar(vsyncs):
+        vsyncs = np.arange(vsyncs, dtype=np.int64)
+    else:
+        vsyncs = np.asarray(vsyncs, dtype=np.int64)
+    advances = np.cumsum(vsyncs % frequency == 0)
+    return (start_index - 1 + advances) % sequence_length
+
+
+def sync_square_edges(indices, colors, initial=0):
+    """
+    Frames where a sync square changes color.
+
+    Args:
+        indices (array-like): color sequence index shown on each frame.
+        colors (array-like): color sequence.
+        initial (int): index of the color shown before the first frame.
+
+    Returns:
+        tuple: frames the color changed on, and the color shown from each.
+
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    colors = np.asarray(colors)
+    shown = colors[np.concatenate(([initial], indices))]
+    changed = shown[1:] != shown[:-1]
+    if changed.ndim > 1:
+        changed = changed.reshape(len(changed), -1).any(axis=1)
+    frames = np.flatnonzero(changed)
+    return frames, colors[indices[frames]]
+
+
+def schedule_frames(sweep_count, sweep_frames, blank_frames, start_frames=0,
+                    stop_frame=None):
+    """
+    Length in frames of the schedule `compile_frame_schedule` would build
+        for `sweep_count` sweeps of `sweep_frames` frames each.
+    """
+    total_frames = max(start_frames, 0) + sweep_count * (
+        max(sweep_frames, 0) + max(blank_frames, 0))
+    if stop_frame is not None:
+        total_frames = max(min(total_frames, stop_frame), 0)
+    return total_frames
+
+
+def interleave_intervals(durations, counts, shuffle=False, flatten=False,
+                         rng=None):
+    """
+    Display intervals for stimuli that take turns in epochs.  In each epoch
+        every stimulus that still has segments left is shown for its
+        duration.
+
+    Args:
+        durations (iterable): segment duration of each stimulus in seconds.
+        counts (iterable): number of segments each stimulus needs.
+        shuffle (bool): randomize the stimulus order within each epoch.
+        flatten (bool): drop the slots of stimuli that have finished instead
+            of leaving them as grey gaps.
+        rng (numpy.random.RandomState): random number generator for shuffle.
+
+    Returns:
+        list: an Nx2 array of (start, stop) seconds for each stimulus.
+
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    stimulus_count = len(durations)
+    epochs = int(counts.max()) if stimulus_count else 0
+
+    # epochs x stimuli matrix of slot durations
+    slots = np.tile(durations, (epochs, 1))
+    shown = np.arange(epochs)[:, np.newaxis] < counts
+    if flatten:
+        slots[~shown] = 0.0
+
+    if shuffle:
+        if rng is None:
+            rng = np.random.RandomState()
+        order = np.argsort(rng.random_sample((epochs, stimulus_count)),
+                           axis=1)
+    else:
+        order = np.tile(np.arange(stimulus_count), (epochs, 1))
+    rows = np.arange(epochs)[:, np.newaxis]
+
+    # cumulative sums are sequential, so the times come out exactly as the
+    #   original loop added them up
+    ordered = slots[rows, order]
+    ends = np.cumsum(ordered, axis=1)
+    within = np.zeros_like(ordered)
+    within[:, 1:] = ends[:, :-1]
+    epoch_starts = np.zeros(epochs)
+    if epochs:
+        epoch_starts[1:] = np.cumsum(ends[:, -1])[:-1]
+
+    starts = np.empty_like(slots)
+    starts[rows, order] = within + epoch_starts[:, np.newaxis]
+    stops = starts + durations
+
+    return [np.column_stack((starts[shown[:, i], i], stops[shown[:, i], i]))
+            for i in range(stimulus_count)]
+
+
+def compile_frame_schedule(sweep_order, sweep_counts, blank_frames,
+                           start_frames=0, stop_frame=None):
+    """
+    Builds the frame schedule for a stimulus.  Each presentation is followed
+        by `blank_frames` blank frames.
+
+    Args:
+        sweep_order (iterable): sweep index for each presentation.
+        sweep_counts (ndarray): frames each presentation lasts.
+        blank_frames (int): blank frames after each presentation.
+        start_frames (int): blank frames before the first presentation.
+        stop_frame (int): truncate the schedule here.  None for no limit.
+
+    Returns:
+        FrameSchedule: the compiled schedule.
+
+    """
+    sweep_order = np.asarray(sweep_order, dtype=np.int32).ravel()
+    lengths = np.asarray(sweep_counts, dtype=np.int64)
+    blank_frames = max(blank_frames, 0)
+    start_frames = max(start_frames, 0)
+
+    strides = lengths + blank_frames
+    starts = start_frames + np.cumsum(strides) - strides
+    total_frames = start_frames + int(strides.sum())
+
+    if stop_frame is not None:
+        total_frames = max(min(total_frames, stop_frame), 0)
+        lengths = np.minimum(starts + lengths, total_frames) - starts
+
+    shown = (lengths > 0) & (sweep_order != -1)
+    return FrameSchedule(starts[shown], lengths[shown], sweep_order[shown],
+                         total_frames)
+
+
+def compile_display_schedule(sweep_order, sweep_counts, blank_frames,
+                             display_intervals, fps):
+    """
+    Builds the frame schedule for a stimulus shown in custom display
+        intervals.  The sweep sequence is consumed in order across the
+        intervals and grey (-1) frames fill the gaps between them.
+
+    Args:
+        sweep_order (iterable): sweep index for each presentation.
+        sweep_counts (ndarray): frames each presentation lasts.
+        blank_frames (int): blank frames after each presentation.
+        display_intervals (ndarray): Nx2 array of (start, stop) seconds.
+        fps (float): display frame rate.
+
+    Returns:
+        FrameSchedule: the compiled schedule.
+
+    """
+    base = compile_frame_schedule(sweep_order, sweep_counts, blank_frames)
+    take_from, take_to, out_from, total_frames = display_blocks(
+        base.total_frames, display_intervals, fps)
+
+    # split base segments at the interval boundaries
+    first = np.searchsorted(base.ends, take_from, side='right')
+    last = np.searchsorted(base.starts, take_to, side='left')
+    pieces = np.maximum(last - first, 0)
+    interval = np.repeat(np.arange(len(pieces)), pieces)
+    segment = np.repeat(first, pieces) + (
+        np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces,
+                                            pieces))
+
+    piece_from = np.maximum(base.starts[segment], take_from[interval])
+    piece_to = np.minimum(base.ends[segment], take_to[interval])
+    new_starts = piece_from - take_from[interval] + out_from[interval]
+    lengths = piece_to - piece_from
+
+    kept = lengths > 0
+    return FrameSchedule(new_starts[kept], lengths[kept],
+                         base.sweeps[segment][kept], total_frames)
+
+
+def display_blocks(base_frames, display_intervals, fps):
+    """
+    Maps display intervals onto a sweep sequence that is `base_frames` long.
+
+    Returns:
+        tuple: (take_from, take_to, out_from, total_frames).  Interval i
+            plays frames [take_from[i], take_to[i]) of the sequence starting
+            at frame out_from[i].
+
+    """
+    display_intervals = np.asarray(display_intervals, dtype=np.float64)
+    starts = display_intervals[:, 0]
+    stops = display_intervals[:, 1]
+
+    # each interval takes the next `shown` frames of the base sequence, or
+    #   whatever is left of it
+    shown = ((stops - starts) * fps).astype(np.int64)
+    offsets = np.cumsum(shown) - shown
+    take_from = np.minimum(offsets, base_frames)
+    take_to = np.minimum(offsets + shown, base_frames)
+    taken = take_to - take_from
+    grey = np.maximum(((starts[1:] - stops[:-1]) * fps).astype(np.int64), 0)
+
+    pad = max(int(fps * starts[0]), 0)
+    gaps = np.concatenate(([pad], grey))
+    out_from = np.cumsum(gaps) + np.cumsum(taken) - taken
+    total_frames = pad + int(taken.sum()) + int(grey.sum())
+    return take_from, take_to, out_from, total_frames
+
+
+class SchedulePlan(object):
+    """
+    Timing of a frame schedule, worked out without compiling it.
+
+    Args:
+        total_frames (int): length of the schedule in frames.
+        blocks (ndarray): Nx2 array of [start, stop) frames during which the
+            sweep sequence plays.  Empty blocks are left out.
+
+    """
+    def __init__(self, total_frames, blocks):
+        self.total_frames = int(total_frames)
+        self.blocks = np.asarray(blocks, dtype=np.int64).reshape(-1, 2)
+
+    @property
+    def start_frame(self):
+        """
+        First frame of the first block, None if nothing plays.
+        """
+        if len(self.blocks) == 0:
+            return None
+        return int(self.blocks[0, 0])
+
+    @property
+    def stop_frame(self):
+        """
+        Frame after the end of the last block, None if nothing plays.
+        """
+        if len(self.blocks) == 0:
+            return None
+        return int(self.blocks[:, 1].max())
+
+    def total_time(self, fps):
+        """
+        Length of the schedule in seconds.
+        """
+        return float(self.total_frames) / fps
+
+    @staticmethod
+    def combine(plans):
+        """
+        Plan for several schedules that play at the same time.
+        """
+        plans = list(plans)
+        if not plans:
+            return SchedulePlan(0, [])
+        blocks = np.concatenate([p.blocks for p in plans])
+        blocks = blocks[np.argsort(blocks[:, 0], kind='mergesort')]
+        return SchedulePlan(max([p.total_frames for p in plans]), blocks)
+
+
+def sweep_order_length(sweep_count, runs=1, blank_sweeps=0):
+    """
+    Length of the sweep order `build_sweep_order` builds, without building
+        it.
+    """
+    blanks = sweep_count // blank_sweeps if blank_sweeps else 0
+    return (sweep_count + blanks) * runs
+
+
+def plan_schedule(order_length, sweep_frames, blank_frames, start_frames=0,
+                  stop_frame=None, display_intervals=None, fps=None):
+    """
+    Plans the frame schedule `compile_frame_schedule` or
+        `compile_display_schedule` would build, in O(display intervals).
+
+    Args:
+        order_length (int): number of presentations in the sweep order.
+        sweep_frames (int): frames per presentation.
+        blank_frames (int): blank frames after each presentation.
+        start_frames (int): blank frames before the first presentation.
+            Ignored with display intervals.
+        stop_frame (int): truncate the schedule here.  Ignored with display
+            intervals.
+        display_intervals (ndarray): Nx2 array of (start, stop) seconds.
+        fps (float): display frame rate.  Required with display intervals.
+
+    Returns:
+        SchedulePlan: the planned schedule.
+
+    """
+    if display_intervals is None:
+        total_frames = schedule_frames(order_length, sweep_frames,
+                                       blank_frames, start_frames, stop_frame)
+        start_frames = max(start_frames, 0)
+        blocks = [(start_frames, total_frames)]
+        if total_frames <= start_frames:
+            blocks = []
+        return SchedulePlan(total_frames, blocks)
+
+    base_frames = schedule_frames(order_length, sweep_frames, blank_frames)
+    take_from, take_to, out_from, total_frames = display_blocks(
+        base_frames, display_intervals, fps)
+    taken = take_to - take_from
+    blocks = np.column_stack((out_from, out_from + taken))[taken > 0]
+    return SchedulePlan(total_frames, blocks)
+
+
+def plan_stimulus(sweep_count, sweep_length, blank_length, fps, runs=1,
+                  blank_sweeps=0, start_time=0.0, stop_time=None,
+                  display_sequence=None):
+    """
+    Plans a stimulus schedule from the same parameters `Stimulus` takes.
+        Cheap enough to compare hundreds of candidate session layouts.
+
+    Args:
+        sweep_count (int): number of rows in the sweep table.
+        sweep_length (float): seconds per sweep.
+        blank_length (float): seconds of blank after each sweep.
+        fps (float): display frame rate.
+        runs (int): number of sweep table repeats.
+        blank_sweeps (int): blank sweep every N sweeps.
+        start_time (float): seconds before the first sweep.
+        stop_time (float): seconds to stop at, None for no limit.
+        display_sequence (iterable): [(start, stop),...] seconds.  Overrides
+            start and stop time.
+
+    Returns:
+        SchedulePlan: the planned schedule.
+
+    """
+    stop_frame = int(fps*stop_time) if stop_time else None
+    if display_sequence is not None:
+        display_sequence = np.asarray(display_sequence, dtype=np.float64)
+    return plan_schedule(sweep_order_length(sweep_count, runs, blank_sweeps),
+                         int(fps*sweep_length), int(fps*blank_length),
+                         int(fps*start_time), stop_frame, display_sequence,
+                         fps)
@@ -28,6 +28,8 @@ import io
 import logging
 import json
 
+from timing import frame_interval_stats
+
 #Overwrite a psychopy gamma function without own to avoid 64-bit pyglet window handle issue
 #https://code.google.com/p/pyglet/issues/detail?id=664
 gamma.setGammaRamp = setGammaRamp
@@ -132,18 +134,21 @@ class Stim(object):
         """ Prints data about frame times """
         intervalsMS = numpy.array(self.window.frameIntervals)*1000
         self.intervalsms = intervalsMS
-        m = numpy.mean(intervalsMS)
-        sd = numpy.std(intervalsMS)
+        stats = frame_interval_stats(intervalsMS)
+        m, sd = stats['mean'], stats['std']
         distString = "Mean=%.1fms,   s.d.=%.1f,   99%%CI=%.1f-%.1f" % (m,
             sd, m-3*sd, m+3*sd)
-        nTotal = len(intervalsMS)
-        nDropped = sum(intervalsMS > (1.5*m))
-        self.droppedframes = ([x for x in intervalsMS if x > (1.5*m)],
-            [x for x in range(len(intervalsMS)) if intervalsMS[x] > (1.5*m)])
+        percentileString = "p50=%.1fms,   p90=%.1fms,   p99=%.1fms,   " \
+            "max=%.1fms" % tuple(stats['percentiles'])
+        nTotal = stats['total']
+        dropped = stats['dropped']
+        nDropped = len(dropped)
+        self.droppedframes = (intervalsMS[dropped].tolist(), dropped.tolist())
         droppedString = "Dropped/Frames = %i/%i = %.3f%%" %(nDropped,
             nTotal, nDropped/float(nTotal+0.0000001)*100)  # avoid /0
         logging.info("Actual vsyncs displayed: {}".format(self.vsynccount))
         logging.info("Frame interval statistics: {}".format(distString))
+        logging.info("Frame interval percentiles: {}".format(percentileString))
         logging.info("Drop statistics: {}".format(droppedString))
 
     def _setup_brightness(self):
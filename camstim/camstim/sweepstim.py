@@ -11,7 +11,6 @@ Takes N stimuli, builds N sweep tables and runs all simultaneously.
 This should eventually replace SweepStim in the old stimulus module.
 
 """
-import random
 import datetime
 import time
 import sys
@@ -21,16 +20,53 @@ import logging
 import math
 import shutil
 from collections import OrderedDict
+from timeit import default_timer
 
-from psychopy import visual, event
+from psychopy import visual
 import numpy as np
 
 from stim import Stim
 from experiment import EObject, OutputFile
 from synchro import SyncPulse, SyncSquare
 ##TODO: find better place for stuff in Core.py
-from misc import buildSweepTable, getSweepFrames, getConfig, wecanpicklethat, \
+from misc import buildSweepTable, getConfig, wecanpicklethat, \
     getMonitorInfo, getPlatformInfo, check_dirs, ImageStimNumpyuByte, CAMSTIM_DIR
+from schedule import FrameSchedule, SweepTable, sweep_frame_bounds, \
+    sweep_frame_counts, compile_frame_schedule, compile_display_schedule, \
+    build_sweep_order, shuffle_sweep_order, new_seed, ActiveIndex, \
+    schedule_frames, interleave_intervals, plan_schedule, SchedulePlan, \
+    tf_phases
+from timing import FrameProfiler, FrameScheduler, GCControl, \
+    allocation_counter
+from poller import InputPoller
+from commands import CommandTable, CommandLog, parse_commands
+from logqueue import AsyncLogging
+
+
+class _Built(object):
+    """
+    Attribute of a `Stimulus` that is built by calling the method `builder`
+        when it is read and isn't set.  It is stored in the instance's
+        __dict__, so marking it out of date is removing it from there.
+    """
+    def __init__(self, name, builder):
+        self.name = name
+        self.builder = builder
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            getattr(obj, self.builder)()
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = value
 
 
 class Stimulus(EObject):
@@ -52,15 +88,44 @@ class Stimulus(EObject):
         blank_length (float): blank time in seconds between sweeps.
         blank_sweeps (int): blank presentation every N sweeps.
         runs (int): number of sweep table repeats.
-        shuffle (bool): shuffle sweep display order.
+        shuffle (bool): shuffle sweep display order.  "block" shuffles within
+            each run instead of across all runs.
         fps (float): Display FPS.  Should match monitor FPS
         save_sweep_table (bool): whether to save the sweep table values in the
             output file.  Set to false when loading in large tables for movies,
             natural scenes, etc.
+        seed (int): seed for the shuffled sweep order.  A random seed is
+            picked if None.  Saved in the output file either way.
+        no_repeats (bool): never show the same sweep twice in a row when
+            shuffling.
+
+    The sweep table and frame schedule are built the first time they are
+        needed.  Setters only mark them out of date, so changing several
+        parameters in a row compiles once.  Call `compile` to build them
+        ahead of time.
 
     #TODO: make sweep_params optional.
 
     """
+    # attributes that are built on first access
+    _sweep_table_attributes = ("sweep_table", "sweep_order", "dimnames",
+                               "_setters", "_sweep_changes",
+                               "_changes_schedule", "_last_segment")
+    _frame_list_attributes = ("frame_schedule", "total_frames",
+                              "sweep_frames", "phase_trajectory")
+
+    sweep_table = _Built("sweep_table", "_update_sweep_table")
+    sweep_order = _Built("sweep_order", "_update_sweep_table")
+    dimnames = _Built("dimnames", "_update_sweep_table")
+    _setters = _Built("_setters", "_update_sweep_table")
+    _sweep_changes = _Built("_sweep_changes", "_update_sweep_table")
+    _changes_schedule = _Built("_changes_schedule", "_update_sweep_table")
+    _last_segment = _Built("_last_segment", "_update_sweep_table")
+    frame_schedule = _Built("frame_schedule", "_build_frame_list")
+    total_frames = _Built("total_frames", "_build_frame_list")
+    sweep_frames = _Built("sweep_frames", "_build_frame_list")
+    phase_trajectory = _Built("phase_trajectory", "_build_frame_list")
+
     def __init__(self,
                  psychopy_stimulus,
                  sweep_params,
@@ -73,6 +138,8 @@ class Stimulus(EObject):
                  shuffle=False,
                  fps=60.0,
                  save_sweep_table=True,
+                 seed=None,
+                 no_repeats=False,
                  ):
 
         self.stim = psychopy_stimulus
@@ -86,19 +153,54 @@ class Stimulus(EObject):
         self.shuffle = shuffle
         self.fps = fps
         self.save_sweep_table = save_sweep_table
+        self.seed = new_seed() if seed is None else seed
+        self.no_repeats = no_repeats
 
         self.stim_text = ""
         self.stim_path = ""
 
-        self._build_sweep_table()
-
         self._current_sweep = None
         self.display_sequence = None
-
-        self._build_frame_list()
+        self._custom_frame_list = False
 
         self.on_draw = {}
 
+    def _update_sweep_table(self):
+        """
+        Builds the sweep table when one of its attributes is read while it is
+            out of date.
+        """
+        sweep_order = self.__dict__.get("sweep_order")
+        self._build_sweep_table()
+        if sweep_order is not None:
+            # keep a sweep order that was set by hand
+            self.sweep_order = sweep_order
+
+    def _invalidate_sweep_table(self):
+        """
+        Marks the sweep table, and so the frame schedule, as out of date.
+        """
+        for name in Stimulus._sweep_table_attributes:
+            self.__dict__.pop(name, None)
+        self._invalidate_frame_list()
+
+    def _invalidate_frame_list(self):
+        """
+        Marks the frame schedule as out of date.
+        """
+        for name in Stimulus._frame_list_attributes:
+            self.__dict__.pop(name, None)
+        self.__dict__.pop("_frame_list", None)
+        self._custom_frame_list = False
+
+    def compile(self):
+        """
+        Builds the sweep table and frame schedule now if they are out of date,
+            instead of on first use.
+        """
+        for name in ("sweep_table", "frame_schedule"):
+            getattr(self, name)
+
     @staticmethod
     def from_file(path, window):
         """
@@ -129,57 +231,258 @@ class Stimulus(EObject):
         ##TODO: review buildSweepTable
         self.sweep_table, self.sweep_order, self.dimnames = buildSweepTable(
             self.sweep_params, self.runs, self.blank_sweeps)
+        self._shuffle_sweep_order()
+        self._build_setter_plan()
+
+    def _shuffle_sweep_order(self):
+        """
+        Shuffles the sweep order if requested.  The order only depends on the
+            seed, so it is the same every time the table is rebuilt.
+        """
         if self.shuffle:
-            random.shuffle(self.sweep_order)
+            self.sweep_order = shuffle_sweep_order(
+                self.sweep_order, np.random.RandomState(self.seed), self.runs,
+                block=self.shuffle == "block", no_repeats=self.no_repeats)
+
+    def _build_setter_plan(self):
+        """
+        Resolves the function that applies each sweep dimension to the
+            stimulus, so that `update` doesn't have to look them up for every
+            sweep.
+        """
+        self._setters = [self._resolve_setter(k) for k in self.dimnames]
+        self._sweep_changes = None
+        self._changes_schedule = None
+        self._last_segment = -2
+
+    def _resolve_setter(self, name):
+        """
+        Gets the setter for a sweep dimension.  Dimensions that the psychopy
+            stimulus has no setter for get a special handler.
+        """
+        set_function = getattr(self.stim, "set%s" % name, None)
+        if set_function is not None:
+            return set_function
+        special = {
+            'TF': self._set_tf,
+            'PosX': self._set_pos_x,
+            'PosY': self._set_pos_y,
+        }
+        if name in special:
+            return special[name]
+
+        def unknown(value):
+            print("Sweep param incorrectly formatted:", name, value)
+        return unknown
+
+    def _set_tf(self, tf):
+        self.on_draw['TF'] = tf
+
+    def _set_pos_x(self, x):
+        self.stim.setPos((x, self.stim.pos[1]))
+
+    def _set_pos_y(self, y):
+        self.stim.setPos((self.stim.pos[0], y))
+
+    def _get_sweep_changes(self):
+        """
+        Per-segment mask of the sweep dimensions that differ from the
+            previous segment in the frame schedule.  None if the sweep table
+            can't provide one.
+        """
+        if self._changes_schedule is not self.frame_schedule:
+            self._changes_schedule = self.frame_schedule
+            if isinstance(self.sweep_table, SweepTable):
+                self._sweep_changes = self.sweep_table.changes(
+                    self.frame_schedule.sweeps)
+            else:
+                self._sweep_changes = None
+        return self._sweep_changes
+
+    def _apply_sweep(self, segment, sweep_number):
+        """
+        Applies the parameters of a new sweep to the stimulus.  If we are
+            playing through the schedule in order, only the parameters that
+            changed since the previous sweep are set.
+        """
+        changes = None
+        if segment == self._last_segment + 1:
+            changes = self._get_sweep_changes()
+        if changes is None:
+            changed = [True]*len(self._setters)
+        else:
+            changed = changes[segment]
+        values = self.sweep_table[sweep_number]
+        for k, set_function, v, c in zip(self.dimnames, self._setters, values,
+                                         changed):
+            if not c:
+                continue
+            try:
+                set_function(v)
+            except Exception as e:
+                print("Sweep param incorrectly formatted:", k, v, e)
 
     def _build_sweep_frames(self):
         """
-        Build start/stop frame pairs.
+        Build start/stop frame pairs.  Returns the number of frames each sweep
+            is displayed for.
         """
-        ##TODO: review getSweepFrames
-        self.sweep_frames = getSweepFrames(self.sweep_order, self.sweep_length,
-                                           0, 0, self.blank_length, self.fps)
+        starts, stops = sweep_frame_bounds(len(self.sweep_order),
+                                           self.sweep_length,
+                                           self.blank_length,
+                                           self.fps)
+        self.sweep_frames = zip(starts.tolist(), stops.tolist())
+        return sweep_frame_counts(starts, stops)
 
     def _build_frame_list(self):
         """
-        Builds frame array.  Array is -1 for blank periods, and sweep # otherwise.
+        Builds the frame schedule.  Frames are -1 for blank periods, and
+            sweep # otherwise.
         """
+        sweep_counts = self._build_sweep_frames()
+        sweep_order = np.asarray(self.sweep_order, dtype=np.int32)
 
         #we don't want to build a normal frame list if we have a custom
         #display sequence
         if self.display_sequence is not None:
-            self.set_display_sequence(self.display_sequence)
+            self.frame_schedule = compile_display_schedule(
+                sweep_order, sweep_counts,
+                int(self.fps*self.blank_length), self.display_sequence,
+                self.fps)
+        else:
+            # stop time?
+            if self.stop_time:
+                stop_frame = int(self.fps*self.stop_time)
+            else:
+                stop_frame = None
+
+            self.frame_schedule = compile_frame_schedule(
+                sweep_order, sweep_counts,
+                int(self.fps*self.blank_length), int(self.fps*self.start_time),
+                stop_frame)
+        self.total_frames = self.frame_schedule.total_frames
+        self._custom_frame_list = False
+        self._build_phase_trajectory()
+
+    def _build_phase_trajectory(self):
+        """
+        Computes the phase of the stimulus on every frame if it has a TF
+            dimension.  `draw` looks the phase up instead of computing it, and
+            the array is saved as the phase displayed on each frame.
+        """
+        self.phase_trajectory = None
+        if "TF" not in self.dimnames:
             return
+        column = self.dimnames.index("TF")
+        if self._setters[column] != self._set_tf:
+            return  # the psychopy stimulus handles TF itself
+        sweeps = self.frame_schedule.sweeps
+        if isinstance(self.sweep_table, SweepTable):
+            tf = self.sweep_table.column(column, sweeps)
+        else:
+            tf = [self.sweep_table[sweep][column] for sweep in sweeps]
+        self.phase_trajectory = tf_phases(self.frame_schedule,
+                                          np.asarray(tf, dtype=np.float64),
+                                          self.fps)
+
+    @property
+    def frame_list(self):
+        """
+        Dense frame array expanded from the frame schedule.  Array is -1 for
+            blank periods, and sweep # otherwise.
+
+        Expanded once per schedule and read only, since changes to it
+            wouldn't reach the schedule.  Assign a new array instead.
+        """
+        frame_list = self.__dict__.get("_frame_list")
+        if frame_list is None:
+            frame_list = self.frame_schedule.to_array()
+            frame_list.setflags(write=False)
+            self._frame_list = frame_list
+        return frame_list
+
+    @frame_list.setter
+    def frame_list(self, frame_list):
+        self.__dict__.pop("_frame_list", None)
+        self.frame_schedule = FrameSchedule.from_array(frame_list)
+        self.total_frames = self.frame_schedule.total_frames
+        self._custom_frame_list = True
+        self._build_phase_trajectory()
+
+    def get_total_frames(self):
+        """
+        Returns the total # of frames in the experiment.
 
-        self._build_sweep_frames()
+        Returns:
+            int: total frames in experiment.
 
-        seq = []
+        """
+        return self.frame_schedule.total_frames
 
-        # start time
-        seq.extend([-1]*int(self.fps*self.start_time))
+    def get_content_frames(self):
+        """
+        Gets the number of frames this stimulus needs to display its sweeps
+            when it starts on frame 0.  Computed from the timing parameters,
+            without building a frame schedule.
 
-        # sweeps
-        for index, sweep in enumerate(self.sweep_frames):
-            seq.extend([self.sweep_order[index]]*(int(sweep[1]-sweep[0]+1)))
-            seq.extend([-1]*int(self.fps*self.blank_length))
+        Returns:
+            int: frame count, limited by `stop_time`.
 
-        # stop time?
-        if self.stop_time:
-            stop_frame = int(self.fps*self.stop_time)
-            seq = seq[:stop_frame]
+        """
+        stop_frame = int(self.fps*self.stop_time) if self.stop_time else None
+        return schedule_frames(len(self.sweep_order),
+                               int(self.fps*self.sweep_length),
+                               int(self.fps*self.blank_length),
+                               stop_frame=stop_frame)
 
-        self.frame_list = np.array(seq, dtype=np.int32)
-        self.total_frames = len(self.frame_list)
+    def get_content_time(self):
+        """
+        Gets the time in seconds this stimulus needs to display its sweeps
+            when it starts at time 0.
+        """
+        return float(self.get_content_frames())/self.fps
 
-    def get_total_frames(self):
+    def get_active_interval(self):
         """
-        Returns the total # of frames in the experiment.
+        Gets the first and last frame that this stimulus displays a sweep on.
 
         Returns:
-            int: total frames in experiment.
+            tuple: (first_frame, last_frame), or None if no sweep is ever
+                displayed.
 
         """
-        return len(self.frame_list)
+        first_frame = self.frame_schedule.first_frame()
+        if first_frame is None:
+            return None
+        return first_frame, self.frame_schedule.last_frame()
+
+    def plan(self):
+        """
+        Works out the timing of the frame schedule from the current
+            parameters, without compiling it.
+
+        Returns:
+            SchedulePlan: total frames and the frame blocks the sweep sequence
+                plays in.
+
+        """
+        if self._custom_frame_list:
+            # can't plan a frame list that was set by hand
+            schedule = self.frame_schedule
+            blocks = []
+            if schedule.first_frame() is not None:
+                blocks = [(schedule.first_frame(), schedule.last_frame() + 1)]
+            return SchedulePlan(schedule.total_frames, blocks)
+        stop_frame = int(self.fps*self.stop_time) if self.stop_time else None
+        display_intervals = None
+        if self.display_sequence is not None:
+            display_intervals = np.asarray(self.display_sequence,
+                                           dtype=np.float64)
+        return plan_schedule(len(self.sweep_order),
+                             int(self.fps*self.sweep_length),
+                             int(self.fps*self.blank_length),
+                             int(self.fps*self.start_time),
+                             stop_frame, display_intervals, self.fps)
 
     def get_total_time(self):
         """
@@ -189,7 +492,7 @@ class Stimulus(EObject):
             float: length of experiment in seconds.
 
         """
-        return float(self.total_frames)/self.fps
+        return self.plan().total_time(self.fps)
 
     def get_display_sequence(self):
         """
@@ -209,35 +512,16 @@ class Stimulus(EObject):
             frame (int): frame number for this update.
         """
         self.current_frame = frame
-        try:
-            sweep_number = self.frame_list[frame]
-        except IndexError:
-            #stimulus finished
-            return
-        if sweep_number == self._current_sweep:
-            #still on same sweep
-            pass
-        elif sweep_number == -1:
-            #on a grey screen or blank screen
+        segment = self.frame_schedule.advance(frame)
+        if segment == -1:
+            #on a grey screen or blank screen, or stimulus finished
             return
-        else:
+        sweep_number = self.frame_schedule.sweeps[segment]
+        if sweep_number != self._current_sweep:
             #new sweep
-            # TODO: do this zip() operation elsewhere for performance
-            for k, v in zip(self.dimnames, self.sweep_table[
-                            sweep_number]):
-                try:
-                    set_function = getattr(self.stim, "set%s" % k)
-                    set_function(v)
-                except Exception as e:
-                    if k == 'TF':
-                        self.on_draw[k] = v
-                    elif k == 'PosX':
-                        self.stim.setPos((v, self.stim.pos[1]))
-                    elif k == 'PosY':
-                        self.stim.setPos((self.stim.pos[0], v))
-                    else:
-                        print("Sweep param incorrectly formatted:", k, v, e)
+            self._apply_sweep(segment, sweep_number)
         self._current_sweep = sweep_number
+        self._last_segment = segment
 
         self.draw()
 
@@ -245,10 +529,11 @@ class Stimulus(EObject):
         """
         Draws the stimulus.  Implements any "on_draw" effects.
         """
-        for k, v in self.on_draw.iteritems():
-            if k == 'TF':
-                v = float(v)
-                self.stim.setPhase(v*self.current_frame/self.fps)
+        if self.phase_trajectory is not None:
+            self.stim.setPhase(self.phase_trajectory[self.current_frame])
+        elif 'TF' in self.on_draw:
+            tf = float(self.on_draw['TF'])
+            self.stim.setPhase(tf*self.current_frame/self.fps)
         self.stim.draw()
 
     def set_fps(self, fps):
@@ -256,51 +541,49 @@ class Stimulus(EObject):
         Have to rebuild the frame list every time we change fps.
         """
         self.fps = fps
-        self._build_frame_list()
+        self._invalidate_frame_list()
 
     def set_start_time(self, start_time):
         """
         Have to rebuild the frame list every time we change start time.
         """
         self.start_time = start_time
-        self._build_frame_list()
+        self._invalidate_frame_list()
 
     def set_stop_time(self, stop_time):
         """
         Have to rebuild the frame list every time we change stop time.
         """
         self.stop_time = stop_time
-        self._build_frame_list()
+        self._invalidate_frame_list()
 
     def set_blank_length(self, blank_length):
         """
         Sets a new blank length and rebuilds frame list.
         """
         self.blank_length = blank_length
-        self._build_frame_list()
+        self._invalidate_frame_list()
 
     def set_sweep_length(self, sweep_length):
         """
         Sets a new sweep length and rebuilds frame list.
         """
         self.sweep_length = sweep_length
-        self._build_frame_list()
+        self._invalidate_frame_list()
 
     def set_runs(self, runs):
         """
         Sets a new run amount. Rebuilds sweep table and frame list.
         """
         self.runs = runs
-        self._build_sweep_table()
-        self._build_frame_list()
+        self._invalidate_sweep_table()
 
     def set_blank_sweeps(self, blank_sweeps):
         """
         Sets a new blank sweeps. Rebuilds sweep table and frame list.
         """
         self.blank_sweeps = blank_sweeps
-        self._build_sweep_table()
-        self._build_frame_list()
+        self._invalidate_sweep_table()
 
     def set_sweep_order(self, sequence):
         """
@@ -311,7 +594,7 @@ class Stimulus(EObject):
 
         """
         self.sweep_order = sequence
-        self._build_frame_list()
+        self._invalidate_frame_list()
 
     def set_display_sequence(self, display_intervals):
         """
@@ -327,8 +610,6 @@ class Stimulus(EObject):
                 Tuple or list of intervals in the form [(start, stop),...
 
         """
-        seq = []
-
         display_intervals = np.array(display_intervals)  # rectangular
 
         #ensure the display intervals are formatted correctly
@@ -349,46 +630,25 @@ class Stimulus(EObject):
         if not (np.diff(display_intervals[:, 1]) > 0).all():
             raise ValueError("Stops are not monotonically increasing.")
 
-        #build the basic list assuming no gaps
-        seq0 = []
-
-        self._build_sweep_frames()
-
-        for index, sweep in enumerate(self.sweep_frames):
-            seq0.extend([self.sweep_order[index]]*(int(sweep[1]-sweep[0]+1)))
-            seq0.extend([-1]*int(self.fps*self.blank_length))
-
-        #create a new sequence that includes the display intervals
-        seq = []
-        s0 = display_intervals[0,0]  #first start
-        seq.extend([-1]*int(self.fps*s0))  #pad until first start
-
-        for i, (start, stop) in enumerate(display_intervals):
-            frames_to_add = int((stop-start)*self.fps)
-            seq.extend(seq0[:frames_to_add])
-            try:
-                next_start = display_intervals[i+1, 0]
-            except IndexError:
-                #end of sequence
-                break
-            grey_frames_to_add = int((next_start-stop)*self.fps)
-            seq.extend([-1]*grey_frames_to_add)
-            seq0 = seq0[frames_to_add:]
-
-        self.frame_list = np.array(seq, dtype=np.int32)
-        self.total_frames = len(self.frame_list)
         self.display_sequence = display_intervals#.tolist()
+        self._invalidate_frame_list()
 
     def package(self):
         """
         Package for serializing.  Basically get rid of stuff that won't
             unpickle well.
         """
+        self.compile()
         if not self.save_sweep_table:
             self.sweep_table = None
             self.sweep_params = self.sweep_params.keys()
+        elif isinstance(self.sweep_table, SweepTable):
+            self.sweep_table = self.sweep_table.tolist()
         self_dict = self.__dict__
         self_dict['stim'] = str(self_dict['stim'])
+        # analysis code reads the dense frame list
+        self_dict['frame_list'] = np.array(self.frame_list)
+        self_dict['frame_schedule'] = self.frame_schedule.to_dict()
         return wecanpicklethat(self_dict)
 
 class GratingStim(Stimulus):
@@ -468,6 +728,7 @@ class MovieStim(Stimulus):
                  flip_v=False,
                  flip_h=False,
                  interpolate=False,
+                 seed=None,
                  ):
 
         self.movie_path = movie_path
@@ -496,7 +757,8 @@ class MovieStim(Stimulus):
                                         runs=runs,
                                         shuffle=shuffle,
                                         fps=fps,
-                                        save_sweep_table=False)
+                                        save_sweep_table=False,
+                                        seed=seed)
 
     def _local_copy(self, source):
         """
@@ -559,6 +821,8 @@ class NaturalScenes(Stimulus):
                  runs=1,
                  shuffle=False,
                  fps=60.0,
+                 seed=None,
+                 no_repeats=False,
                  ):
 
         if isinstance(image_path_list, str):
@@ -605,18 +869,17 @@ class NaturalScenes(Stimulus):
         self.runs = runs
         self.shuffle = shuffle
         self.fps = fps
+        self.seed = new_seed() if seed is None else seed
+        self.no_repeats = no_repeats
 
         self.stim_text = ""
         self.stim_path = ""
 
         self.save_sweep_table = True
 
-        self._build_sweep_table()
-
         self._current_sweep = None
         self.display_sequence = None
-
-        self._build_frame_list()
+        self._custom_frame_list = False
 
         self.on_draw = {}
 
@@ -624,19 +887,10 @@ class NaturalScenes(Stimulus):
         """
         Overwrites the stimulus `_build_sweep_table` method.
         """
-        self.sweep_table, self.sweep_order, self.dimnames = [], range(len(self.stim)), []
-        if self.blank_sweeps is not 0:
-            segments = [self.sweep_order[i:i+self.blank_sweeps] for i in range(0, len(self.sweep_order), self.blank_sweeps)]
-            self.sweep_order = []
-            for x in segments:
-                for y in x:
-                    self.sweep_order.append(y)
-                if len(x) == self.blank_sweeps:
-                    self.sweep_order.append(-1)
-        self.sweep_order *= self.runs
-
-        if self.shuffle:
-            random.shuffle(self.sweep_order)
+        self.sweep_table, self.dimnames = [], []
+        self.sweep_order = build_sweep_order(len(self.stim), self.runs,
+                                             self.blank_sweeps)
+        self._shuffle_sweep_order()
 
 
     def update(self, frame):
@@ -644,20 +898,11 @@ class NaturalScenes(Stimulus):
         Updates the stimulus based on the current sweep.
         """
         self.current_frame = frame
-        try:
-            sweep_number = self.frame_list[frame]
-        except IndexError:
-            #stimulus finished
+        segment = self.frame_schedule.advance(frame)
+        if segment == -1:
+            #on a grey screen or blank screen, or stimulus finished
             return
-        if sweep_number == self._current_sweep:
-            #still on same sweep
-            pass
-        elif sweep_number == -1:
-            #on a grey screen or blank screen
-            return
-        else:
-            #new sweep
-            self._current_sweep = sweep_number
+        self._current_sweep = self.frame_schedule.sweeps[segment]
 
         self.draw()
 
@@ -687,6 +932,13 @@ class StimulusArray(Stimulus):
 
         self.display_sequence = None
 
+    def _build_sweep_table(self):
+        raise AttributeError("StimulusArray has no sweep table, its stimuli "
+                             "each have one")
+
+    def _build_frame_list(self):
+        raise AttributeError("StimulusArray has no frame schedule, its "
+                             "stimuli each have one")
 
     def get_display_sequence(self):
         if self.display_sequence is not None:
@@ -714,6 +966,11 @@ class StimulusArray(Stimulus):
         for stim in self.stimuli:
             stim.set_stop_time(stop_time)
 
+    def set_fps(self, fps):
+        self.fps = fps
+        for stim in self.stimuli:
+            stim.set_fps(fps)
+
     def set_runs(self, runs):
         self.runs = runs
         for stim in self.stimuli:
@@ -739,11 +996,49 @@ class StimulusArray(Stimulus):
     def get_total_frames(self):
         return max([stim.total_frames for stim in self.stimuli])
 
+    def get_content_time(self):
+        return max([stim.get_content_time() for stim in self.stimuli])
+
+    def plan(self):
+        return SchedulePlan.combine([stim.plan() for stim in self.stimuli])
+
+    def compile(self):
+        for stim in self.stimuli:
+            stim.compile()
+
+    def get_active_interval(self):
+        intervals = [stim.get_active_interval() for stim in self.stimuli]
+        intervals = [i for i in intervals if i is not None]
+        if not intervals:
+            return None
+        return (min([i[0] for i in intervals]),
+                max([i[1] for i in intervals]))
+
 
 class SweepStim(Stim):
     """
     Plays a set of stimuli in an ordered fashion.
 
+    The time spent in each phase of every frame is recorded unless the
+        `frame_profiler` config setting is False.  Timings are saved as
+        `frame_timing` in the output file.
+
+    The `frame_policy` config setting decides whether frames are skipped to
+        get back on the timeline after dropped frames.  Frames that fell
+        behind, and any frames skipped, are saved as `frame_recovery`.
+
+    With the `gc_mode` config setting set to "blank", the garbage collector is
+        disabled during the session and only run on frames where no stimulus
+        shows a sweep: blank periods, blank sweeps and the blanks between
+        sweeps.  Collections are saved as `gc_collections`.  The
+        `alloc_profiler` setting makes the frame profiler count allocations
+        per phase instead of time.
+
+    On a window that shows several subframes per refresh (a DLP180Hz
+        `window.Window`), every frame is a subframe: `fps` is the window's
+        `subframeRate` and stimuli are rebuilt at that rate.  Intervals
+        between hardware refreshes are saved as `refresh_intervals_ms`.
+
     args:
         window (psychopy.visual.Window): Window to display to.
         stimuli (list): list of stimulus objects
@@ -754,6 +1049,16 @@ class SweepStim(Stim):
         movie_output (str): path for writing the simulus frames
 
     """
+    # psychopy stimulus attributes the control stream can set and get
+    CONTROL_ATTRIBUTES = ("ori", "pos", "size", "sf", "phase", "contrast",
+                          "opacity", "color")
+
+    # frame phases recorded by the profiler, in order
+    PROFILER_PHASES = ("stimuli", "items", "pulse_high", "flip", "pulse_low",
+                       "movie_frame", "keys")
+    (_STIMULI, _ITEMS, _PULSE_HIGH, _FLIP, _PULSE_LOW, _MOVIE_FRAME,
+     _KEYS) = range(len(PROFILER_PHASES))
+
     def __init__(self,
                  window,
                  stimuli=[],
@@ -782,7 +1087,15 @@ class SweepStim(Stim):
 
         self.sweepstim_text = ""
 
+        # schedules are built at the subframe rate
+        subframe_rate = getattr(self.window, "subframeRate", None)
+        if subframe_rate and self.fps != subframe_rate:
+            logging.info("Using the window's subframe rate of {} fps".format(
+                subframe_rate))
+            self.fps = subframe_rate
+
         self.stimuli = []
+        self._active_index = None
 
         for stim in stimuli:
             self.add_stimulus(stim)
@@ -793,7 +1106,15 @@ class SweepStim(Stim):
 
         self.vsynccount = 0
 
+        self._profiler = FrameProfiler(self.PROFILER_PHASES, enabled=False)
+        self._flip_time = None
+        self._frame_scheduler = None
+        self._gc = GCControl()
+        self._gc_frames = None
+        self._async_logging = AsyncLogging()
+
         #set up required submodules
+        self._setup_input()
         self._setup_syncpulse()
         self._setup_syncsquare()
         self._setup_controlstream()
@@ -832,23 +1153,23 @@ class SweepStim(Stim):
         Sets up the sync pulse.
 
         """
+        self.framepulse = None
+        self.onpulse = None
         try:
             frame_pulse = self.sync_config['frame_pulse']
             acq_on_pulse = self.sync_config['acq_on_pulse']
+            backend = self.sync_config.get('pulse_backend', "nidaq")
 
             if frame_pulse:
                 device, port, line = frame_pulse
-                self.framepulse = SyncPulse(device, port, line)
+                self.framepulse = SyncPulse(device, port, line,
+                                            backend=backend)
                 self.framepulse.set_low()
-            else:
-                self.framepulse = None
 
             if acq_on_pulse:
                 device, port, line = acq_on_pulse
-                self.onpulse = SyncPulse(device, port, line)
+                self.onpulse = SyncPulse(device, port, line, backend=backend)
                 self.onpulse.set_low()
-            else:
-                self.onpulse = None
         except Exception as e:
             logging.warning("Failed to set up sync pulse: {}".format(e))
 
@@ -873,6 +1194,15 @@ class SweepStim(Stim):
         else:
             self._syncsqr = None
 
+    def _setup_input(self):
+        """
+        Sets up the input poller.  Key presses and control commands are
+            queued as they arrive and handled between frames by `_check_keys`.
+        """
+        self._input = InputPoller()
+        self._input.register("key", self._handle_key)
+        self._input.watch_keys(self.window)
+
     def _setup_controlstream(self):
         """
         Sets up control steam socket to receive commands.
@@ -882,7 +1212,10 @@ class SweepStim(Stim):
         """
         try:
             controlstream = ControlStream(1111, self)
+            controlstream.register_method("stop", self._stop)
             self.add_item(controlstream, name="control_stream")
+            self._input.add_socket(controlstream.sock, parse=parse_commands)
+            self._input.register("command", controlstream.handle_commands)
         except Exception as e:
             logging.exception("Failed to set up control stream: {}".format(e))
 
@@ -892,7 +1225,7 @@ class SweepStim(Stim):
         """
         extra_data = {
             'passive_stimulus': {
-                'expected_duration_sec': self._count_total_frames()/60,
+                'expected_duration_sec': self._count_total_frames()/self.fps,
                 'block_segments': [stim.display_sequence for stim in self.stimuli]
             }
         }
@@ -906,10 +1239,13 @@ class SweepStim(Stim):
             stimulus = self._load_stimulus(stimulus)
 
         #stimulus.set_fps(self.fps)
+        if getattr(self.window, "subframeRate", None):
+            stimulus.set_fps(self.fps)
         if index:
             self.stimuli.insert(index, stimulus)
         else:
             self.stimuli.append(stimulus)
+        self._active_index = None
 
     def _load_stimulus(self, path):
         """
@@ -925,6 +1261,7 @@ class SweepStim(Stim):
             self.stimuli.pop(index)
         else:
             self.stimuli.remove(stimulus)
+        self._active_index = None
 
     def add_item(self, item, name=""):
         """
@@ -962,14 +1299,24 @@ class SweepStim(Stim):
             items between each frame.
         3) Takes down the run with `_takedown_run`
 
+        Log records are written from a background thread until the run is
+            finalized.
+
         """
-        self._setup_run()
+        self._async_logging.start()
+        try:
+            self._setup_run()
 
-        # experiment
-        for frame in range(self.total_frames):
-            self.update(frame)
+            # experiment
+            frame = 0
+            while frame < self.total_frames:
+                self.update(frame)
+                frame = self._frame_scheduler.next_frame(frame,
+                                                         self._flip_time)
 
-        self._takedown_run()
+            self._takedown_run()
+        finally:
+            self._async_logging.stop()
 
     def _setup_run(self):
         """
@@ -988,11 +1335,36 @@ class SweepStim(Stim):
         for i in self.items.values():
             i.start()
 
+        self._register_control_targets()
+
         #import pdb; pdb.set_trace()
+        for stim in self.stimuli:
+            if hasattr(stim, "compile"):
+                stim.compile()
         self.total_frames = self._count_total_frames()
+        self._build_active_index()
+
+        blank_frames = int(self.pre_blank_sec*self.fps) + int(
+            self.post_blank_sec*self.fps)
+        if self.config.get('alloc_profiler', False):
+            # allocation counts reset when the collector runs on its own
+            self._gc = GCControl("blank")
+            self._profiler = FrameProfiler(
+                self.PROFILER_PHASES, self.total_frames + blank_frames,
+                clock=allocation_counter, scale=1, units="objects")
+        else:
+            self._gc = GCControl(self.config.get('gc_mode', "auto"))
+            self._profiler = FrameProfiler(
+                self.PROFILER_PHASES, self.total_frames + blank_frames,
+                enabled=self.config.get('frame_profiler', True))
+        self._setup_frame_scheduler()
+        # the collector runs on frames that show nothing, blank sweeps included
+        self._gc_frames = ~self._content_mask() if self._gc.enabled else None
 
         self._printExpInfo()
 
+        self._input.start()
+
         if self.onpulse:
             self.onpulse.set_high()
 
@@ -1001,16 +1373,21 @@ class SweepStim(Stim):
         #Post-start-trigger delay (Default is 0.0 seconds)
         self._trigger_delay()
 
+        self._gc.freeze()
+
         #Flip for 1/2 second
-        self._splash_grey(int(self.fps/2))
+        self._splash_grey(int(self.fps/2), "start_splash")
 
         self.startdatetime = datetime.datetime.now()
         self.start_time = time.time()
         self.window.setRecordFrameIntervals(True)
 
         # pre blank
-        for frame in range((int(self.pre_blank_sec*self.fps))):
+        pre_blank_frames = int(self.pre_blank_sec*self.fps)
+        self._start_sync_segment("pre_blank", pre_blank_frames)
+        for frame in range(pre_blank_frames):
             self._blank_period(frame)
+        self._start_sync_segment("stimulus", self.total_frames)
 
     def _takedown_run(self):
         """
@@ -1021,7 +1398,9 @@ class SweepStim(Stim):
 
         """
         # post blank
-        for frame in range((int(self.post_blank_sec*self.fps))):
+        post_blank_frames = int(self.post_blank_sec*self.fps)
+        self._start_sync_segment("post_blank", post_blank_frames)
+        for frame in range(post_blank_frames):
             self._blank_period(frame)
 
         self._finalize()
@@ -1042,34 +1421,120 @@ class SweepStim(Stim):
             raise IndexError('There are only %i stimuli.' % len(self.stimuli))
 
     def update(self, frame):
+        profiler = self._profiler
+        profiler.start()
         self._update_stimuli(frame)
+        profiler.mark(self._STIMULI)
         self._update_items(frame)
+        profiler.mark(self._ITEMS)
         self.flip()
         self.vsynccount += 1
         self._check_keys()
+        profiler.mark(self._KEYS)
+        profiler.stop()
+        gc_frames = self._gc_frames
+        if gc_frames is not None and gc_frames[frame]:
+            self._gc.idle()
 
     def flip(self):
+        profiler = self._profiler
         if self.framepulse:
-            self.framepulse.set_high()
+            self.framepulse.frame_start()
+        profiler.mark(self._PULSE_HIGH)
         self.window.flip()
+        self._flip_time = default_timer()
+        profiler.mark(self._FLIP)
         if self.framepulse:
-            self.framepulse.set_low()
+            self.framepulse.frame_end()
+        profiler.mark(self._PULSE_LOW)
         if self.movie_output:
             self.window.getMovieFrame()
+        profiler.mark(self._MOVIE_FRAME)
 
-    def _update_stimuli(self, frame):
+    def _setup_frame_scheduler(self):
+        """
+        Sets up frame pacing with the `frame_policy` from the config.
+        """
+        policy = self.config.get('frame_policy', "keep")
+        blank = None
+        if policy == "skip_blank":
+            blank = ~self._content_mask()
+        self._frame_scheduler = FrameScheduler(self.total_frames, self.fps,
+                                               policy, blank)
+
+    def _content_mask(self):
+        """
+        Bool array, True for each frame where any stimulus displays something.
+        """
+        mask = np.zeros(self.total_frames, dtype=bool)
         for stim in self.stimuli:
-            stim.update(frame)
+            schedule = getattr(stim, "frame_schedule", None)
+            if isinstance(schedule, FrameSchedule):
+                mask |= schedule.content_mask(self.total_frames)
+            elif not hasattr(stim, "get_active_interval"):
+                mask[:] = True  # could be showing something on any frame
+            else:
+                interval = stim.get_active_interval()
+                if interval is not None:
+                    mask[interval[0]:interval[1] + 1] = True
+        return mask
+
+    def _build_active_index(self):
+        """
+        Indexes the frames that each stimulus is active on, so that only
+            those stimuli are updated.  Stimuli without a
+            `get_active_interval` method are always updated.
+        """
+        intervals = []
+        for stim in self.stimuli:
+            if hasattr(stim, "get_active_interval"):
+                intervals.append(stim.get_active_interval())
+            else:
+                intervals.append((0, float('inf')))
+        self._active_index = ActiveIndex(intervals)
+
+    def _update_stimuli(self, frame):
+        if self._active_index is None:
+            self._build_active_index()
+        stimuli = self.stimuli
+        active = self._active_index.active(frame)
+        for i in active:
+            stimuli[i].update(frame)
+        return active
 
     def _update_items(self, frame):
         for item in self.items.values():
             item.update(frame)
 
+    def _register_control_targets(self):
+        """
+        Registers the control stream targets for the stimuli, now that the
+            list of stimuli is final.
+        """
+        controlstream = self.items.get("control_stream")
+        if controlstream is None:
+            return
+        for index, stim in enumerate(self.stimuli):
+            for name in self.CONTROL_ATTRIBUTES:
+                target = "stimuli.{}.stim.{}".format(index, name)
+                try:
+                    controlstream.register_attribute(target)
+                except (AttributeError, IndexError, TypeError):
+                    pass  # not something this stimulus has
+
+    def _stop(self):
+        """
+        Ends the experiment early, like pressing escape.
+        """
+        self._handle_key("escape")
+
     def _check_keys(self):
-        for keys in event.getKeys(timeStamped=True):
-            if keys[0]in ['escape', 'q']:
-                self.escape_pressed = True
-                self._finalize()
+        self._input.drain(self.vsynccount)
+
+    def _handle_key(self, key):
+        if key in ['escape', 'q']:
+            self.escape_pressed = True
+            self._finalize()
 
     def _printExpInfo(self):
 
@@ -1088,12 +1553,23 @@ class SweepStim(Stim):
         if not self.stimuli:
             return 0
         if not self.primary_stimulus:
-            total_frames = max([s.get_total_frames() for s in self.stimuli])
+            total_frames = max([self._stimulus_frames(s)
+                                for s in self.stimuli])
         else:
-            total_frames = self.stimuli[
-                self.primary_stimulus].get_total_frames()
+            total_frames = self._stimulus_frames(
+                self.stimuli[self.primary_stimulus])
         return total_frames
 
+    @staticmethod
+    def _stimulus_frames(stim):
+        """
+        Total frames of a stimulus.  Planned without compiling its schedule
+            when the stimulus supports it.
+        """
+        if hasattr(stim, "plan"):
+            return stim.plan().total_frames
+        return stim.get_total_frames()
+
     def _finalize(self):
         """
         Stops the experiment and prepares for cleanup.
@@ -1109,9 +1585,21 @@ class SweepStim(Stim):
         """
         self.window.setRecordFrameIntervals(False)
         self.stop_time = time.time()
+        self._async_logging.stop()
+        self._input.stop()
+        self.input_latency = self._input.latencies
+        self._gc.restore()
+        if self._gc.enabled:
+            self.gc_collections = self._gc.to_dict()
+        if self._frame_scheduler:
+            self.frame_recovery = self._frame_scheduler.to_dict()
+            logging.info("Frames skipped to stay on the timeline: {}".format(
+                self._frame_scheduler.skipped_frames))
 
         #Flip for 1/2 second
-        self._splash_grey(int(self.fps/2))
+        self._splash_grey(int(self.fps/2), "end_splash")
+        if self._syncsqr:
+            self.sync_square_edges = self._syncsqr.expected_edges()
 
         #Pre-stop-trigger delay (Default is 0.0 seconds)
         self._trigger_delay()
@@ -1137,11 +1625,26 @@ class SweepStim(Stim):
         print("Actual end time: %s" % str(self.stopdatetime))
 
         self.printFrameInfo()  #also saves intervalsms
+        if getattr(self.window, "subframes", 1) > 1:
+            self.refresh_intervals_ms = np.array(
+                self.window.refreshIntervals)*1000
+        self._print_frame_timing()
 
         self._cleanup()
 
         sys.exit(0)
 
+    def _print_frame_timing(self):
+        """
+        Prints per-phase frame time percentiles and keeps the timings for the
+            output file.
+        """
+        if not self._profiler.enabled:
+            return
+        self.frame_timing = self._profiler.to_dict()
+        logging.info("Frame phase timing:\n{}".format(
+            self._profiler.summary_text()))
+
     def package(self):
         """
         Package method.  Converts self, stimuli, and all items into a picklable
@@ -1223,28 +1726,39 @@ class SweepStim(Stim):
         for i in range(delay_frames):
             self.window.flip()
 
-    def _splash_grey(self, frames):
+    def _splash_grey(self, frames, name="splash"):
         """
         Pre and post experiment grey period.  Special syncsqr behavior.
         """
-        if self._syncsqr:
-            old_sync_freq = self._syncsqr.frequency
-            self._syncsqr.frequency = 5  # hard code start-stop indicator to 5?
+        # hard code start-stop indicator to 5?
+        self._start_sync_segment(name, frames, frequency=5)
         for i in range(frames):
             if self._syncsqr:
                 self._syncsqr.update(i)
             self.window.flip()
+
+    def _start_sync_segment(self, name, frames, frequency=None):
+        """
+        Precomputes the sync square colors for the next `frames` frames.
+        """
         if self._syncsqr:
-            self._syncsqr.frequency = old_sync_freq
+            self._syncsqr.start_segment(name, frames, frequency)
 
     def _blank_period(self, frame):
         """
         Updates items but not stimuli.
         """
+        profiler = self._profiler
+        profiler.start(blank=True)
+        profiler.mark(self._STIMULI)
         self._update_items(frame)
+        profiler.mark(self._ITEMS)
         self.flip()
         self.vsynccount += 1
         self._check_keys()
+        profiler.mark(self._KEYS)
+        profiler.stop()
+        self._gc.idle()
 
 
 
@@ -1254,6 +1768,16 @@ class ControlStream(EObject):
     """
     Stream for socket commands.  Allows commands from the agent.
 
+    The socket is read by the parent's input poller, which parses datagrams
+        with `commands.parse_commands` and calls `handle_commands` between
+        frames.  Every command is logged with the vsync it was applied on and
+        saved as `command_log`.
+
+    Commands can only use targets registered with `register_attribute` and
+        `register_method`.  SweepStim registers "stop" and the psychopy
+        attributes in `SweepStim.CONTROL_ATTRIBUTES` of each stimulus, as
+        "stimuli.<index>.stim.<attribute>".
+
     #TODO: replace this with something like ZMQ or ZRO
 
     """
@@ -1261,91 +1785,38 @@ class ControlStream(EObject):
         super(ControlStream, self).__init__()
         self.port = port
         self.parent = parent
+        self._commands = CommandTable(parent)
+        self._log = CommandLog()
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind(('localhost', self.port))
         self.sock.settimeout(0.0)
 
-    def update(self, frame):
-        if frame % 10 == 0:
-            try:
-                data, addr = self.sock.recvfrom(48)
-                if data:
-                    data = data.split(' ')
-                    self._handleCommand(data)
-            except socket.error as e:
-                pass
-            except Exception as e:
-                print("Controlstream error: %s" % e)
+    def register_attribute(self, target, cast=None):
+        self._commands.register_attribute(target, cast)
 
-    def _handleCommand(self, command):
-        """
-        Handles a command from a UDP source.
+    def register_method(self, target, method=None):
+        self._commands.register_method(target, method)
 
-        TODO:
-            - Make this not totally fucking insane.
+    def handle_commands(self, commands):
         """
-
-        if command[0] == 'SET':
-            try:
-                name = command[1].split('.')
-                newvalue = eval(command[2])
-                if len(name,) == 2:
-                    oldvalue = getattr(eval("self."+name[0]), name[1])
-                    if type(oldvalue) == type(newvalue):
-                        setattr(eval("self.parent."+name[0]), name[1], newvalue)  # value is in child object
-                    else:
-                        try:
-                            oldtype = type(oldvalue)  # cast as new type?
-                            newvalue = oldtype(newvalue)
-                            setattr(eval("self.parent."+name[0]), name[1], newvalue)  # value is in child object
-                        except:
-                            raise TypeError('Old value is %s, new value is %s' % (
-                                type(oldvalue), type(newvalue)))
-                elif len(name,) == 1:
-                    oldvalue = getattr(self, name[0])
-                    if type(oldvalue) == type(newvalue):
-                        setattr(self.parent, name[0], newvalue)  # value is in self
-                    else:
-                        try:
-                            oldtype = type(oldvalue)
-                            newvalue = oldtype(newvalue)
-                            setattr(self.parent, name[0], newvalue)
-                        except:
-                            raise TypeError('Old value is %s, new value is %s' % (
-                                type(oldvalue), type(newvalue)))
-                elif len(name,) > 2:
-                    raise ValueError('Command could not be parsed. Check formatting.')
-                commandlist = (command[1], oldvalue, newvalue, self.vsynccount)
-                self.commandrecord.append(commandlist)
-                print(commandlist)
-            except Exception as e:
-                print("Failed to set value: %s" % e)
-
-        elif command[0] == 'GET':
-            ##TODO: Do something with value that we get...
-            try:
-                name = command[1].split('.')
-                if len(name,) == 2:
-                    value = getattr(eval("self.parent."+name[0]), name[1])
-                elif len(name,) == 1:
-                    value = getattr(self.parent, name[0])
-            except Exception as e:
-                print("Failed to get value: %s" % e)
-
-        elif command[0] == 'RUN':
+        Applies a batch of commands.
+        """
+        vsync = self.parent.vsynccount
+        for command in commands:
             try:
-                methodname = command[1]  # currently only works with no args
-                getattr(self.parent, methodname)()
-                commandlist = (command[1], self.vsynccount)
-                self.commandrecord.append(commandlist)
-                print(commandlist)
+                value = self._commands.execute(command)
             except Exception as e:
-                print("Failed to run method: %s" % e)
-        else:
-            print("Couldn't parse received command: %s" % command)
+                logging.warning("Failed to %s %s: %s", command.name,
+                                command.target, e)
+                self._log.append(vsync, command, command.value, ok=False)
+            else:
+                logging.info("%s %s %r @ vsync %i", command.name,
+                             command.target, value, vsync)
+                self._log.append(vsync, command, value)
 
     def package(self):
+        self.command_log = self._log.to_dict()
         self.sock = str(self.sock)
         self.parent = str(self.parent)
         return super(ControlStream, self).package()
@@ -1355,6 +1826,7 @@ def interleave(stimulus_list,
                intervals,
                shuffle=False,
                flatten=False,
+               seed=None,
                ):
     """
     Creates custom display sequences for each stimuli in a list, such that they
@@ -1367,39 +1839,40 @@ def interleave(stimulus_list,
     intervals : list
         Duration of segments for each stimuli in seconds.
     shuffle : bool
-        Randomize presentation order. (doesn't do anything yet).
+        Randomize the order of the stimuli within each epoch.
     flatten : bool
         Squeezes end of presentation if some stimuli have ended while others
-        are still going. (doesn't do anything yet)
+        are still going.
+    seed : int
+        Seed for shuffling.  Random if None.
+
+    returns
+    -------
+    list
+        The display sequence applied to each stimulus.
 
     """
     # if intervals is an integer convert it to a list
     if isinstance(intervals, (int, float)):
-        intervals = [[intervals]*len(stimulus_list)]
+        intervals = [intervals]*len(stimulus_list)
 
     if (len(stimulus_list) != len(intervals)):
         raise ValueError("Stimulus and interval lists must be same length.")
 
     #how many intervals for each stimulus?
     interval_count = []
-    for i, (stim, interval) in enumerate(zip(stimulus_list, intervals)):
-        stim.set_start_time(0.0)
-        tt = stim.get_total_time()
+    for stim, interval in zip(stimulus_list, intervals):
+        tt = stim.get_content_time()
         interval_count.append(int(math.ceil(tt/interval)))  #round up
 
-    #create a display sequence for each stimulus and apply it
-    for i, (stim, interval) in enumerate(zip(stimulus_list, intervals)):
-        epoc_length = sum(intervals)
-        pre_length = sum(intervals[:i])
-        t = 0.0
-        display_sequence = []
-        for seg in range(interval_count[i]):
-            start = pre_length + t
-            stop = pre_length + t + interval
-            t += epoc_length
-            display_sequence.append([start, stop])
-        stim.set_display_sequence(display_sequence)
+    display_sequences = interleave_intervals(
+        intervals, interval_count, shuffle=shuffle, flatten=flatten,
+        rng=np.random.RandomState(seed))
 
+    #apply the display sequences, this builds each frame schedule once
+    for stim, display_sequence in zip(stimulus_list, display_sequences):
+        stim.set_display_sequence(display_sequence)
+    return display_sequences
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
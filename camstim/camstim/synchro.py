@@ -6,8 +6,144 @@ sync.py
 
 Provides some classes useful for synchronization and data alignment.
 """
+from timeit import default_timer
+
+import numpy as np
 from psychopy import visual
 from camstim.experiment import EObject
+from camstim.schedule import sync_square_schedule, sync_square_edges
+
+
+class PulseBackend(object):
+    """
+    Interface for the digital line a SyncPulse drives.
+    """
+    def write(self, value):
+        """
+        Sets the line to `value`.
+        """
+        raise NotImplementedError()
+
+    def write_pulse(self, high, low):
+        """
+        Sets the line to `high` then `low`.  The pulse is as wide as the time
+            between the two writes.
+        """
+        self.write(high)
+        self.write(low)
+
+    def close(self):
+        pass
+
+
+class NidaqBackend(PulseBackend):
+    """
+    NIDAQ digital output line.
+
+    args
+    ----
+    device : str
+        NIDAQ device id, for example "Dev1"
+    port : int
+        NIDAQ port number
+    line : int
+        NIDAQ line number
+    initial_state : str
+        "high" or "low"
+    task : task
+        NIDAQ task to use.  If none, one is created for the line.
+
+    Every write is an immediate, software timed `writeBit`.
+
+    """
+    def __init__(self, device, port, line, initial_state="low", task=None):
+        self.task = task
+        if not self.task:
+            from toolbox.IO.nidaq import DigitalOutput
+            self.task = DigitalOutput(device,
+                                      port=port,
+                                      lines=str(line),
+                                      initial_state=initial_state)
+            self.task.start()
+
+    def write(self, value):
+        self.task.writeBit(0, value)
+
+
+class SimulatedBackend(PulseBackend):
+    """
+    In-process stand in for a DAQ line.  Records the time and value of every
+        write so the pulse path can be tested and benchmarked without
+        hardware.
+
+    args
+    ----
+    latency : float
+        Seconds each driver call takes.  Simulated by busy waiting.
+    clock : callable
+        Clock used to timestamp edges, in seconds.
+
+    """
+    def __init__(self, latency=0.0, clock=default_timer, capacity=1024):
+        self.latency = latency
+        self.calls = 0
+        self._clock = clock
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity, dtype=np.uint8)
+        self._count = 0
+
+    def _record(self, value):
+        if self._count == len(self._times):
+            self._times = np.concatenate((self._times,
+                                          np.zeros_like(self._times)))
+            self._values = np.concatenate((self._values,
+                                           np.zeros_like(self._values)))
+        self._times[self._count] = self._clock()
+        self._values[self._count] = value
+        self._count += 1
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            end = self._clock() + self.latency
+            while self._clock() < end:
+                pass
+
+    def write(self, value):
+        self._call()
+        self._record(value)
+
+    @property
+    def times(self):
+        """
+        Time of each write.
+        """
+        return self._times[:self._count]
+
+    @property
+    def values(self):
+        """
+        Value of each write.
+        """
+        return self._values[:self._count]
+
+    def edges(self):
+        """
+        Times of rising and falling edges.
+
+        Returns:
+            tuple: (rising, falling) arrays of timestamps.
+
+        """
+        values = self.values.astype(np.int8)
+        change = np.diff(np.concatenate(([0], values)))
+        return self.times[change > 0], self.times[change < 0]
+
+
+PULSE_BACKENDS = {
+    "nidaq": NidaqBackend,
+    "simulated": SimulatedBackend,
+}
 
 
 class SyncPulse(EObject):
@@ -26,6 +162,9 @@ class SyncPulse(EObject):
         Whether to invert IO logic
     task : task
         NIDAQ task to use.  If none, SyncPulse creates its own.
+    backend : PulseBackend or str
+        Line to drive, or the name of a backend in `PULSE_BACKENDS`.
+        Defaults to a NIDAQ line.
 
     """
 
@@ -34,12 +173,12 @@ class SyncPulse(EObject):
                  port,
                  line,
                  invert=False,
-                 task=None):
+                 task=None,
+                 backend="nidaq"):
 
         super(SyncPulse, self).__init__()
         self.device = device
         self.port = port
-        self._task = task
         self.line = line
         self.invert = invert
 
@@ -52,20 +191,39 @@ class SyncPulse(EObject):
         else:
             initial_state = "low"
 
-        if not self._task:
-            from toolbox.IO.nidaq import DigitalOutput
-            self._task = DigitalOutput(self.device,
-                                       port=self.port,
-                                       lines=str(self.line),
-                                       initial_state=initial_state)
-
-            self._task.start()
+        if backend == "nidaq":
+            backend = NidaqBackend(device, port, line, initial_state, task)
+        elif isinstance(backend, basestring):
+            backend = PULSE_BACKENDS[backend]()
+        self._backend = backend
+        self.backend = type(backend).__name__
 
     def set_high(self):
-        self._task.writeBit(0, self._high)
+        self._backend.write(self._high)
 
     def set_low(self):
-        self._task.writeBit(0, self._low)
+        self._backend.write(self._low)
+
+    def pulse(self):
+        """
+        Sets the line high, then low.
+        """
+        self._backend.write_pulse(self._high, self._low)
+
+    def frame_start(self):
+        """
+        Called before a window flip.  The rising edge is the frame's start.
+        """
+        self._backend.write(self._high)
+
+    def frame_end(self):
+        """
+        Called after a window flip.
+        """
+        self._backend.write(self._low)
+
+    def close(self):
+        self._backend.close()
 
     def package(self):
         return super(SyncPulse, self).package()
@@ -75,7 +233,17 @@ class SyncSquare(visual.GratingStim, EObject):
     """
     A small square that can be used to flash black to white at a specified
         frequency.
+
+    Updates are grouped into segments started with `start_segment`.  When a
+        segment's length is known, the color for each of its vsyncs is
+        precomputed, and `setColor` is only called on frames where the color
+        changes.  The vsync and color of every update are kept in a numpy
+        array, preallocated for the segment's length if it is known, so that
+        `expected_edges` can build the table of color changes the photodiode
+        should see, even when frames are skipped.
     """
+    # updates preallocated for a segment of unknown length, doubled as needed
+    OPEN_SEGMENT_CAPACITY = 3600
 
     def __init__(self,
                  window,
@@ -100,12 +268,119 @@ class SyncSquare(visual.GratingStim, EObject):
         self.seq_length = len(self.colorSequence)
         self.index = 0
 
+        self._shown = 0
+        self._schedule = None
+        # name, frequency, (2, capacity) array of the vsync updated on and the
+        #   color index shown for each update, number of updates
+        self._segment = None
+        self._segments = []
+
+    def start_segment(self, name, frames=None, frequency=None):
+        """
+        Starts a new segment of updates.  Vsyncs start over from 0.
+
+        Args:
+            name (str): segment name for the expected edge table.
+            frames (int): number of vsyncs in the segment.  If None, the
+                color is worked out as the square is updated, and the record
+                of updates grows as needed.
+            frequency (int): half period for this segment.  Defaults to
+                `frequency`.
+
+        """
+        self.end_segment()
+        frequency = frequency or self.frequency
+        capacity = self.OPEN_SEGMENT_CAPACITY
+        if frames is not None:
+            self._schedule = sync_square_schedule(frames, frequency,
+                                                  self.seq_length, self.index)
+            capacity = frames
+        record = np.empty((2, max(capacity, 1)), dtype=np.int64)
+        self._segment = [name, frequency, record, 0]
+
+    def end_segment(self):
+        """
+        Ends the current segment.  The next one carries on from the color
+            the square last moved on from.
+        """
+        segment, self._segment = self._segment, None
+        schedule, self._schedule = self._schedule, None
+        if segment is None or segment[3] == 0:
+            return
+        name, frequency, record, count = segment
+        record = record[:, :count].copy()
+        if schedule is not None:
+            self.index = (int(record[1, -1]) + 1) % self.seq_length
+        self._segments.append((name, frequency, record))
+
     def update(self, vsync):
-        if vsync % self.frequency == 0:
-            self.setColor(self.colorSequence[self.index])
-            self.index += 1
-            if self.index >= self.seq_length:
-                self.index = 0
+        segment = self._segment
+        if segment is None:
+            self.start_segment("")
+            segment = self._segment
+
+        index = self._shown
+        if self._schedule is not None:
+            if vsync < len(self._schedule):
+                index = self._schedule[vsync]
+        elif vsync % segment[1] == 0:
+            index = self.index
+            self.index = (index + 1) % self.seq_length
+
+        record, count = segment[2], segment[3]
+        if count == record.shape[1]:
+            record = segment[2] = np.concatenate(
+                (record, np.empty_like(record)), axis=1)
+        record[0, count] = vsync
+        record[1, count] = index
+        segment[3] = count + 1
+
+        if index != self._shown:
+            self.setColor(self.colorSequence[index])
+            self._shown = index
         self.draw()
 
+    def expected_edges(self):
+        """
+        Color changes the square showed, for aligning photodiode edges.
+            Ends the current segment.
+
+        Returns:
+            dict: "frame" is the update each color change happened on,
+                counting every update of every segment, "vsync" is the
+                vsync it was shown on within its segment, and "color" is the
+                color shown from then on.  "segments" has the name, first
+                frame, number of updates, first vsync and frequency of each
+                segment.
 
+        """
+        self.end_segment()
+        indices = [np.zeros(0, dtype=np.int64)]
+        vsyncs = [np.zeros(0, dtype=np.int64)]
+        names, starts, lengths, firsts, frequencies = [], [], [], [], []
+        frame = 0
+        for name, frequency, record in self._segments:
+            vsyncs.append(record[0])
+            indices.append(record[1])
+            names.append(name)
+            starts.append(frame)
+            lengths.append(record.shape[1])
+            firsts.append(record[0, 0])
+            frequencies.append(frequency)
+            frame += lengths[-1]
+        frames, colors = sync_square_edges(np.concatenate(indices),
+                                           self.colorSequence)
+        starts = np.array(starts, dtype=np.int64)
+        return {
+            'frame': frames,
+            'vsync': np.concatenate(vsyncs)[frames],
+            'color': colors,
+            'segment': np.searchsorted(starts, frames, side="right") - 1,
+            'segments': {
+                'name': names,
+                'start': starts,
+                'frames': np.array(lengths, dtype=np.int64),
+                'vsync': np.array(firsts, dtype=np.int64),
+                'frequency': np.array(frequencies, dtype=np.int64),
+            },
+        }
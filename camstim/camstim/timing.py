@@ -0,0 +1,555 @@
+"""
+timing.py
+
+Frame timing instrumentation.
+
+`FrameProfiler` timestamps the phases of every frame into a preallocated
+    numpy array, so we can tell where the time went when frames drop.
+
+`FrameIntervals` records the time between flips.  It keeps running statistics
+    as it goes, and computes dropped frames, histograms and percentiles over
+    the whole buffer with numpy.
+
+`FrameScheduler` compares flip times to the ideal timeline and decides which
+    frame to show next, skipping frames to catch up after drops if asked to.
+
+`GCControl` keeps the cyclic garbage collector out of the frame loop, and
+    `allocation_counter` lets `FrameProfiler` count allocations per phase
+    instead of time.
+
+"""
+import gc
+import math
+from timeit import default_timer
+
+import numpy as np
+
+
+def _do_nothing(*args):
+    pass
+
+
+class FrameProfiler(object):
+    """
+    Timestamps the phases of each frame.
+
+    Args:
+        phases (iterable): names of the phases of a frame, in the order they
+            run.
+        frames (int): number of frames to preallocate for.  The arrays grow
+            if more frames are recorded.
+        enabled (bool): when False, recording does nothing and no frames are
+            preallocated.
+        clock (callable): high-resolution clock in seconds.  Any counter
+            works, see `allocation_counter`.
+        scale (float): multiplier from clock units to reported units.
+        units (str): name of the reported units.
+
+    Call `start` at the beginning of a frame, `mark` with the index of each
+        phase as it finishes, and `stop` at the end.  Phases that don't run on
+        a frame (stimuli during blank periods) should be marked anyway, they
+        just take no time.
+
+    """
+    def __init__(self, phases, frames=0, enabled=True, clock=default_timer,
+                 scale=1000.0, units="ms"):
+        self.phases = list(phases)
+        self.enabled = enabled
+        self.scale = scale
+        self.units = units
+        self._clock = clock
+        # nothing is recorded when disabled, so nothing is preallocated
+        frames = max(frames, 1) if enabled else 0
+        # column 0 is the frame start, column i + 1 the end of phase i
+        self._timestamps = np.zeros((frames, len(self.phases) + 1))
+        self._blank = np.zeros(frames, dtype=bool)
+        self._row = None
+        self.frame_count = 0
+        if not enabled:
+            # keep the frame loop free of checks when profiling is off
+            self.start = self.mark = self.stop = _do_nothing
+
+    def start(self, blank=False):
+        """
+        Starts a frame.
+
+        Args:
+            blank (bool): whether this is a blank period frame.
+
+        """
+        if self.frame_count == len(self._timestamps):
+            self._grow()
+        self._row = self._timestamps[self.frame_count]
+        self._row[0] = self._clock()
+        self._blank[self.frame_count] = blank
+
+    def mark(self, phase):
+        """
+        Marks the end of a phase.
+
+        Args:
+            phase (int): phase index.
+
+        """
+        self._row[phase + 1] = self._clock()
+
+    def stop(self):
+        """
+        Ends the frame.
+        """
+        self.frame_count += 1
+
+    def _grow(self):
+        self._timestamps = np.concatenate(
+            (self._timestamps, np.zeros_like(self._timestamps)))
+        self._blank = np.concatenate((self._blank,
+                                      np.zeros_like(self._blank)))
+
+    @property
+    def timestamps(self):
+        """
+        (frames, phases + 1) array of timestamps for the recorded frames.
+        """
+        return self._timestamps[:self.frame_count]
+
+    @property
+    def blank(self):
+        """
+        Whether each recorded frame was a blank period frame.
+        """
+        return self._blank[:self.frame_count]
+
+    def durations(self):
+        """
+        (frames, phases) array of phase durations in clock units.
+        """
+        return np.diff(self.timestamps, axis=1)
+
+    def summary(self, percentiles=(50, 90, 99, 100)):
+        """
+        Percentiles of each phase's duration in reported units.
+
+        Returns:
+            dict: {phase: [percentile values]}
+
+        """
+        durations = self.durations() * self.scale
+        if len(durations) == 0:
+            return {}
+        values = np.percentile(durations, percentiles, axis=0)
+        return {phase: values[:, i].tolist()
+                for i, phase in enumerate(self.phases)}
+
+    def summary_text(self, percentiles=(50, 90, 99, 100)):
+        """
+        Summary as a table, one phase per line.
+        """
+        summary = self.summary(percentiles)
+        header = "{:>14}".format("phase (%s)" % self.units) + "".join(
+            "{:>9}".format("p%s" % p) for p in percentiles)
+        lines = [header]
+        for phase in self.phases:
+            if phase in summary:
+                lines.append("{:>14}".format(phase) + "".join(
+                    "{:9.3f}".format(v) for v in summary[phase]))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        """
+        Plain dictionary of the recorded timings for output files.
+        """
+        return {
+            'phases': self.phases,
+            'timestamps': self.timestamps.copy(),
+            'blank': self.blank.copy(),
+            'units': self.units,
+            'summary': self.summary(),
+        }
+
+
+class FrameIntervals(object):
+    """
+    Growable float64 buffer of frame intervals in seconds.
+
+    Behaves enough like the list psychopy keeps in `Window.frameIntervals`
+        (append, len, iteration, indexing, numpy conversion) to replace it.
+        Mean, standard deviation, min and max are updated as intervals are
+        appended, so they can be read mid-session without touching the
+        buffer.
+
+    Args:
+        intervals (iterable): initial intervals.
+        capacity (int): number of intervals to preallocate for.  The buffer
+            doubles in size when it fills up.
+
+    """
+    def __init__(self, intervals=(), capacity=3600):
+        self._buffer = np.empty(max(capacity, 1), dtype=np.float64)
+        self.clear()
+        self.extend(intervals)
+
+    def clear(self):
+        """
+        Removes all intervals.
+        """
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def append(self, interval):
+        """
+        Appends an interval, updating the running statistics.
+        """
+        if self._count == len(self._buffer):
+            self._grow(self._count + 1)
+        self._buffer[self._count] = interval
+        self._count += 1
+        # Welford's algorithm
+        delta = interval - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (interval - self._mean)
+        if interval < self.min:
+            self.min = interval
+        if interval > self.max:
+            self.max = interval
+
+    def extend(self, intervals):
+        """
+        Appends several intervals.
+        """
+        for interval in intervals:
+            self.append(interval)
+
+    def _grow(self, needed):
+        size = len(self._buffer)
+        while size < needed:
+            size *= 2
+        buffer = np.empty(size, dtype=np.float64)
+        buffer[:self._count] = self._buffer[:self._count]
+        self._buffer = buffer
+
+    @property
+    def values(self):
+        """
+        View of the recorded intervals.  Not a copy, so it is only valid
+            until the next append.
+        """
+        return self._buffer[:self._count]
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.values
+        return self.values.astype(dtype)
+
+    def __repr__(self):
+        return repr(self.values.tolist())
+
+    def tolist(self):
+        return self.values.tolist()
+
+    @property
+    def mean(self):
+        return self._mean if self._count else np.nan
+
+    @property
+    def std(self):
+        """
+        Population standard deviation, as `numpy.std`.
+        """
+        return np.sqrt(self._m2 / self._count) if self._count else np.nan
+
+    def running_stats(self):
+        """
+        Statistics so far, without copying the buffer.
+
+        Returns:
+            dict: count, mean, std, min and max in seconds.
+
+        """
+        return {
+            'count': self._count,
+            'mean': self.mean,
+            'std': self.std,
+            'min': self.min if self._count else np.nan,
+            'max': self.max if self._count else np.nan,
+        }
+
+    def dropped(self, threshold=None, factor=1.5):
+        """
+        Indices of dropped frames.
+
+        Args:
+            threshold (float): intervals longer than this are drops.  Defaults
+                to `factor` times the mean interval.
+            factor (float): multiple of the mean used when no threshold is
+                given.
+
+        """
+        if threshold is None:
+            threshold = factor * self.mean
+        return np.flatnonzero(self.values > threshold)
+
+    def histogram(self, bins=50, range=None):
+        """
+        Histogram of the intervals.  See `numpy.histogram`.
+        """
+        return np.histogram(self.values, bins=bins, range=range)
+
+    def percentiles(self, q=(50, 90, 99, 100)):
+        """
+        Percentiles of the intervals.
+        """
+        if not self._count:
+            return np.full(len(q), np.nan)
+        return np.percentile(self.values, q)
+
+
+def frame_interval_stats(intervals, drop_factor=1.5,
+                         percentiles=(50, 90, 99, 100)):
+    """
+    Summary statistics of a sequence of frame intervals.
+
+    Args:
+        intervals (array-like): frame intervals, in any unit.
+        drop_factor (float): intervals longer than this multiple of the mean
+            count as dropped frames.
+        percentiles (iterable): percentiles to report.
+
+    Returns:
+        dict: mean, std, total, dropped (indices), percentiles.
+
+    """
+    intervals = np.asarray(intervals, dtype=np.float64)
+    total = len(intervals)
+    if total == 0:
+        return {
+            'mean': np.nan,
+            'std': np.nan,
+            'total': 0,
+            'dropped': np.array([], dtype=np.intp),
+            'percentiles': np.full(len(percentiles), np.nan),
+        }
+    mean = intervals.mean()
+    return {
+        'mean': mean,
+        'std': intervals.std(),
+        'total': total,
+        'dropped': np.flatnonzero(intervals > drop_factor * mean),
+        'percentiles': np.percentile(intervals, percentiles),
+    }
+
+
+FRAME_POLICIES = ("keep", "skip", "skip_blank")
+
+
+class FrameScheduler(object):
+    """
+    Paces frames against the ideal timeline.
+
+    Args:
+        total_frames (int): number of frames in the session.
+        fps (float): display refresh rate.
+        policy (str): what to do when flips fall behind the timeline.
+            "keep": show every frame, so the session runs long.
+            "skip": skip frames to get back on the timeline.
+            "skip_blank": only skip frames that are blank.
+        blank (array-like): bool for each frame, True where the frame is blank.
+            Only used by "skip_blank".
+
+    Every frame that falls further behind is logged, with the number of
+        frames skipped to recover, so that analysis can realign.  Frames that
+        "skip_blank" catches up on later are logged too.
+
+    """
+    def __init__(self, total_frames, fps, policy="keep", blank=None):
+        if policy not in FRAME_POLICIES:
+            raise ValueError("Frame policy must be one of {}, not {}".format(
+                FRAME_POLICIES, policy))
+        if policy == "skip_blank" and blank is None:
+            raise ValueError("skip_blank policy needs a blank frame mask")
+        self.total_frames = total_frames
+        self.period = 1.0 / fps
+        self.policy = policy
+        self.blank = None if blank is None else np.asarray(blank, dtype=bool)
+        self._origin = None
+        self._lag = 0
+        self._log = []
+
+    def next_frame(self, frame, flip_time):
+        """
+        Frame to show after `frame`.
+
+        Args:
+            frame (int): frame that was just shown.
+            flip_time (float): time its flip completed, in seconds.
+
+        """
+        if self._origin is None:
+            self._origin = flip_time - frame * self.period
+        lag = int(math.floor((flip_time - self._origin) / self.period + 0.5)
+                  ) - frame
+        next_frame = frame + 1
+        if lag <= self._lag and not self._can_catch_up(next_frame, lag):
+            self._lag = lag
+            return next_frame
+        skip = 0
+        if self.policy == "skip":
+            skip = lag
+        elif self.policy == "skip_blank":
+            upcoming = self.blank[next_frame:next_frame + lag]
+            skip = len(upcoming) if upcoming.all() else int(
+                np.argmin(upcoming))
+        skip = max(min(skip, self.total_frames - next_frame), 0)
+        self._log.append((frame, flip_time, lag, skip))
+        self._lag = lag - skip
+        return next_frame + skip
+
+    def _can_catch_up(self, next_frame, lag):
+        """
+        Whether frames still behind the timeline can be skipped now.  With
+            "skip_blank", a lag from a drop during content is made up once
+            the blank frames after it come up.
+        """
+        return (self.policy == "skip_blank" and lag > 0 and
+                next_frame < self.total_frames and self.blank[next_frame])
+
+    @property
+    def skipped_frames(self):
+        """
+        Total number of frames skipped so far.
+        """
+        return sum(entry[3] for entry in self._log)
+
+    def to_dict(self):
+        """
+        Plain dictionary of the recovery log for output files.  Each entry is
+            a frame that fell behind: the frame, its flip time, how many frames
+            behind it was and how many frames were skipped after it.
+        """
+        log = np.array(self._log, dtype=np.float64).reshape(-1, 4)
+        return {
+            'policy': self.policy,
+            'frame': log[:, 0].astype(np.int64),
+            'flip_time': log[:, 1],
+            'lag': log[:, 2].astype(np.int64),
+            'skipped': log[:, 3].astype(np.int64),
+        }
+
+
+GC_MODES = ("auto", "blank")
+
+
+class GCControl(object):
+    """
+    Controls when the cyclic garbage collector runs.
+
+    Args:
+        mode (str): "auto" leaves the collector alone.  "blank" disables it
+            while stimuli are presented and only collects when `collect` or
+            `idle` is called, during blank periods and splash screens.
+        clock (callable): clock used to time collections, in seconds.
+
+    `idle` collects the same generations python would: the youngest once
+        enough objects are allocated, and an older one once the generation
+        before it has been collected often enough.  Cyclic garbage that
+        survives into the older generations is still freed in long sessions.
+
+    Every collection this makes is recorded with its reason, generation,
+        duration and the number of objects collected.
+
+    """
+    def __init__(self, mode="auto", clock=default_timer):
+        if mode not in GC_MODES:
+            raise ValueError("GC mode must be one of {}, not {}".format(
+                GC_MODES, mode))
+        self.mode = mode
+        self.enabled = mode != "auto"
+        self._clock = clock
+        self._was_enabled = None
+        self._thresholds = gc.get_threshold()
+        self._log = []
+        if not self.enabled:
+            self.freeze = self.restore = self.idle = _do_nothing
+            self.collect = _do_nothing
+
+    def freeze(self):
+        """
+        Collects everything, then disables automatic collection.
+        """
+        if self._was_enabled is None:
+            self._was_enabled = gc.isenabled()
+        self.collect(2, "freeze")
+        gc.disable()
+
+    def restore(self):
+        """
+        Collects everything, then puts automatic collection back the way it
+            was before `freeze`.
+        """
+        if self._was_enabled is not None:
+            self.collect(2, "restore")
+        if self._was_enabled:
+            gc.enable()
+        self._was_enabled = None
+
+    def collect(self, generation=2, reason=""):
+        """
+        Runs a timed collection.
+        """
+        start = self._clock()
+        collected = gc.collect(generation)
+        self._log.append((reason, generation, self._clock() - start,
+                          collected))
+
+    def idle(self, reason="blank"):
+        """
+        Runs the collection python would have run by now, if any: the oldest
+            generation whose count has reached its threshold.  Call when a
+            frame has time to spare.
+        """
+        counts = gc.get_count()
+        for generation in (2, 1, 0):
+            if counts[generation] >= self._thresholds[generation]:
+                self.collect(generation, reason)
+                return
+
+    @property
+    def collections(self):
+        return len(self._log)
+
+    def to_dict(self):
+        """
+        Plain dictionary of the collections made, for output files.
+        """
+        return {
+            'mode': self.mode,
+            'reason': [entry[0] for entry in self._log],
+            'generation': np.array([e[1] for e in self._log], dtype=np.int8),
+            'duration': np.array([e[2] for e in self._log], dtype=np.float64),
+            'collected': np.array([e[3] for e in self._log], dtype=np.int64),
+        }
+
+
+def allocation_counter():
+    """
+    Net number of container objects allocated since the last collection.
+        Passed to `FrameProfiler` as the clock, with the collector disabled,
+        it counts allocations per phase.
+
+    Python 2 has no tracemalloc, so only objects tracked by the garbage
+        collector (lists, dicts, tuples, instances...) are counted, and
+        deallocations are subtracted.  Objects reused from python's free lists
+        aren't counted either, so this is a lower bound.
+    """
+    return gc.get_count()[0]
@@ -0,0 +1,355 @@
+"""
+warpmesh.py
+
+Meshes for `window.Window`'s warped projections.
+
+A warp is drawn as a grid of `cols` x `rows` vertices, each with a texture
+    coordinate into the rendered frame.  Meshes are built as arrays with one
+    entry per grid point, and an index array of two triangles per grid cell,
+    so each vertex is stored once and the mesh is drawn with
+    `glDrawElements`.
+
+Each cell (y, x) is split along the same diagonal a GL_QUADS quad with
+    corners (y, x), (y, x + 1), (y + 1, x + 1), (y + 1, x) is split into
+    triangles, so the warped output is unchanged.
+
+The perspective projections can also be drawn per pixel with
+    `WARP_FRAGMENT_SHADER`, which computes the same mapping as
+    `projection_texcoords` for every fragment of a single quad.
+
+Warpfiles are parsed in one pass with numpy, and the parsed grid is kept
+    in a .npz file next to the warpfile, which is used for as long as the
+    warpfile's modification time and hash are unchanged.
+
+"""
+import hashlib
+import logging
+import os
+import uuid
+
+import numpy as np
+
+PROJECTIONS = ("spherical", "cylindrical", "curvilinear")
+
+
+def grid_indices(cols, rows):
+    """
+    Triangle indices for a grid of vertices.
+
+    Args:
+        cols (int): vertices per row.
+        rows (int): number of rows.
+
+    Returns:
+        numpy.ndarray: uint32 vertex indices, six per grid cell.
+
+    """
+    cells = np.arange((rows - 1) * cols, dtype=np.uint32).reshape(rows - 1,
+                                                                  cols)
+    a = cells[:, :-1].ravel()  # (y, x)
+    b = a + 1                  # (y, x + 1)
+    c = a + cols + 1           # (y + 1, x + 1)
+    d = a + cols               # (y + 1, x)
+    return np.column_stack((a, b, c, a, c, d)).ravel()
+
+
+def quad_mesh():
+    """
+    Single quad covering the window, with no correction.
+
+    Returns:
+        tuple: vertices, texture coordinates and indices.
+
+    """
+    vertices = np.array([(-1.0, -1.0), (-1.0, 1.0), (1.0, 1.0), (1.0, -1.0)],
+                        'float32')
+    tcoords = np.array([(0.0, 0.0), (0.0, 1.0), (1.0, 1.0), (1.0, 0.0)],
+                       'float32')
+    indices = np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32)
+    return vertices, tcoords, indices
+
+
+def projection_mesh(cols, rows, width_cm, height_cm, dist_cm,
+                    eyepoint=(0.5, 0.5), projection="spherical"):
+    """
+    Mesh that corrects perspective on a flat screen.
+
+    Args:
+        cols (int): grid vertices per row.
+        rows (int): grid rows.
+        width_cm (float): monitor width.
+        height_cm (float): monitor height.
+        dist_cm (float): distance from the eye to the monitor.
+        eyepoint (tuple): position of the eye in normalized coordinates.
+        projection (str): "spherical", "cylindrical" or "curvilinear".
+
+    Returns:
+        tuple: float32 vertices and texture coordinates with one row per grid
+            point, and the triangle indices.
+
+    """
+    if projection not in PROJECTIONS:
+        raise ValueError("Unknown projection: {}".format(projection))
+
+    # eye position in cm
+    xEye = eyepoint[0] * width_cm
+    yEye = eyepoint[1] * height_cm
+
+    # vertex points are spaced equal distances apart
+    equalDistanceX = np.linspace(0, width_cm, cols)
+    equalDistanceY = np.linspace(0, height_cm, rows)
+
+    # vertex coordinates
+    x_c = np.linspace(-1.0, 1.0, cols)
+    y_c = np.linspace(-1.0, 1.0, rows)
+    x_coords, y_coords = np.meshgrid(x_c, y_c)
+
+    x = np.zeros((rows, cols), dtype='float32')
+    y = np.zeros((rows, cols), dtype='float32')
+
+    x[:, :] = equalDistanceX - xEye
+    y[:, :] = (equalDistanceY - yEye)[:, np.newaxis]
+
+    u_coords, v_coords = projection_texcoords(x, y, width_cm, height_cm,
+                                              dist_cm, projection)
+
+    vertices = np.column_stack((x_coords.ravel(), y_coords.ravel()))
+    tcoords = np.column_stack((u_coords.ravel(), v_coords.ravel()))
+    return (vertices.astype('float32'), tcoords.astype('float32'),
+            grid_indices(cols, rows))
+
+
+def projection_texcoords(x, y, width_cm, height_cm, dist_cm,
+                         projection="spherical"):
+    """
+    Texture coordinates for points on the screen.
+
+    Args:
+        x (numpy.ndarray): horizontal distance of each point from the eye.
+        y (numpy.ndarray): vertical distance of each point from the eye.
+        width_cm (float): monitor width.
+        height_cm (float): monitor height.
+        dist_cm (float): distance from the eye to the monitor.
+        projection (str): "spherical", "cylindrical" or "curvilinear".
+
+    Returns:
+        tuple: u and v texture coordinate arrays.
+
+    """
+    r = np.sqrt(np.square(x) + np.square(y) + np.square(dist_cm))
+
+    azimuth = np.arctan(x / dist_cm)
+    altitude = np.arcsin(y / r)
+
+    # calculate the texture coordinates
+    if projection == "cylindrical":
+        tx = dist_cm * np.sin(azimuth)
+        ty = dist_cm * np.sin(altitude)
+    else:
+        tx = dist_cm * (1 + x / r) - dist_cm
+        ty = dist_cm * (1 + y / r) - dist_cm
+
+    # prevent div0
+    azimuth[azimuth == 0] = np.finfo(np.float32).eps
+    altitude[altitude == 0] = np.finfo(np.float32).eps
+
+    # the texture coordinates (which are now lying on the sphere)
+    # need to be remapped back onto the plane of the display.
+    # This effectively stretches the coordinates away from the eyepoint.
+    if projection == "spherical":
+        centralAngle = np.arccos(np.cos(altitude) * np.cos(np.abs(azimuth)))
+        # distance from eyepoint to texture vertex
+        arcLength = centralAngle * dist_cm
+        # remap the texture coordinate
+        theta = np.arctan2(ty, tx)
+        tx = arcLength * np.cos(theta)
+        ty = arcLength * np.sin(theta)
+    else:
+        tx = tx * azimuth / np.sin(azimuth)
+        ty = ty * altitude / np.sin(altitude)
+
+    u_coords = tx / width_cm + 0.5
+    v_coords = ty / height_cm + 0.5
+    return u_coords, v_coords
+
+
+def warpfile_mesh(warpdata, cols, rows):
+    """
+    Mesh from the data in a warpfile.
+
+    Args:
+        warpdata (numpy.ndarray): one row per grid point, with the vertex
+            position, texture coordinate and opacity.
+        cols (int): grid vertices per row.
+        rows (int): grid rows.
+
+    Returns:
+        tuple: float32 vertices, texture coordinates and RGBA opacity with
+            one row per grid point, and the triangle indices.
+
+    """
+    vertices = warpdata[:, 0:2].astype('float32')
+    tcoords = warpdata[:, 2:4].astype('float32')
+    # opacity is RGBA
+    opacity = np.ones((len(warpdata), 4), dtype='float32')
+    opacity[:, 3] = warpdata[:, 4]
+    return vertices, tcoords, opacity, grid_indices(cols, rows)
+
+
+def parse_warpfile(text):
+    """
+    Parses the text of a warpfile.
+
+    The first line is the file type, which must be 2.  The second is the
+        number of columns and rows in the grid.  Each line after that is a
+        grid point: vertex x and y, texture u and v, and opacity.
+
+    Args:
+        text (str): contents of the warpfile.
+
+    Returns:
+        tuple: cols, rows and the (cols * rows, 5) warp data.
+
+    Raises:
+        ValueError: if the file is badly formed or doesn't match its grid.
+
+    """
+    lines = text.split("\n", 2)
+    if len(lines) < 3:
+        raise ValueError("warpfile is missing its header")
+    try:
+        filetype = int(lines[0])
+        cols, rows = [int(v) for v in lines[1].split()]
+    except ValueError:
+        raise ValueError("warpfile header is incorrect")
+    if filetype != 2:
+        raise ValueError("unsupported warpfile type: {}".format(filetype))
+    if cols < 2 or rows < 2:
+        raise ValueError("warpfile grid is too small: {} x {}".format(cols,
+                                                                     rows))
+    warpdata = np.fromstring(lines[2], dtype=np.float64, sep=" ")
+    if warpdata.size != cols * rows * 5:
+        raise ValueError("warpfile has {} values, expected {} for a {} x {} "
+                         "grid".format(warpdata.size, cols * rows * 5, cols,
+                                       rows))
+    if not np.all(np.isfinite(warpdata)):
+        raise ValueError("warpfile has values that aren't numbers")
+    return cols, rows, warpdata.reshape(cols * rows, 5)
+
+
+def read_warpfile(path, sidecar=True):
+    """
+    Reads a warpfile, using its .npz sidecar if it is up to date.
+
+    Args:
+        path (str): warpfile path.
+        sidecar (bool): read and maintain the sidecar at `path` + ".npz".
+
+    Returns:
+        tuple: cols, rows and the (cols * rows, 5) warp data.
+
+    Raises:
+        ValueError: if the file is badly formed or doesn't match its grid.
+        IOError: if the file can't be read.
+
+    """
+    with open(path, "rb") as f:
+        text = f.read()
+    mtime = os.path.getmtime(path)
+    digest = hashlib.sha1(text).hexdigest()
+    sidecar_path = path + ".npz"
+
+    if sidecar and os.path.isfile(sidecar_path):
+        try:
+            with np.load(sidecar_path) as cached:
+                if (float(cached['mtime']) == mtime and
+                        str(cached['sha1']) == digest):
+                    cols, rows = [int(v) for v in cached['grid']]
+                    return cols, rows, cached['warpdata']
+        except (IOError, OSError, KeyError, ValueError) as e:
+            logging.warning("Ignoring warpfile sidecar %s: %s",
+                            sidecar_path, e)
+
+    cols, rows, warpdata = parse_warpfile(text)
+    if sidecar:
+        _save_sidecar(sidecar_path, grid=np.array([cols, rows]),
+                      warpdata=warpdata, mtime=np.float64(mtime),
+                      sha1=np.array(digest))
+    return cols, rows, warpdata
+
+
+def _save_sidecar(path, **arrays):
+    # write to a temporary file first so that readers never see a partial
+    #   sidecar
+    temp = "%s.%s.tmp" % (path, uuid.uuid4().hex)
+    try:
+        with open(temp, "wb") as f:
+            np.savez(f, **arrays)
+        if os.path.exists(path):
+            os.remove(path)  # rename doesn't replace files on windows
+        os.rename(temp, path)
+    except (IOError, OSError) as e:
+        logging.warning("Failed to save warpfile sidecar %s: %s", path, e)
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+WARP_VERTEX_SHADER = """
+void main() {
+    gl_FrontColor = gl_Color;
+    gl_TexCoord[0] = gl_MultiTexCoord0;
+    gl_Position = ftransform();
+}
+"""
+
+# Same steps as `projection_texcoords`.  `projection` is the index of the
+#   projection in PROJECTIONS.  The texture coordinate of the full screen quad
+#   is the position on the display, from (0, 0) lower left to (1, 1).
+WARP_FRAGMENT_SHADER = """
+uniform sampler2D texture;
+uniform vec2 eyepoint;
+uniform vec3 geometry;  // width_cm, height_cm, dist_cm
+uniform int projection;
+
+const float EPS = 1.1920929e-07;
+
+void main() {
+    float width = geometry.x;
+    float height = geometry.y;
+    float dist = geometry.z;
+    vec2 pos = (gl_TexCoord[0].st - eyepoint) * vec2(width, height);
+    float x = pos.x;
+    float y = pos.y;
+
+    float r = sqrt(x * x + y * y + dist * dist);
+    float azimuth = atan(x / dist);
+    float altitude = asin(y / r);
+
+    float tx;
+    float ty;
+    if (projection == 1) {
+        tx = dist * sin(azimuth);
+        ty = dist * sin(altitude);
+    } else {
+        tx = dist * (1.0 + x / r) - dist;
+        ty = dist * (1.0 + y / r) - dist;
+    }
+
+    if (azimuth == 0.0) azimuth = EPS;
+    if (altitude == 0.0) altitude = EPS;
+
+    if (projection == 0) {
+        float centralAngle = acos(cos(altitude) * cos(abs(azimuth)));
+        float arcLength = centralAngle * dist;
+        float theta = atan(ty, tx);
+        tx = arcLength * cos(theta);
+        ty = arcLength * sin(theta);
+    } else {
+        tx = tx * azimuth / sin(azimuth);
+        ty = ty * altitude / sin(altitude);
+    }
+
+    vec2 uv = vec2(tx / width + 0.5, ty / height + 0.5);
+    gl_FragColor = texture2D(texture, uv) * gl_Color;
+}
+"""
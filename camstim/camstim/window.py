@@ -92,6 +92,27 @@ from OpenGL.arrays import ArrayDatatype as ADT
 from psychopy import visual, monitors
 import ConfigParser
 
+from timing import FrameIntervals
+from warpmesh import quad_mesh, projection_mesh, warpfile_mesh, \
+    read_warpfile, PROJECTIONS, WARP_VERTEX_SHADER, WARP_FRAGMENT_SHADER
+from cache import get_warp_cache
+
+# Packs the three DLP180Hz subframes into one RGB frame.  Each subframe goes
+#   to the channel the projector shows it in: green, then red, then blue.
+SUBFRAME_FRAGMENT_SHADER = """
+uniform sampler2D subframe0;
+uniform sampler2D subframe1;
+uniform sampler2D subframe2;
+
+void main() {
+    vec2 uv = gl_TexCoord[0].st;
+    gl_FragColor = vec4(texture2D(subframe1, uv).r,
+                        texture2D(subframe0, uv).g,
+                        texture2D(subframe2, uv).b,
+                        1.0);
+}
+"""
+
 # DW Set up default monitor
 test_mon = monitors.Monitor("testMonitor")
 if not test_mon.getSizePix():
@@ -111,6 +132,11 @@ class Warp(tuple):
     Cylindrical = 2
     Curvilinear = 3
     Warpfile = 4
+    SphericalShader = 5
+    CylindricalShader = 6
+    CurvilinearShader = 7
+
+    Shaders = (SphericalShader, CylindricalShader, CurvilinearShader)
 
     # this is so ugly, how to do Enums prior to Python3?
     @staticmethod
@@ -120,6 +146,9 @@ class Warp(tuple):
          if warp == Warp.Cylindrical: return 'Cylindrical'
          if warp == Warp.Curvilinear: return 'Curvilinear'
          if warp == Warp.Warpfile: return 'Warpfile'
+         if warp == Warp.SphericalShader: return 'SphericalShader'
+         if warp == Warp.CylindricalShader: return 'CylindricalShader'
+         if warp == Warp.CurvilinearShader: return 'CurvilinearShader'
          return 'Invalid warp value'
 
 class Window(visual.Window):
@@ -133,6 +162,11 @@ class Window(visual.Window):
         Projector.Normal -no frame packing, use this for LCD displays (default)
         Projector.DLP180Hz - pack 3 (grayscale) images into one RGB output frame.
             This allows structured light projectors to produce 180Hz monochrome stimulus from 60Hz display cards.
+            Each flip() is one subframe.  Subframes are rendered into their own
+            textures and combined into the output frame in one shader pass on
+            every third flip.  'subframes' and 'subframeRate' tell stimuli to
+            build their schedules at 180 fps.  'frameIntervals' has one entry
+            per subframe and 'refreshIntervals' one per hardware frame.
 
     warp: defines the warping projection to be applied. Values can be:
         Warp.Disabled - no correction, same as default PsychoPy projection
@@ -141,6 +175,10 @@ class Window(visual.Window):
         Warp.Curvilinear - correct using curvilinear projection. This is spatially less accurate than Spherical or Cylindrical.
         Warp.Warpfile - use the warp file provided in the warpfile argument.  
             'eyepoint' is ignored in this mode.
+        Warp.SphericalShader, Warp.CylindricalShader, Warp.CurvilinearShader -
+            same projections, computed for every pixel in a fragment shader
+            instead of on the warp grid.  Changing 'eyepoint' only updates
+            the shader's uniforms.
 
     warpfile: defines the file to use when warp == Warp.Warpfile
 
@@ -154,16 +192,22 @@ class Window(visual.Window):
 
     flipVertical: if True, flip the entire warp vertically.
         Default is false.
+
+    warpCache: if True, warp meshes are saved to disk and memory mapped the
+        next time a window with the same warp and display geometry is created.
+        Default is True.
     '''
 
     def __init__(self, projectorType=Projector.Normal, warp=Warp.Disabled, warpfile = None, warpGridsize = 300, eyepoint=(0.5, 0.5), 
-                flipHorizontal=False, flipVertical=False, *args,**kwargs):
+                flipHorizontal=False, flipVertical=False, warpCache=True, *args,**kwargs):
         self.projectorType = projectorType
         self.warp = warp
         self.warpfile = warpfile
         self._eyepoint = eyepoint
         self.flipHorizontal = flipHorizontal
         self.flipVertical = flipVertical
+        self.warpCache = warpCache
+        self._warpProgram = None
         self.flipCounter = 0
         self.aspect = 1
         self.isPsychoPyV180OrAbove = (psychopy.__version__ >= '1.80')
@@ -172,9 +216,17 @@ class Window(visual.Window):
         self.bitsMode = None
 
         self.flipEvery3rdFrame = False
+        self.subframes = 1
+        self.subframeRate = None
         if self.projectorType == Projector.DLP180Hz:
             self.flipEvery3rdFrame = True
+            self.subframes = 3
+            self.subframeRate = 180.0
             #self._monitorFrameRate = None
+        self._subframeTextures = []
+        self._subframeProgram = None
+        self.refreshIntervals = FrameIntervals()
+        self._lastRefreshT = None
 
         # if 'checkTiming' is True, 
         # then flip will be called before window creation,
@@ -186,10 +238,18 @@ class Window(visual.Window):
         else:
             visual.Window.__init__(self, *args,**kwargs)
 
+        # preallocated interval buffer with running statistics in place of
+        #   psychopy's list
+        self.frameIntervals = FrameIntervals(self.frameIntervals)
+
         # if packing 3 images into one HDMI frame...
         if self.projectorType == Projector.DLP180Hz:
-            self._refreshThreshold = 1.2 / 180
-            GL.glColorMask(False, False, True, True)
+            # dropped frames are counted on hardware refreshes, not subframes
+            self._refreshThreshold = 1.2 / 60
+            if self.useFBO:
+                self._setupSubframes()
+            else:
+                GL.glColorMask(False, False, True, True)
             
         # if warping the output
         #   get the eye distance from the monitor object,
@@ -212,6 +272,96 @@ class Window(visual.Window):
         self.setupProjection(warp, warpfile, eyepoint)
         self._setupMouse()
 
+    def saveFrameIntervals(self, fileName=None, clear=True):
+        """
+        Saves frame intervals to a file, clearing our buffer rather than
+            letting psychopy replace it with a list.
+        """
+        intervals = self.frameIntervals
+        visual.Window.saveFrameIntervals(self, fileName, clear)
+        if clear:
+            intervals.clear()
+            self.frameIntervals = intervals
+            self.refreshIntervals.clear()
+            self._lastRefreshT = None
+
+    def _setupSubframes(self):
+        '''
+        Creates a texture for each DLP180Hz subframe, and the shader that
+        packs them into the frame texture.
+        '''
+        w, h = self.size
+        self._subframeTextures = []
+        for i in range(self.subframes):
+            texture = GL.GLuint()
+            GL.glGenTextures(1, ctypes.byref(texture))
+            GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+            # same format as psychopy's frame texture
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA32F_ARB, int(w), int(h), 0,
+                            GL.GL_RGBA, GL.GL_FLOAT, None)
+            self._subframeTextures.append(texture)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        self._subframeProgram = _shaders.compileProgram(WARP_VERTEX_SHADER,
+                                                        SUBFRAME_FRAGMENT_SHADER)
+        GL.glUseProgram(self._subframeProgram)
+        for i in range(self.subframes):
+            name = "subframe{}".format(i)
+            location = GL.glGetUniformLocation(self._subframeProgram, name)
+            GL.glUniform1i(location, i)
+        GL.glUseProgram(0)
+
+        # anything drawn during window creation is discarded
+        self.flipCounter = 0
+        GL.glColorMask(True, True, True, True)
+        self._attachRenderTexture(self._subframeTextures[0])
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+
+    def _attachRenderTexture(self, texture):
+        ''' Renders into `texture` while the frame buffer object is bound. '''
+        GL.glFramebufferTexture2DEXT(GL.GL_FRAMEBUFFER_EXT, GL.GL_COLOR_ATTACHMENT0_EXT,
+                                     GL.GL_TEXTURE_2D, texture, 0)
+
+    def _compositeSubframes(self):
+        '''
+        Packs the subframe textures into the frame texture in one pass.
+        '''
+        self._attachRenderTexture(self.frameTexture)
+        GL.glUseProgram(self._subframeProgram)
+        GL.glDisable(GL.GL_BLEND)
+        for i, texture in enumerate(self._subframeTextures):
+            GL.glActiveTexture(GL.GL_TEXTURE0 + i)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glPushMatrix()
+        GL.glLoadIdentity()
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+        GL.glPushMatrix()
+        GL.glLoadIdentity()
+
+        GL.glBegin(GL.GL_QUADS)
+        GL.glTexCoord2f(0.0, 0.0); GL.glVertex2f(-1.0, -1.0)
+        GL.glTexCoord2f(0.0, 1.0); GL.glVertex2f(-1.0, 1.0)
+        GL.glTexCoord2f(1.0, 1.0); GL.glVertex2f(1.0, 1.0)
+        GL.glTexCoord2f(1.0, 0.0); GL.glVertex2f(1.0, -1.0)
+        GL.glEnd()
+
+        GL.glPopMatrix()
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glPopMatrix()
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+
+        # cleanup
+        for i in reversed(range(len(self._subframeTextures))):
+            GL.glActiveTexture(GL.GL_TEXTURE0 + i)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glUseProgram(0)
+
     def _setupMouse(self):
         self.winHandle.set_exclusive_mouse()
         self.winHandle.set_exclusive_keyboard()
@@ -255,274 +405,161 @@ class Window(visual.Window):
             self.projectionCurvilinear()
         elif self.warp == Warp.Warpfile:
             self.projectionWarpfile()
+        elif self.warp == Warp.SphericalShader:
+            self.projectionShader("spherical")
+        elif self.warp == Warp.CylindricalShader:
+            self.projectionShader("cylindrical")
+        elif self.warp == Warp.CurvilinearShader:
+            self.projectionShader("curvilinear")
 
     def projectionNone(self):
         '''
         No correction, same projection as original PsychoPy
         '''
-        # Vertex data 
-        v0 = ( -1.0, -1.0)
-        v1 = ( -1.0,  1.0)
-        v2 = (  1.0,  1.0)
-        v3 = (  1.0, -1.0)
-        
-        # Texture coordinates
-        t0 = ( 0.0, 0.0)
-        t1 = ( 0.0, 1.0)
-        t2 = ( 1.0, 1.0)
-        t3 = ( 1.0, 0.0)
-        
-        vertices = np.array( [ v0, v1, v2, v3 ], 'float32' )
-        tcoords = np.array( [ t0, t1, t2, t3 ], 'float32' )
+        vertices, tcoords, indices = quad_mesh()
 
-        #draw four quads during rendering loop
-        self.nverts = 4  
-        self.createVertexAndTextureBuffers (vertices, tcoords)        
+        #draw one quad during rendering loop
+        self.nverts = 4
+        self.createVertexAndTextureBuffers (vertices, tcoords, indices=indices)
 
     def projectionSphericalOrCylindrical(self, isCylindrical=False):
         '''
         Correct perspective on flat screen using either a spherical or cylindrical projection.
         '''
-        self.nverts = (self.xgrid-1)*(self.ygrid-1)*4
-
-        # eye position in cm
-        xEye = self._eyepoint[0] * self.mon_width_cm
-        yEye = self._eyepoint[1] * self.mon_height_cm
-
-        #create vertex grid array, and texture coords
-        #times 4 for quads
-        vertices = np.zeros(((self.xgrid-1)*(self.ygrid-1)*4, 2),dtype='float32')
-        tcoords = np.zeros(((self.xgrid-1)*(self.ygrid-1)*4, 2),dtype='float32')
-
-        equalDistanceX = np.linspace(0, self.mon_width_cm, self.xgrid)
-        equalDistanceY = np.linspace(0, self.mon_height_cm, self.ygrid)
-
-        # vertex coordinates        
-        x_c = np.linspace(-1.0,1.0,self.xgrid)
-        y_c = np.linspace(-1.0,1.0,self.ygrid)
-        x_coords, y_coords = np.meshgrid(x_c,y_c)
-
-        x = np.zeros(((self.xgrid), (self.ygrid)),dtype='float32')
-        y = np.zeros(((self.xgrid), (self.ygrid)),dtype='float32')
-
-        x[:,:] = equalDistanceX - xEye
-        y[:,:] = equalDistanceY - yEye
-        y = np.transpose(y)
-
-        r = np.sqrt(np.square(x) + np.square(y) + np.square(self.dist_cm))
-
-        azimuth = np.arctan(x / self.dist_cm)
-        altitude = np.arcsin(y / r)
-
-        # calculate the texture coordinates
-        if isCylindrical:
-            tx = self.dist_cm * np.sin(azimuth)
-            ty = self.dist_cm * np.sin(altitude)
-        else:
-            tx = self.dist_cm * (1 + x / r)- self.dist_cm
-            ty = self.dist_cm * (1 + y / r) - self.dist_cm
-
-        # prevent div0
-        azimuth[azimuth==0] = np.finfo(np.float32).eps
-        altitude[altitude==0] = np.finfo(np.float32).eps
-
-        # the texture coordinates (which are now lying on the sphere)
-        # need to be remapped back onto the plane of the display.
-        # This effectively stretches the coordinates away from the eyepoint.
-   
         if isCylindrical:
-            tx = tx * azimuth / np.sin(azimuth) 
-            ty = ty * altitude / np.sin(altitude)
+            projection = "cylindrical"
         else:
-            centralAngle = np.arccos (np.cos(altitude) * np.cos(np.abs(azimuth)))
-            # distance from eyepoint to texture vertex
-            arcLength = centralAngle * self.dist_cm
-            # remap the texture coordinate
-            theta = np.arctan2(ty, tx)
-            tx = arcLength * np.cos(theta)
-            ty = arcLength * np.sin(theta)
-
-        u_coords = tx / self.mon_width_cm + 0.5
-        v_coords = ty / self.mon_height_cm + 0.5
-
-        #loop to create quads
-        vdex = 0
-        for y in xrange(0,self.ygrid-1):
-            for x in xrange(0,self.xgrid-1):
-                index = y*(self.xgrid) + x
-                
-                vertices[vdex+0,0] = x_coords[y,x]
-                vertices[vdex+0,1] = y_coords[y,x]
-                vertices[vdex+1,0] = x_coords[y,x+1]
-                vertices[vdex+1,1] = y_coords[y,x+1]
-                vertices[vdex+2,0] = x_coords[y+1,x+1]
-                vertices[vdex+2,1] = y_coords[y+1,x+1]
-                vertices[vdex+3,0] = x_coords[y+1,x]
-                vertices[vdex+3,1] = y_coords[y+1,x]
-                
-                tcoords[vdex+0,0] = u_coords[y,x]
-                tcoords[vdex+0,1] = v_coords[y,x]
-                tcoords[vdex+1,0] = u_coords[y,x+1]
-                tcoords[vdex+1,1] = v_coords[y,x+1]
-                tcoords[vdex+2,0] = u_coords[y+1,x+1]
-                tcoords[vdex+2,1] = v_coords[y+1,x+1]
-                tcoords[vdex+3,0] = u_coords[y+1,x]
-                tcoords[vdex+3,1] = v_coords[y+1,x]
-                
-                vdex += 4
-        self.createVertexAndTextureBuffers (vertices, tcoords)        
+            projection = "spherical"
+        self.projectionMesh(projection)
 
-        
     def projectionCurvilinear (self):
         '''
         Correct perspective on flat screen using curvilinear projection.
         http://en.wikipedia.org/wiki/Curvilinear_perspective 
         '''
-        self.nverts = (self.xgrid-1)*(self.ygrid-1)*4
-
-        # eye position in cm
-        xEye = self._eyepoint[0] * self.mon_width_cm
-        yEye = self._eyepoint[1] * self.mon_height_cm
+        self.projectionMesh("curvilinear")
 
-        # create vertex grid array, and texture coords times 4 for quads
-        vertices = np.zeros(((self.xgrid-1)*(self.ygrid-1)*4, 2),dtype='float32')
-        tcoords = np.zeros(((self.xgrid-1)*(self.ygrid-1)*4, 2),dtype='float32')
-        
-        # vertex points are spaced equal distances apart
-        equalDistanceX = np.linspace(0, self.mon_width_cm, self.xgrid)
-        equalDistanceY = np.linspace(0, self.mon_height_cm, self.ygrid)
-
-        # vertex coordinates        
-        x_c = np.linspace(-1.0,1.0,self.xgrid)
-        y_c = np.linspace(-1.0,1.0,self.ygrid)
-        x_coords, y_coords = np.meshgrid(x_c,y_c)
-
-        x = np.zeros(((self.xgrid), (self.ygrid)),dtype='float32')
-        y = np.zeros(((self.xgrid), (self.ygrid)),dtype='float32')
-
-        x[:,:] = equalDistanceX - xEye 
-        y[:,:] = equalDistanceY - yEye 
-        y = np.transpose(y)
-
-        r = np.sqrt(np.square(x) + np.square(y) + np.square(self.dist_cm))
-        azimuth = np.arctan(x / self.dist_cm)
-        altitude = np.arcsin(y / r)
-
-        tx = self.dist_cm * (1 + x / r)- self.dist_cm
-        ty = self.dist_cm * (1 + y / r) - self.dist_cm
-        
-        # prevent div0
-        azimuth[azimuth==0] = np.finfo(np.float32).eps
-        altitude[altitude==0] = np.finfo(np.float32).eps
-
-        # map texture onto the x, y plane
-        tx = tx * azimuth / np.sin(azimuth) 
-        ty = ty * altitude / np.sin(altitude)
-
-        u_coords = tx / self.mon_width_cm + 0.5
-        v_coords = ty / self.mon_height_cm + 0.5
-
-        #loop to create quads
-        vdex = 0
-        for y in xrange(0,self.ygrid-1):
-            for x in xrange(0,self.xgrid-1):
-                index = y*(self.xgrid) + x
-                
-                vertices[vdex+0,0] = x_coords[y,x]
-                vertices[vdex+0,1] = y_coords[y,x]
-                vertices[vdex+1,0] = x_coords[y,x+1]
-                vertices[vdex+1,1] = y_coords[y,x+1]
-                vertices[vdex+2,0] = x_coords[y+1,x+1]
-                vertices[vdex+2,1] = y_coords[y+1,x+1]
-                vertices[vdex+3,0] = x_coords[y+1,x]
-                vertices[vdex+3,1] = y_coords[y+1,x]
-                
-                tcoords[vdex+0,0] = u_coords[y,x]
-                tcoords[vdex+0,1] = v_coords[y,x]
-                tcoords[vdex+1,0] = u_coords[y,x+1]
-                tcoords[vdex+1,1] = v_coords[y,x+1]
-                tcoords[vdex+2,0] = u_coords[y+1,x+1]
-                tcoords[vdex+2,1] = v_coords[y+1,x+1]
-                tcoords[vdex+3,0] = u_coords[y+1,x]
-                tcoords[vdex+3,1] = v_coords[y+1,x]
-                
-                vdex += 4
-
-        self.createVertexAndTextureBuffers (vertices, tcoords)        
-        
+    def projectionMesh(self, projection):
+        '''
+        Builds the warp grid for `projection` as an indexed triangle mesh.
+        '''
+        key = self._warpCacheKey(projection)
+        mesh = self._loadWarpMesh(key)
+        if mesh is None:
+            vertices, tcoords, indices = projection_mesh(
+                self.xgrid, self.ygrid, self.mon_width_cm, self.mon_height_cm,
+                self.dist_cm, self._eyepoint, projection)
+            mesh = dict(vertices=vertices, tcoords=tcoords, indices=indices)
+            self._saveWarpMesh(key, mesh)
+        self.nverts = self.xgrid*self.ygrid
+        self.createVertexAndTextureBuffers (mesh['vertices'], mesh['tcoords'], indices=mesh['indices'])
+
+    def projectionShader(self, projection):
+        '''
+        Draws one quad and does the projection per pixel in a fragment shader.
+        '''
+        self.projectionNone()
+        if self._warpProgram is None:
+            self._warpProgram = _shaders.compileProgram(WARP_VERTEX_SHADER,
+                                                        WARP_FRAGMENT_SHADER)
+        self._warpProjection = projection
+        self.setWarpUniforms()
+
+    def setWarpUniforms(self):
+        '''
+        Passes the eyepoint and display geometry to the warp shader.
+        '''
+        program = self._warpProgram
+        GL.glUseProgram(program)
+        GL.glUniform1i(GL.glGetUniformLocation(program, "texture"), 0)
+        GL.glUniform2f(GL.glGetUniformLocation(program, "eyepoint"),
+                       self._eyepoint[0], self._eyepoint[1])
+        GL.glUniform3f(GL.glGetUniformLocation(program, "geometry"),
+                       self.mon_width_cm, self.mon_height_cm, self.dist_cm)
+        GL.glUniform1i(GL.glGetUniformLocation(program, "projection"),
+                       PROJECTIONS.index(self._warpProjection))
+        GL.glUseProgram(0)
 
     def projectionWarpfile (self):
         ''' Use a warp definition file to create the projection.
             See: http://paulbourke.net/dome/warpingfisheye/ 
         '''
+        key = self._warpCacheKey("warpfile")
+        mesh = self._loadWarpMesh(key)
+        if mesh is None:
+            mesh = self._readWarpfile()
+            if mesh is None:
+                return
+            self._saveWarpMesh(key, mesh)
+
+        self.xgrid, self.ygrid = [int(v) for v in mesh['grid']]
+        self.nverts = self.xgrid*self.ygrid
+
+        self.createVertexAndTextureBuffers (mesh['vertices'], mesh['tcoords'], mesh['opacity'], mesh['indices'])
+
+    def _readWarpfile(self):
+        ''' Reads the warpfile into a mesh.  Returns None if it is invalid. '''
         try:
-            fh = open (self.warpfile)
-            lines = fh.readlines()
-            fh.close()
-            filetype = int(lines[0])
-            rc = map(int, lines[1].split())
-            cols, rows = rc[0], rc[1]
-            warpdata = np.loadtxt(self.warpfile, skiprows=2)
-        except:
-            error = 'Unable to read warpfile: ' + self.warpfile
+            cols, rows, warpdata = read_warpfile(self.warpfile)
+        except (IOError, OSError, TypeError) as e:
+            error = 'Unable to read warpfile: %s (%s)' % (self.warpfile, e)
             logging.warning(error)
             print error
             return
-
-        if (cols * rows != warpdata.shape[0] or warpdata.shape[1] != 5 or filetype != 2 ):
-            error = 'warpfile data incorrect: ' + self.warpfile
+        except ValueError as e:
+            error = 'warpfile data incorrect: %s (%s)' % (self.warpfile, e)
             logging.warning(error)
             print error
             return
 
-        self.xgrid = cols
-        self.ygrid = rows
-          
-        self.nverts = (self.xgrid-1)*(self.ygrid-1)*4
-
-        # create vertex grid array, and texture coords times 4 for quads
-        vertices = np.zeros(((self.xgrid-1)*(self.ygrid-1)*4, 2),dtype='float32')
-        tcoords = np.zeros(((self.xgrid-1)*(self.ygrid-1)*4, 2),dtype='float32')
-        # opacity is RGBA
-        opacity = np.ones(((self.xgrid-1)*(self.ygrid-1)*4,4),dtype='float32')
-
-        #loop to create quads
-        vdex = 0
-        for y in xrange(0,self.ygrid-1):
-            for x in xrange(0,self.xgrid-1):
-                index = y*(self.xgrid) + x
-                
-                vertices[vdex+0,0] = warpdata[index,0]          #x_coords[y,x]
-                vertices[vdex+0,1] = warpdata[index,1]          #y_coords[y,x]
-                vertices[vdex+1,0] = warpdata[index+1,0]        #x_coords[y,x+1]
-                vertices[vdex+1,1] = warpdata[index+1,1]        #y_coords[y,x+1]
-                vertices[vdex+2,0] = warpdata[index+cols+1,0]   #x_coords[y+1,x+1]
-                vertices[vdex+2,1] = warpdata[index+cols+1,1]   #y_coords[y+1,x+1]
-                vertices[vdex+3,0] = warpdata[index+cols,0]     #x_coords[y+1,x]
-                vertices[vdex+3,1] = warpdata[index+cols,1]     #y_coords[y+1,x]
-                
-                tcoords[vdex+0,0] = warpdata[index,2]           # u_coords[y,x]
-                tcoords[vdex+0,1] = warpdata[index,3]           # v_coords[y,x]
-                tcoords[vdex+1,0] = warpdata[index+1,2]         # u_coords[y,x+1]
-                tcoords[vdex+1,1] = warpdata[index+1,3]         # v_coords[y,x+1]
-                tcoords[vdex+2,0] = warpdata[index+cols+1,2]    # u_coords[y+1,x+1]
-                tcoords[vdex+2,1] = warpdata[index+cols+1,3]    # v_coords[y+1,x+1]
-                tcoords[vdex+3,0] = warpdata[index+cols,2]      # u_coords[y+1,x]
-                tcoords[vdex+3,1] = warpdata[index+cols,3]      # v_coords[y+1,x]
-                
-                opacity[vdex,3] = warpdata[index, 4]
-                opacity[vdex+1,3] = warpdata[index+1, 4]
-                opacity[vdex+2,3] = warpdata[index+cols+1, 4]
-                opacity[vdex+3,3] = warpdata[index+cols, 4]
+        vertices, tcoords, opacity, indices = warpfile_mesh(warpdata, cols, rows)
+        return dict(vertices=vertices, tcoords=tcoords, opacity=opacity,
+                    indices=indices, grid=np.array([cols, rows]))
 
-                vdex += 4
+    def _warpCacheKey(self, projection):
+        '''
+        Cache key for a warp mesh, from the display geometry it is built
+            for.  None if the mesh shouldn't be cached.
+        '''
+        if not self.warpCache:
+            return None
+        parts = [projection, [float(v) for v in self._eyepoint],
+                 float(self.dist_cm), float(self.mon_width_cm),
+                 float(self.mon_height_cm), [int(v) for v in self.size],
+                 self.xgrid, self.ygrid]
+        if projection == "warpfile":
+            try:
+                stat = os.stat(self.warpfile)
+            except (OSError, TypeError):
+                return None
+            parts += [os.path.abspath(self.warpfile), stat.st_mtime,
+                      stat.st_size]
+        return get_warp_cache().key("warp", *parts)
+
+    def _loadWarpMesh(self, key):
+        ''' Memory maps a cached warp mesh.  None if it isn't cached. '''
+        if key is None:
+            return None
+        mesh = get_warp_cache().load(key)
+        if mesh is not None:
+            logging.info('Loaded cached warp mesh: %s' % key)
+        return mesh
 
-        self.createVertexAndTextureBuffers (vertices, tcoords, opacity)        
-        
+    def _saveWarpMesh(self, key, mesh):
+        if key is not None:
+            get_warp_cache().save(key, mesh)
 
-    def createVertexAndTextureBuffers(self, vertices, tcoords, opacity = None):
-        ''' Allocate hardware buffers for vertices, texture coordinates, and optionally opacity '''
 
+    def createVertexAndTextureBuffers(self, vertices, tcoords, opacity = None, indices = None):
+        ''' Allocate hardware buffers for vertices, texture coordinates, triangle indices, and optionally opacity '''
+
+        if indices is None:
+            # vertices are already a list of triangles
+            indices = np.arange(len(vertices), dtype=np.uint32)
+
+        if self.flipHorizontal or self.flipVertical:
+            # copy, so cached meshes aren't flipped
+            vertices = np.array(vertices)
         if self.flipHorizontal:
             vertices[:,0] = -vertices[:,0]
         if self.flipVertical:
@@ -552,6 +589,14 @@ class Window(visual.Window):
         else:
             self.gl_color = None    
 
+        #triangle indices in hardware, so shared vertices are only stored once
+        self.gl_ib = GL.GLuint()
+        GL.glGenBuffers(1 , self.gl_ib)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.gl_ib)
+        GL.glBufferData(GL.GL_ELEMENT_ARRAY_BUFFER, ADT.arrayByteCount(indices), ADT.voidDataPointer(indices), GL.GL_STATIC_DRAW)
+        self.nindices = len(indices)
+
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
 
         GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
@@ -566,7 +611,10 @@ class Window(visual.Window):
         #GL.glMatrixMode(GL.GL_PROJECTION)
         #GL.glLoadIdentity()
 
-        GL.glUseProgram(0)
+        if self._warpProgram is not None and self.warp in Warp.Shaders:
+            GL.glUseProgram(self._warpProgram)
+        else:
+            GL.glUseProgram(0)
             
         #point to color (opacity)
         if self.gl_color is not None:
@@ -591,10 +639,12 @@ class Window(visual.Window):
         #GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
         #GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
 
-        #draw quads
-        GL.glDrawArrays (GL.GL_QUADS, 0, self.nverts)
+        #draw triangles
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.gl_ib)
+        GL.glDrawElements(GL.GL_TRIANGLES, self.nindices, GL.GL_UNSIGNED_INT, None)
 
         # cleanup
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
         GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
         GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
         GL.glDisableClientState(GL.GL_TEXTURE_COORD_ARRAY)
@@ -616,7 +666,8 @@ class Window(visual.Window):
         global currWindow
 
         # Pack multiple frames into one VSync!
-        if (self.flipEvery3rdFrame):
+        #   subframe textures are cleared as they become the render target
+        if self.flipEvery3rdFrame and not self._subframeTextures:
             clearBuffer = (self.flipCounter %3 == 2)
 
         # decide whether to really perform a hardware flip
@@ -627,6 +678,9 @@ class Window(visual.Window):
 
         if self.useFBO:
             if flipThisFrame:
+                if self._subframeTextures:
+                    self._compositeSubframes()
+
                 if self.isPsychoPyV180OrAbove:
                     GL.glUseProgram(self._progFBOtoFrame)
                 #need blit the frambuffer object to the actual back buffer
@@ -706,6 +760,11 @@ class Window(visual.Window):
                 GL.glActiveTexture(GL.GL_TEXTURE0)
                 GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
 
+            if self._subframeTextures:
+                # the next subframe renders into its own texture
+                subframe = (self.flipCounter + 1) % self.subframes
+                self._attachRenderTexture(self._subframeTextures[subframe])
+
         #rescale/reposition view of the window
         if self.viewScale is not None:
             GL.glMatrixMode(GL.GL_PROJECTION)
@@ -733,7 +792,9 @@ class Window(visual.Window):
             GL.glClear(GL.GL_COLOR_BUFFER_BIT)
 
         # Pack multiple frames into one VSync!
-        if (self.flipEvery3rdFrame):
+        if self._subframeTextures:
+            self.flipCounter += 1
+        elif (self.flipEvery3rdFrame):
             self.flipCounter += 1
             if self.flipCounter %3 == 0:
                 GL.glColorMask(False, True, False, True)       # rgba
@@ -744,7 +805,11 @@ class Window(visual.Window):
                 clearBuffer = True
 
         #waitBlanking
-        if self.waitBlanking and ((not self.flipEvery3rdFrame) or (clearBuffer and self.flipEvery3rdFrame)):
+        if self._subframeTextures:
+            waitThisFrame = flipThisFrame
+        else:
+            waitThisFrame = (not self.flipEvery3rdFrame) or (clearBuffer and self.flipEvery3rdFrame)
+        if self.waitBlanking and waitThisFrame:
             GL.glBegin(GL.GL_POINTS)
             GL.glColor4f(0, 0, 0, 0)
             if sys.platform == 'win32' and self.glVendor.startswith('ati'):
@@ -770,9 +835,19 @@ class Window(visual.Window):
             self.lastFrameT = now
             if self.recordFrameIntervalsJustTurnedOn:  # don't do anything
                 self.recordFrameIntervalsJustTurnedOn = False
+                self._lastRefreshT = now if flipThisFrame else None
             else:  # past the first frame since turned on
                 self.frameIntervals.append(deltaT)
-                if deltaT > self._refreshThreshold:
+                if self.subframes > 1:
+                    # subframes between refreshes don't wait for the display,
+                    #   so only hardware refreshes can be dropped
+                    deltaT = None
+                    if flipThisFrame:
+                        if self._lastRefreshT is not None:
+                            deltaT = now - self._lastRefreshT
+                            self.refreshIntervals.append(deltaT)
+                        self._lastRefreshT = now
+                if deltaT is not None and deltaT > self._refreshThreshold:
                     self.nDroppedFrames += 1
                     if self.nDroppedFrames < reportNDroppedFrames:
                         logging.warning('t of last frame was %.2fms (=1/%i)' %
@@ -808,7 +883,12 @@ class Window(visual.Window):
 
     @eyepoint.setter
     def eyepoint(self, value):
-        self.setupProjection(self.warp, self.warpfile, value)
+        if self.warp in Warp.Shaders and self._warpProgram is not None:
+            # nothing to rebuild
+            self._eyepoint = value
+            self.setWarpUniforms()
+        else:
+            self.setupProjection(self.warp, self.warpfile, value)
 
     def get_config(self):
         """
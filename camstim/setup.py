@@ -27,7 +27,8 @@ setup(
     ],
     entry_points = {
         'console_scripts': [
-            'camstim_agent = camstim.zro.agent:main'
+            'camstim_agent = camstim.zro.agent:main',
+            'camstim_cache = camstim.cache:main',
         ],
     },
     include_package_data=True,
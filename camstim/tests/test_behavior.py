@@ -1,3 +1,78 @@
 """
 test_behavior.py
 """
+import gc
+from collections import OrderedDict
+
+import pytest
+
+from camstim.behavior import Behavior
+from camstim.timing import GCControl
+
+
+class Switch(object):
+    """
+    Stand-in for a visual object that is turned on and off by the task.
+    """
+    def __init__(self):
+        self._on = True
+
+    def update(self, index=None):
+        pass
+
+
+class FakeWindow(object):
+    def flip(self):
+        pass
+
+
+class FakeSyncSquare(object):
+    def start_segment(self, name, frames=None, frequency=None):
+        pass
+
+    def update(self, vsync):
+        pass
+
+
+def make_garbage(count=2000):
+    for _ in range(count):
+        cycle = []
+        cycle.append(cycle)
+
+
+@pytest.fixture
+def behavior():
+    behavior = object.__new__(Behavior)
+    behavior.items = OrderedDict()
+    behavior.encoders, behavior.rewards, behavior.lick_sensors = [], [], []
+    behavior.update_count = 0
+    behavior.auto_update = False
+    behavior.stimuli = OrderedDict([("stimulus", Switch())])
+    behavior.sync_sqr = FakeSyncSquare()
+    behavior.window = FakeWindow()
+    behavior._keys = None
+    behavior._gc = GCControl("blank")
+    was_enabled = gc.isenabled()
+    behavior._gc.freeze()
+    yield behavior
+    behavior._gc.restore()
+    assert gc.isenabled() == was_enabled
+
+
+def test_blank_gc_mode_collects(behavior):
+    assert behavior._gc.to_dict()['reason'] == ["freeze"]
+
+    # nothing is collected while the stimulus is showing
+    make_garbage()
+    for index in range(10):
+        behavior.update(index)
+    assert behavior._gc.collections == 1
+
+    behavior.stimuli["stimulus"]._on = False
+    behavior.update(10)
+    assert behavior._gc.to_dict()['reason'] == ["freeze", "blank"]
+
+    make_garbage()
+    behavior._splash()
+    assert behavior._gc.to_dict()['reason'][-1] == "splash"
+    assert not gc.isenabled()
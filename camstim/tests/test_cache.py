@@ -0,0 +1,63 @@
+"""
+test_cache.py
+
+Tests the on-disk warp mesh cache.
+
+"""
+import os
+
+import numpy as np
+import pytest
+
+from camstim.cache import ArrayCache, get_warp_cache, MAX_WARP_CACHE_MB
+from camstim.warpmesh import projection_mesh
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return ArrayCache(str(tmpdir.join("cache")))
+
+
+def test_key():
+    order = np.arange(10, dtype=np.int32)
+    key = ArrayCache.key("schedule", order, (30, None))
+    assert key == ArrayCache.key("schedule", order.copy(), (30, None))
+    assert key != ArrayCache.key("schedule", order[::-1], (30, None))
+    assert key != ArrayCache.key("schedule", order, (30, 0))
+
+
+def test_round_trip(cache):
+    arrays = {'starts': np.array([0, 20]), 'lengths': np.array([10, 5])}
+    key = cache.key("arrays", 1)
+    assert cache.load(key) is None
+    cache.save(key, arrays)
+    loaded = cache.load(key)
+    assert sorted(loaded.keys()) == ['lengths', 'starts']
+    for name in arrays:
+        np.testing.assert_array_equal(loaded[name], arrays[name])
+    assert [e[0] for e in cache.entries()] == [key]
+
+
+def test_eviction(cache):
+    keys = [cache.key(i) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.save(key, {'data': np.zeros(1024)})
+        os.utime(os.path.join(cache.path, key), (i, i))
+    cache.load(keys[0])  # most recently used now
+    size = cache.entries()[0][1]
+    evicted = cache.trim(max_mb=2.5*size/1024.0**2)
+    assert evicted == [keys[1]]
+    assert cache.purge() and cache.entries() == []
+
+
+def test_warp_mesh(cache):
+    vertices, tcoords, indices = projection_mesh(30, 20, 51.0, 31.875, 15.0)
+    key = cache.key("warp", "spherical", [0.5, 0.5], 15.0, 51.0, 31.875,
+                    [1920, 1200], 30, 20)
+    cache.save(key, dict(vertices=vertices, tcoords=tcoords, indices=indices))
+    mesh = cache.load(key)
+    assert isinstance(mesh['vertices'], np.memmap)
+    np.testing.assert_array_equal(mesh['vertices'], vertices)
+    np.testing.assert_array_equal(mesh['tcoords'], tcoords)
+    np.testing.assert_array_equal(mesh['indices'], indices)
+    assert get_warp_cache().max_mb == MAX_WARP_CACHE_MB
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from camstim.commands import (Command, CommandLog, CommandTable,
+                              parse_commands)
+
+
+class Child(object):
+    def __init__(self):
+        self.ori = 0.0
+        self.pos = np.zeros(2)
+        self._secret = 1
+
+
+class Root(object):
+    def __init__(self):
+        self.stimuli = [Child(), Child()]
+        self.child = Child()
+        self.name = "root"
+        self.calls = []
+
+    def pause(self, *args):
+        self.calls.append(args)
+        return len(args)
+
+
+@pytest.mark.parametrize("data, expected", [
+    ("SET child.ori 45", [Command("SET", "child.ori", 45)]),
+    ("SET name 'abc'", [Command("SET", "name", "abc")]),
+    ("GET child.ori", [Command("GET", "child.ori", None)]),
+    ("RUN pause", [Command("RUN", "pause", None)]),
+    ("RUN pause 1, 'a'", [Command("RUN", "pause", [1, "a"])]),
+    ('{"cmd": "set", "target": "child.ori", "value": 45}',
+     [Command("SET", "child.ori", 45)]),
+    ('[{"cmd": "SET", "target": "stimuli.1.ori", "value": 1.5},'
+     ' {"cmd": "RUN", "target": "pause", "args": [2]}]',
+     [Command("SET", "stimuli.1.ori", 1.5), Command("RUN", "pause", [2])]),
+])
+def test_parse_commands(data, expected):
+    assert parse_commands(data) == expected
+
+
+@pytest.mark.parametrize("data", [
+    "SET child.ori",
+    "SET child.ori __import__('os')",
+    "JUMP child.ori 1",
+    '{"cmd": "SET"}',
+    '"SET"',
+])
+def test_parse_commands_invalid(data):
+    with pytest.raises((ValueError, SyntaxError)):
+        parse_commands(data)
+
+
+def test_command_table():
+    root = Root()
+    table = CommandTable(root, strict=False)
+
+    assert table.execute(Command("SET", "child.ori", 45)) == 45.0
+    assert isinstance(root.child.ori, float)
+    assert table.execute(Command("SET", "stimuli.1.ori", 2)) == 2.0
+    assert root.stimuli[1].ori == 2.0 and root.stimuli[0].ori == 0.0
+    table.execute(Command("SET", "child.pos", [1, 2]))
+    assert isinstance(root.child.pos, np.ndarray)
+    assert table.execute(Command("GET", "name", None)) == "root"
+    assert table.execute(Command("RUN", "pause", [1, 2])) == 2
+    assert root.calls == [(1, 2)]
+
+    with pytest.raises(AttributeError):
+        table.execute(Command("SET", "child._secret", 2))
+    with pytest.raises(AttributeError):
+        table.execute(Command("SET", "child.missing", 2))
+    with pytest.raises(TypeError):
+        table.execute(Command("SET", "child.ori", "abc"))
+
+
+def test_command_table_strict():
+    root = Root()
+    table = CommandTable(root)
+    with pytest.raises(KeyError):
+        table.execute(Command("SET", "child.ori", 1))
+    table.register_attribute("child.ori")
+    table.register_method("stop", root.pause)
+    table.execute(Command("SET", "child.ori", 1))
+    table.execute(Command("RUN", "stop", None))
+    assert root.child.ori == 1.0
+    assert root.calls == [()]
+
+
+def test_command_log():
+    log = CommandLog()
+    log.append(10, Command("SET", "child.ori", 45), 45.0)
+    log.append(12, Command("RUN", "pause", None), None, ok=False)
+    data = log.to_dict()
+    assert len(log) == 2
+    assert data["vsync"].tolist() == [10, 12]
+    assert data["name"].tolist() == ["SET", "RUN"]
+    assert data["ok"].tolist() == [True, False]
+
+
+def test_command_table_replaced_owner():
+    root = Root()
+    table = CommandTable(root)
+    table.register_attribute("stimuli.1.ori")
+    table.register_method("stimuli.1.pos.fill")
+    root.stimuli[1] = Child()
+    table.execute(Command("SET", "stimuli.1.ori", 3))
+    table.execute(Command("RUN", "stimuli.1.pos.fill", [7]))
+    assert root.stimuli[1].ori == 3.0
+    assert root.stimuli[1].pos.tolist() == [7, 7]
@@ -0,0 +1,81 @@
+import logging
+import threading
+
+from camstim.logqueue import AsyncLogging
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+def make_logger(name, level=logging.NOTSET):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = ListHandler(level)
+    logger.handlers = [handler]
+    return logger, handler
+
+
+def test_async_logging_writes_in_order():
+    logger, handler = make_logger("test_async_logging", logging.INFO)
+    with AsyncLogging(logger) as async_logging:
+        assert async_logging.running
+        assert logger.handlers != [handler]
+        for i in range(100):
+            logger.info("record %s", i)
+        logger.debug("filtered")
+    assert not async_logging.running
+    assert logger.handlers == [handler]
+    assert handler.messages == ["record %s" % i for i in range(100)]
+
+
+def test_async_logging_drops_when_full():
+    logger, handler = make_logger("test_async_logging_full")
+    writing, gate = threading.Event(), threading.Event()
+    emit = handler.emit
+    handler.emit = lambda record: (writing.set(), gate.wait(), emit(record))
+    async_logging = AsyncLogging(logger, maxsize=1)
+    async_logging.start()
+    async_logging.start()  # no-op
+    logger.info("record 0")
+    writing.wait(5.0)
+    for i in range(1, 100):
+        logger.info("record %s", i)
+    gate.set()
+    async_logging.stop()
+    async_logging.stop()  # no-op
+    # one record is being written, one is queued, the rest are dropped
+    assert async_logging.dropped == {"INFO": 98}
+    assert handler.messages[-1].startswith("Dropped 98 log records")
+    assert len(handler.messages) == 3
+
+
+def test_async_logging_without_handlers():
+    logger = logging.getLogger("test_async_logging_none")
+    logger.handlers = []
+    with AsyncLogging(logger) as async_logging:
+        assert not async_logging.running
+
+
+def test_async_logging_snapshots_arguments():
+    logger, handler = make_logger("test_async_logging_snapshot")
+    writing, gate = threading.Event(), threading.Event()
+    emit = handler.emit
+    handler.emit = lambda record: (writing.set(), gate.wait(), emit(record))
+    trial = {"trial": 1}
+    with AsyncLogging(logger):
+        logger.info("start")
+        writing.wait(5.0)
+        # both records are queued while the writer is blocked
+        logger.info("Trial data: %s", trial)
+        logger.info("%s", trial)
+        trial["trial"] = 2
+        gate.set()
+    assert handler.messages == ["start", "Trial data: {'trial': 1}",
+                                "{'trial': 1}"]
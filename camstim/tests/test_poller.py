@@ -0,0 +1,48 @@
+import socket
+import time
+
+from camstim.poller import InputPoller
+
+
+def test_input_poller_drains_in_order():
+    poller = InputPoller()
+    received = []
+    poller.register("key", lambda key: received.append(("key", key)))
+    poller.register("command", lambda cmd: received.append(("command", cmd)))
+
+    poller.put("key", "a")
+    poller.put("command", ["RUN", "stop"])
+    poller.put("unknown", None)
+    poller.drain(12)
+
+    assert received == [("key", "a"), ("command", ["RUN", "stop"])]
+    assert [l[:2] for l in poller.latencies] == [("key", 12), ("command", 12)]
+    assert all(l[2] >= 0 for l in poller.latencies)
+
+    poller.drain(13)
+    assert len(received) == 2
+
+
+def test_input_poller_reads_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("localhost", 0))
+    sock.settimeout(0.0)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    poller = InputPoller(timeout=0.01)
+    received = []
+    poller.register("command", received.append)
+    poller.add_socket(sock)
+    poller.start()
+    try:
+        sender.sendto("SET ori 45", sock.getsockname())
+        deadline = time.time() + 2.0
+        while not received and time.time() < deadline:
+            poller.drain(0)
+            time.sleep(0.005)
+    finally:
+        poller.stop()
+        sock.close()
+        sender.close()
+
+    assert received == [["SET", "ori", "45"]]
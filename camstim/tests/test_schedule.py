@@ -0,0 +1,482 @@
+"""
+test_schedule.py
+
+Checks the vectorized frame schedule compiler against the original python
+    loop implementation of `Stimulus._build_frame_list` and
+    `Stimulus.set_display_sequence`, and the run-length encoded
+    `FrameSchedule` and lazy `SweepTable` against the dense lists they replace.
+
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from camstim.schedule import FrameSchedule, SweepTable, sweep_frame_bounds, \
+    sweep_frame_counts, compile_frame_schedule, compile_display_schedule, \
+    build_sweep_order, shuffle_sweep_order, ActiveIndex, schedule_frames, \
+    interleave_intervals, SchedulePlan, sweep_order_length, plan_stimulus, \
+    tf_phases, drift_phases, sync_square_schedule, sync_square_edges
+
+
+def reference_sweep_frames(sweeporder, sweeptime, preexpsec, postexpsec,
+                           postsweepsec, fps):
+    sweepframelist = []
+    frame = int(preexpsec * fps)
+    for i in range(len(sweeporder)):
+        frames = (frame, frame + int(fps * sweeptime) - 1)
+        sweepframelist.append(frames)
+        frame = frames[1] + int(fps) * postsweepsec + 1
+    return sweepframelist
+
+
+def reference_frame_list(sweep_order, sweep_length, blank_length, fps,
+                         start_time, stop_time):
+    sweep_frames = reference_sweep_frames(sweep_order, sweep_length, 0, 0,
+                                          blank_length, fps)
+    seq = []
+    seq.extend([-1]*int(fps*start_time))
+    for index, sweep in enumerate(sweep_frames):
+        seq.extend([sweep_order[index]]*(int(sweep[1]-sweep[0]+1)))
+        seq.extend([-1]*int(fps*blank_length))
+    if stop_time:
+        stop_frame = int(fps*stop_time)
+        seq = seq[:stop_frame]
+    return np.array(seq, dtype=np.int32)
+
+
+def reference_display_frame_list(sweep_order, sweep_length, blank_length, fps,
+                                 display_intervals):
+    display_intervals = np.array(display_intervals)
+    sweep_frames = reference_sweep_frames(sweep_order, sweep_length, 0, 0,
+                                          blank_length, fps)
+    seq0 = []
+    for index, sweep in enumerate(sweep_frames):
+        seq0.extend([sweep_order[index]]*(int(sweep[1]-sweep[0]+1)))
+        seq0.extend([-1]*int(fps*blank_length))
+    seq = []
+    s0 = display_intervals[0, 0]
+    seq.extend([-1]*int(fps*s0))
+    for i, (start, stop) in enumerate(display_intervals):
+        frames_to_add = int((stop-start)*fps)
+        seq.extend(seq0[:frames_to_add])
+        try:
+            next_start = display_intervals[i+1, 0]
+        except IndexError:
+            break
+        grey_frames_to_add = int((next_start-stop)*fps)
+        seq.extend([-1]*grey_frames_to_add)
+        seq0 = seq0[frames_to_add:]
+    return np.array(seq, dtype=np.int32)
+
+
+def reference_sweep_order(sweep_count, runs, blank_sweeps):
+    sweeporder = range(sweep_count)
+    if blank_sweeps is not 0:
+        segments = [sweeporder[i:i + blank_sweeps]
+                    for i in range(0, len(sweeporder), blank_sweeps)]
+        sweeporder = []
+        for x in segments:
+            for y in x:
+                sweeporder.append(y)
+            if len(x) == blank_sweeps:
+                sweeporder.append(-1)
+    return sweeporder * runs
+
+
+def make_sweep_order(count, blanks=False):
+    order = np.random.RandomState(count).permutation(count).tolist()
+    if blanks:
+        order[::3] = [-1]*len(order[::3])
+    return order
+
+
+def compiled_schedule(sweep_order, sweep_length, blank_length, fps,
+                      start_time, stop_time):
+    starts, stops = sweep_frame_bounds(len(sweep_order), sweep_length,
+                                       blank_length, fps)
+    stop_frame = int(fps*stop_time) if stop_time else None
+    return compile_frame_schedule(sweep_order,
+                                  sweep_frame_counts(starts, stops),
+                                  int(fps*blank_length), int(fps*start_time),
+                                  stop_frame)
+
+
+TIMINGS = list(itertools.product(
+    [1, 7, 240],             # sweep count
+    [1/60.0, 0.25, 2.0],     # sweep length
+    [0, 0.5, 1.0],           # blank length
+    [30.0, 60.0],            # fps
+))
+
+
+@pytest.mark.parametrize("count,sweep_length,blank_length,fps", TIMINGS)
+def test_sweep_frames(count, sweep_length, blank_length, fps):
+    order = make_sweep_order(count)
+    for pre in (0, 1.5):
+        expected = reference_sweep_frames(order, sweep_length, pre, 0,
+                                          blank_length, fps)
+        starts, stops = sweep_frame_bounds(count, sweep_length,
+                                           blank_length, fps, pre)
+        assert list(zip(starts.tolist(), stops.tolist())) == expected
+
+
+@pytest.mark.parametrize("count,sweep_length,blank_length,fps", TIMINGS)
+@pytest.mark.parametrize("start_time,stop_time", [(0.0, None),
+                                                  (1.5, None),
+                                                  (0.0, 3.0),
+                                                  (2.0, 0.5),
+                                                  (0.0, 0)])
+def test_frame_list(count, sweep_length, blank_length, fps, start_time,
+                    stop_time):
+    order = make_sweep_order(count, blanks=True)
+    expected = reference_frame_list(order, sweep_length, blank_length, fps,
+                                    start_time, stop_time)
+    result = compiled_schedule(order, sweep_length, blank_length, fps,
+                               start_time, stop_time).to_array()
+    assert result.dtype == np.int32
+    np.testing.assert_array_equal(result, expected)
+
+
+DISPLAY_SEQUENCES = [
+    [(0.0, 10.0)],
+    [(5.0, 8.0)],
+    [(1.0, 2.0), (3.0, 4.5), (10.0, 100.0)],  # runs out of sweeps
+    [(0, 1), (2, 5), (6, 7)],                 # integer intervals
+    [(0.0, 2.0), (1.0, 3.0)],                 # overlapping intervals
+    [(0.25*i, 0.25*i + 0.125) for i in range(200)],
+]
+
+
+@pytest.mark.parametrize("count,sweep_length,blank_length,fps", TIMINGS)
+@pytest.mark.parametrize("display_sequence", DISPLAY_SEQUENCES)
+def test_display_frame_list(count, sweep_length, blank_length, fps,
+                            display_sequence):
+    order = make_sweep_order(count, blanks=True)
+    expected = reference_display_frame_list(order, sweep_length, blank_length,
+                                            fps, display_sequence)
+    starts, stops = sweep_frame_bounds(count, sweep_length, blank_length, fps)
+    result = compile_display_schedule(order,
+                                      sweep_frame_counts(starts, stops),
+                                      int(fps*blank_length),
+                                      np.array(display_sequence),
+                                      fps).to_array()
+    assert result.dtype == np.int32
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.fixture
+def schedule():
+    order = make_sweep_order(50, blanks=True)
+    return compiled_schedule(order, 0.25, 0.5, 60.0, 1.5, None)
+
+
+def test_schedule_random_access(schedule):
+    frame_list = schedule.to_array()
+    assert len(schedule) == len(frame_list)
+    for frame in np.random.RandomState(0).randint(0, len(frame_list), 500):
+        assert schedule[frame] == frame_list[frame]
+    assert schedule[-1] == frame_list[-1]
+    with pytest.raises(IndexError):
+        schedule[len(frame_list)]
+
+
+def test_schedule_cursor(schedule):
+    frame_list = schedule.to_array()
+    for frame in range(len(frame_list) + 10):
+        segment = schedule.advance(frame)
+        if frame >= len(frame_list) or frame_list[frame] == -1:
+            assert segment == -1
+        else:
+            assert schedule.sweeps[segment] == frame_list[frame]
+    # going backwards resets the cursor
+    frame = schedule.first_frame()
+    segment = schedule.advance(frame)
+    assert schedule.sweeps[segment] == frame_list[frame]
+
+
+def test_schedule_round_trip(schedule):
+    frame_list = schedule.to_array()
+    np.testing.assert_array_equal(
+        FrameSchedule.from_array(frame_list).to_array(), frame_list)
+    np.testing.assert_array_equal(
+        FrameSchedule.from_dict(schedule.to_dict()).to_array(), frame_list)
+    assert schedule.first_frame() == np.flatnonzero(frame_list != -1)[0]
+    assert schedule.last_frame() == np.flatnonzero(frame_list != -1)[-1]
+
+
+SWEEP_DIMENSIONS = [
+    [],
+    [[0, 45, 90]],
+    [[0.02, 0.04], [0, 90, 180, 270], [0.0, 0.25, 0.5]],
+    [["a", "b"], [(1, 1), (2, 2)], [5]],
+]
+
+
+@pytest.mark.parametrize("dimvalues", SWEEP_DIMENSIONS)
+def test_sweep_table(dimvalues):
+    expected = list(itertools.product(*dimvalues))
+    table = SweepTable(dimvalues)
+    assert len(table) == len(expected)
+    assert table.tolist() == expected
+    assert [table[i] for i in range(len(table))] == expected
+    assert table[-1] == expected[-1]
+    assert table[1::2] == expected[1::2]
+    with pytest.raises(IndexError):
+        table[len(expected)]
+
+
+def test_sweep_table_columns():
+    dimvalues = SWEEP_DIMENSIONS[2]
+    expected = np.array(list(itertools.product(*dimvalues)))
+    table = SweepTable(dimvalues)
+    for dimension in range(len(dimvalues)):
+        np.testing.assert_array_equal(table.column(dimension),
+                                      expected[:, dimension])
+    rows = [5, 0, 23]
+    np.testing.assert_array_equal(table.column(1, rows), expected[rows, 1])
+    assert table.digits(23).tolist() == [1, 3, 2]
+    assert table.sizes.sum() == 9
+
+
+def test_sweep_table_changes():
+    table = SweepTable([[0.02, 0.04], [0, 90], [0.5, 1.0, 0.5]])
+    rows = [0, 2, 3, 3, 11, 0]
+    expected = np.ones((len(rows), 3), dtype=bool)
+    for i in range(1, len(rows)):
+        expected[i] = [a != b for a, b in zip(table[rows[i]],
+                                              table[rows[i - 1]])]
+    np.testing.assert_array_equal(table.changes(rows), expected)
+    # unhashable values fall back to comparing value indices
+    table = SweepTable([[np.zeros(2), np.zeros(2)]])
+    assert table.changes([0, 1, 1]).ravel().tolist() == [True, True, False]
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 12])
+@pytest.mark.parametrize("runs", [1, 3])
+@pytest.mark.parametrize("blank_sweeps", [0, 1, 4, 12, 20])
+def test_build_sweep_order(count, runs, blank_sweeps):
+    expected = reference_sweep_order(count, runs, blank_sweeps)
+    result = build_sweep_order(count, runs, blank_sweeps)
+    assert result.dtype == np.int32
+    assert result.tolist() == expected
+
+
+def test_shuffle_sweep_order():
+    order = build_sweep_order(30, runs=4, blank_sweeps=5)
+    first = shuffle_sweep_order(order, np.random.RandomState(1), 4)
+    second = shuffle_sweep_order(order, np.random.RandomState(1), 4)
+    np.testing.assert_array_equal(first, second)
+    assert sorted(first.tolist()) == sorted(order.tolist())
+    assert order.tolist() == reference_sweep_order(30, 4, 5)  # not modified
+
+    block = shuffle_sweep_order(order, np.random.RandomState(1), 4,
+                                block=True)
+    for run in block.reshape(4, -1):
+        assert sorted(run.tolist()) == sorted(order[:len(run)].tolist())
+
+
+@pytest.mark.parametrize("block", [False, True])
+def test_shuffle_no_repeats(block):
+    order = build_sweep_order(3, runs=200, blank_sweeps=1)
+    for seed in range(20):
+        result = shuffle_sweep_order(order, np.random.RandomState(seed), 200,
+                                     block=block, no_repeats=True)
+        assert sorted(result.tolist()) == sorted(order.tolist())
+        shown = result[1:] != -1
+        assert not (result[1:] == result[:-1])[shown].any()
+    with pytest.raises(ValueError):
+        shuffle_sweep_order(np.zeros(10), np.random.RandomState(0),
+                            no_repeats=True)
+
+
+def test_active_index():
+    intervals = [(100, 199), None, (0, 49), (40, 120), (500, 500)]
+    index = ActiveIndex(intervals)
+    for frame in range(600):
+        expected = [i for i, interval in enumerate(intervals)
+                    if interval and interval[0] <= frame <= interval[1]]
+        assert index.active(frame) == expected
+    # skipping ahead and going back
+    assert index.active(1000) == []
+    assert index.active(45) == [2, 3]
+    assert index.active(150) == [0]
+
+
+def reference_interleave(intervals, interval_count):
+    display_sequences = []
+    for i, interval in enumerate(intervals):
+        epoc_length = sum(intervals)
+        pre_length = sum(intervals[:i])
+        t = 0.0
+        display_sequence = []
+        for seg in range(interval_count[i]):
+            start = pre_length + t
+            stop = pre_length + t + interval
+            t += epoc_length
+            display_sequence.append([start, stop])
+        display_sequences.append(display_sequence)
+    return display_sequences
+
+
+@pytest.mark.parametrize("intervals,counts", [
+    ([10.0], [3]),
+    ([0.1, 0.2, 0.3], [40, 40, 40]),
+    ([30.0, 0.7, 12.5, 1/3.0], [5, 200, 1, 33]),
+])
+def test_interleave(intervals, counts):
+    expected = reference_interleave(intervals, counts)
+    result = interleave_intervals(intervals, counts)
+    assert [r.tolist() for r in result] == expected
+
+
+def test_interleave_shuffle_flatten():
+    intervals, counts = [1.0, 2.0, 0.5], [4, 2, 6]
+    result = interleave_intervals(intervals, counts, shuffle=True,
+                                  flatten=True,
+                                  rng=np.random.RandomState(3))
+    assert [len(r) for r in result] == counts
+    segments = sorted((start, stop) for r in result for start, stop in r)
+    # flattened epochs leave no gaps, and nothing overlaps
+    assert segments[0][0] == 0.0
+    for (_, stop), (start, _) in zip(segments[:-1], segments[1:]):
+        assert start == pytest.approx(stop)
+    assert segments[-1][1] == pytest.approx(sum(
+        i*c for i, c in zip(intervals, counts)))
+    for r, interval in zip(result, intervals):
+        np.testing.assert_allclose(r[:, 1] - r[:, 0], interval)
+
+
+def test_schedule_frames():
+    for timing in TIMINGS:
+        count, sweep_length, blank_length, fps = timing
+        for stop_frame in (None, 45, 10**6):
+            expected = compiled_schedule(
+                make_sweep_order(count), sweep_length, blank_length, fps,
+                0.5, None if stop_frame is None else stop_frame/fps)
+            assert schedule_frames(count, int(fps*sweep_length),
+                                   int(fps*blank_length), int(fps*0.5),
+                                   stop_frame) == expected.total_frames
+
+
+@pytest.mark.parametrize("count,sweep_length,blank_length,fps", TIMINGS)
+@pytest.mark.parametrize("runs,blank_sweeps", [(1, 0), (3, 2)])
+def test_plan_stimulus(count, sweep_length, blank_length, fps, runs,
+                       blank_sweeps):
+    order = build_sweep_order(count, runs, blank_sweeps)
+    assert sweep_order_length(count, runs, blank_sweeps) == len(order)
+    starts, stops = sweep_frame_bounds(len(order), sweep_length,
+                                       blank_length, fps)
+    counts = sweep_frame_counts(starts, stops)
+    for start_time, stop_time in [(0.0, None), (1.5, None), (2.0, 0.5),
+                                  (1.0, 30.0)]:
+        plan = plan_stimulus(count, sweep_length, blank_length, fps, runs,
+                             blank_sweeps, start_time, stop_time)
+        schedule = compiled_schedule(order, sweep_length, blank_length, fps,
+                                     start_time, stop_time)
+        assert plan.total_frames == schedule.total_frames
+        if schedule.first_frame() is not None:
+            assert plan.start_frame <= schedule.first_frame()
+            assert plan.stop_frame > schedule.last_frame()
+    for display_sequence in DISPLAY_SEQUENCES:
+        plan = plan_stimulus(count, sweep_length, blank_length, fps, runs,
+                             blank_sweeps,
+                             display_sequence=display_sequence)
+        schedule = compile_display_schedule(order, counts,
+                                            int(fps*blank_length),
+                                            np.array(display_sequence), fps)
+        assert plan.total_frames == schedule.total_frames
+        # every displayed frame falls in a planned block
+        frames = np.flatnonzero(schedule.to_array() != -1)
+        in_block = ((frames[:, np.newaxis] >= plan.blocks[:, 0]) &
+                    (frames[:, np.newaxis] < plan.blocks[:, 1])).any(axis=1)
+        assert in_block.all()
+
+
+def test_combine_plans():
+    plan = SchedulePlan.combine([SchedulePlan(100, [(50, 100)]),
+                                 SchedulePlan(80, [(0, 10), (60, 80)])])
+    assert plan.total_frames == 100
+    assert plan.blocks.tolist() == [[0, 10], [50, 100], [60, 80]]
+    assert (plan.start_frame, plan.stop_frame) == (0, 100)
+    assert SchedulePlan.combine([]).start_frame is None
+
+
+def test_frame_schedule_content_mask():
+    frame_list = np.array([-1, 0, 0, -1, 2, 2, 2, -1, -1, 1])
+    schedule = FrameSchedule.from_array(frame_list)
+    assert np.array_equal(schedule.content_mask(), frame_list >= 0)
+    assert np.array_equal(schedule.content_mask(5), frame_list[:5] >= 0)
+    assert np.array_equal(schedule.content_mask(12),
+                          np.append(frame_list >= 0, [False, False]))
+
+
+def test_tf_phases():
+    frame_list = np.array([-1, 0, 0, -1, 2, 2, 2, -1, -1, 1])
+    tf = np.array([2.0, 4.0, 1.5])
+    schedule = FrameSchedule.from_array(frame_list)
+    phases = tf_phases(schedule, tf[schedule.sweeps], 60.0)
+    for frame, sweep in enumerate(frame_list):
+        if sweep < 0:
+            assert np.isnan(phases[frame])
+        else:
+            assert phases[frame] == tf[sweep] * frame / 60.0
+
+
+def test_drift_phases():
+    rng = np.random.RandomState(0)
+    rates = rng.uniform(-1, 1, 500)
+    coefficients = [30.0, 90.0, 360.0]
+    expected = []
+    for coefficient in coefficients:
+        phase = 0.0
+        for rate in rates:
+            phase = np.mod(phase + coefficient * rate / 60.0, 360)
+            expected.append(phase)
+    phases = drift_phases(rates, coefficients, 60.0)
+    assert phases.shape == (len(coefficients) * len(rates),)
+    assert np.allclose(np.mod(phases - expected + 180, 360) - 180, 0)
+
+
+def reference_sync_square(vsyncs, frequency, colors, index=0, shown=None):
+    shown = [] if shown is None else shown
+    color = colors[index - 1]
+    for vsync in vsyncs:
+        if vsync % frequency == 0:
+            color = colors[index]
+            index = (index + 1) % len(colors)
+        shown.append(color)
+    return shown, index
+
+
+@pytest.mark.parametrize("vsyncs, frequency, start_index", [
+    (100, 1, 0),
+    (100, 5, 0),
+    (97, 60, 1),
+    ([3, 4, 5, 7, 8, 12, 13, 14, 30], 4, 2),
+])
+def test_sync_square_schedule(vsyncs, frequency, start_index):
+    colors = [-1, 0, 1]
+    indices = sync_square_schedule(vsyncs, frequency, len(colors), start_index)
+    if np.isscalar(vsyncs):
+        vsyncs = range(vsyncs)
+    expected, _ = reference_sync_square(vsyncs, frequency, colors, start_index)
+    assert [colors[i] for i in indices] == expected
+
+
+def test_sync_square_edges():
+    colors = [-1, 1]
+    # splash at frequency 5, then the experiment at 60
+    shown, index = reference_sync_square(range(30), 5, colors)
+    shown, _ = reference_sync_square(range(200), 60, colors, index, shown)
+    indices = np.concatenate((sync_square_schedule(30, 5, 2),
+                              sync_square_schedule(200, 60, 2, index)))
+    frames, values = sync_square_edges(indices, colors)
+    expected = [f for f in range(1, len(shown)) if shown[f] != shown[f - 1]]
+    assert frames.tolist() == expected
+    assert values.tolist() == [shown[f] for f in expected]
+
+    rgb = [[-1, -1, -1], [1, 1, 1], [1, 1, 1]]
+    frames, values = sync_square_edges([0, 1, 2, 0, 0], rgb)
+    assert frames.tolist() == [1, 3]
+    assert values.tolist() == [[1, 1, 1], [-1, -1, -1]]
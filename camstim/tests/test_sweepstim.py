@@ -0,0 +1,250 @@
+"""
+test_sweepstim.py
+
+Checks `Stimulus` against a stand-in psychopy stimulus that records the
+    setters it is called with.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from camstim.commands import Command, CommandTable, parse_commands
+from camstim.timing import FrameProfiler
+from camstim.sweepstim import Stimulus, StimulusArray, SweepStim, \
+    ControlStream
+
+
+class RecordingStim(object):
+    """
+    Records every setter call made on it, and the parameter values it is
+        drawn with.
+    """
+    def __init__(self):
+        self.calls = []
+        self.state = {}
+        self.draws = []
+        self.pos = (0.0, 0.0)
+        self.ori = 0.0
+
+    def __getattr__(self, name):
+        if not name.startswith("set"):
+            raise AttributeError(name)
+
+        def setter(value):
+            self.calls.append((name[3:], value))
+            self.state[name[3:]] = value
+        return setter
+
+    def draw(self):
+        self.draws.append(sorted(self.state.items()))
+
+
+def make_stimulus(**kwargs):
+    params = dict(sweep_params={"Ori": ([0, 45, 90], 0),
+                                "SF": ([0.02, 0.04], 1),
+                                "Contrast": ([0.5, 1.0], 2)},
+                  sweep_length=0.25, blank_length=0.1, blank_sweeps=4,
+                  runs=2, shuffle=True, seed=7, fps=60.0)
+    params.update(kwargs)
+    return Stimulus(RecordingStim(), **params)
+
+
+@pytest.fixture
+def stimulus():
+    return make_stimulus()
+
+
+def play(stimulus, frames):
+    for frame in frames:
+        stimulus.update(frame)
+    return stimulus.stim
+
+
+def full_apply(stimulus):
+    """
+    Makes the stimulus set every dimension on every new sweep.
+    """
+    stimulus._get_sweep_changes = lambda: None
+    return stimulus
+
+
+@pytest.mark.parametrize("step", [1, 3])
+def test_apply_sweep_changes_only(step):
+    stimulus = make_stimulus()
+    frames = range(0, stimulus.total_frames, step)
+    diff = play(stimulus, frames)
+    full = play(full_apply(make_stimulus()), frames)
+
+    assert diff.draws == full.draws
+    assert len(diff.draws) > 0
+    # nothing is set that a full apply wouldn't set
+    assert set(diff.calls) <= set(full.calls)
+    if step == 1:
+        assert len(diff.calls) < len(full.calls)
+
+
+@pytest.mark.parametrize("change", [
+    lambda s: s.set_fps(120.0),
+    lambda s: s.set_runs(3),
+    lambda s: s.set_display_sequence([(1, 4), (6, 9)]),
+])
+def test_lazy_rebuild_matches_eager(change):
+    # built, then changed
+    stimulus = make_stimulus()
+    stimulus.compile()
+    change(stimulus)
+    assert "frame_schedule" not in stimulus.__dict__
+
+    # changed before anything is built
+    fresh = make_stimulus()
+    change(fresh)
+    fresh.compile()
+
+    assert np.array_equal(stimulus.frame_list, fresh.frame_list)
+    assert np.array_equal(stimulus.sweep_order, fresh.sweep_order)
+    frames = range(stimulus.total_frames)
+    assert play(stimulus, frames).calls == play(fresh, frames).calls
+
+
+def test_sweep_order_set_by_hand(stimulus):
+    stimulus.set_sweep_order([2, 0, -1, 1])
+    assert list(stimulus.sweep_order) == [2, 0, -1, 1]
+    assert len(stimulus.sweep_frames) == 4
+    assert stimulus.frame_schedule.sweeps.tolist() == [2, 0, 1]
+
+
+def test_unknown_attribute_doesnt_build(stimulus):
+    with pytest.raises(AttributeError):
+        stimulus.frame_schedul
+    assert "frame_schedule" not in stimulus.__dict__
+    assert "sweep_table" not in stimulus.__dict__
+
+    array = StimulusArray([make_stimulus(), make_stimulus(seed=8)], 0.25)
+    assert getattr(array, "frame_schedule", None) is None
+    assert array.get_total_frames() == max(
+        stim.total_frames for stim in array.stimuli)
+
+
+def test_frame_list_cached(stimulus):
+    frame_list = stimulus.frame_list
+    assert stimulus.frame_list is frame_list
+    assert not frame_list.flags.writeable
+    assert np.array_equal(frame_list, stimulus.frame_schedule.to_array())
+
+    stimulus.set_fps(120.0)
+    assert stimulus.frame_list is not frame_list
+    assert len(stimulus.frame_list) > len(frame_list)
+
+    custom = np.array([-1, -1, 0, 0, 1, -1], dtype=np.int32)
+    stimulus.frame_list = custom
+    assert np.array_equal(stimulus.frame_list, custom)
+
+
+def test_package_keeps_frame_list(stimulus):
+    frame_list = np.array(stimulus.frame_list)
+    packaged = stimulus.package()
+    assert np.array_equal(packaged["frame_list"], frame_list)
+    assert packaged["frame_schedule"]["total_frames"] == len(frame_list)
+
+
+class DuckStimulus(object):
+    """
+    Stimulus from a user script that only implements the old interface.
+    """
+    def __init__(self, total_frames):
+        self.total_frames = total_frames
+
+    def get_total_frames(self):
+        return self.total_frames
+
+
+def test_count_total_frames():
+    sweepstim = object.__new__(SweepStim)
+    stimulus = make_stimulus()
+    sweepstim.stimuli = [DuckStimulus(10**6), stimulus]
+    sweepstim.primary_stimulus = None
+    assert sweepstim._count_total_frames() == 10**6
+    sweepstim.primary_stimulus = 1
+    assert sweepstim._count_total_frames() == stimulus.get_total_frames()
+
+
+class IdleRecorder(object):
+    """
+    Stand-in for `GCControl` that counts the frames it is idle on.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def idle(self, reason="blank"):
+        self.calls += 1
+
+
+def test_gc_idle_on_blank_sweeps():
+    sweepstim = object.__new__(SweepStim)
+    stimulus = make_stimulus(runs=1)
+    sweepstim.stimuli = [stimulus]
+    sweepstim.items = OrderedDict()
+    sweepstim.vsynccount = 0
+    sweepstim.total_frames = stimulus.total_frames
+    sweepstim._active_index = None
+    sweepstim._profiler = FrameProfiler(SweepStim.PROFILER_PHASES,
+                                        enabled=False)
+    sweepstim.flip = lambda: None
+    sweepstim._check_keys = lambda: None
+    sweepstim._gc = IdleRecorder()
+    sweepstim._gc_frames = ~sweepstim._content_mask()
+
+    idle = []
+    for frame in range(sweepstim.total_frames):
+        calls = sweepstim._gc.calls
+        sweepstim.update(frame)
+        idle.append(sweepstim._gc.calls > calls)
+
+    blank = stimulus.frame_list == -1
+    assert idle == blank.tolist()
+    # blanks between sweeps, not just before and after the stimulus
+    assert blank[:stimulus.get_active_interval()[1]].sum() > 0
+
+
+class SubframeWindow(object):
+    subframeRate = 180.0
+
+
+def test_add_stimulus_subframes():
+    sweepstim = object.__new__(SweepStim)
+    sweepstim.window = SubframeWindow()
+    sweepstim.fps = SubframeWindow.subframeRate
+    sweepstim.stimuli = []
+    stimulus = make_stimulus()
+    array = StimulusArray([make_stimulus(), make_stimulus(seed=8)], 0.25)
+    sweepstim.add_stimulus(stimulus)
+    sweepstim.add_stimulus(array)
+
+    assert stimulus.fps == 180.0
+    assert array.fps == 180.0
+    assert [stim.fps for stim in array.stimuli] == [180.0, 180.0]
+    fresh = StimulusArray([make_stimulus(fps=180.0),
+                           make_stimulus(seed=8, fps=180.0)], 0.25)
+    assert array.get_total_frames() == fresh.get_total_frames()
+
+
+def test_control_targets():
+    sweepstim = object.__new__(SweepStim)
+    sweepstim.stimuli = [make_stimulus()]
+    controlstream = object.__new__(ControlStream)
+    controlstream._commands = CommandTable(sweepstim)
+    sweepstim.items = {"control_stream": controlstream}
+    sweepstim._register_control_targets()
+
+    table = controlstream._commands
+    assert sorted(table._attributes) == ["stimuli.0.stim.ori",
+                                         "stimuli.0.stim.pos"]
+    table.execute(Command("SET", "stimuli.0.stim.ori", 90))
+    assert sweepstim.stimuli[0].stim.ori == 90.0
+    # the example from the commands module docstring
+    for command in parse_commands("SET stimuli.0.stim.ori 45"):
+        table.execute(command)
+    assert sweepstim.stimuli[0].stim.ori == 45.0
+    with pytest.raises(KeyError):
+        table.execute(Command("RUN", "window.close", None))
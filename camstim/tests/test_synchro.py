@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from psychopy import visual
+
+from camstim.synchro import SimulatedBackend, SyncPulse, SyncSquare
+
+
+def test_simulated_backend_edges():
+    backend = SimulatedBackend(capacity=1)
+    backend.write(1)
+    backend.write(0)
+    backend.write_pulse(1, 0)
+    backend.write(0)
+
+    assert backend.calls == 5
+    assert backend.values.tolist() == [1, 0, 1, 0, 0]
+    rising, falling = backend.edges()
+    assert np.array_equal(rising, backend.times[[0, 2]])
+    assert np.array_equal(falling, backend.times[[1, 3]])
+    assert np.all(np.diff(backend.times) >= 0)
+
+
+def test_sync_pulse_frame_edges():
+    level = SyncPulse("Dev1", 0, 0, backend=SimulatedBackend())
+    inverted = SyncPulse("Dev1", 0, 0, invert=True, backend="simulated")
+    for pulse in (level, inverted):
+        for _ in range(3):
+            pulse.frame_start()
+            pulse.frame_end()
+
+    assert level._backend.calls == 6
+    assert level._backend.values.tolist() == [1, 0] * 3
+    assert inverted._backend.values.tolist() == [0, 1] * 3
+    assert len(level._backend.edges()[0]) == 3
+    assert level.backend == "SimulatedBackend"
+
+
+
+@pytest.fixture
+def sync_square(monkeypatch):
+    colors = []
+    monkeypatch.setattr(visual.GratingStim, "__init__",
+                        lambda self, **kwargs: None)
+    monkeypatch.setattr(visual.GratingStim, "setColor",
+                        lambda self, color: colors.append(color))
+    monkeypatch.setattr(visual.GratingStim, "draw", lambda self: None)
+    square = SyncSquare(None, frequency=60)
+    return square, colors
+
+
+def test_sync_square_segments(sync_square):
+    square, colors = sync_square
+    square.start_segment("splash", 30, frequency=5)
+    for vsync in range(30):
+        square.update(vsync)
+    square.start_segment("stimulus", 300)
+    for vsync in range(300):
+        square.update(vsync)
+    # an open ended segment the length of which isn't known
+    square.start_segment("task")
+    for vsync in range(1, 125):
+        square.update(vsync)
+
+    # the color only changes when the index does
+    assert colors == [1, -1] * 6
+    edges = square.expected_edges()
+    assert edges['frame'].tolist() == [5, 10, 15, 20, 25, 30, 90, 150, 210,
+                                       270, 389, 449]
+    assert edges['vsync'].tolist() == [5, 10, 15, 20, 25, 0, 60, 120, 180,
+                                       240, 60, 120]
+    assert edges['color'].tolist() == colors
+    assert edges['segment'].tolist() == [0] * 5 + [1] * 5 + [2] * 2
+    assert edges['segments']['name'] == ["splash", "stimulus", "task"]
+    assert edges['segments']['start'].tolist() == [0, 30, 330]
+    assert edges['segments']['frames'].tolist() == [30, 300, 124]
+    assert edges['segments']['vsync'].tolist() == [0, 0, 1]
+
+
+def test_sync_square_skipped_frames(sync_square):
+    square, colors = sync_square
+    # frames dropped under frame_policy="skip" are never updated
+    square.start_segment("stimulus", 300)
+    for vsync in range(300):
+        if vsync not in (59, 60, 61, 150):
+            square.update(vsync)
+    square.start_segment("task")
+    for vsync in range(1, 125):
+        if vsync != 60:
+            square.update(vsync)
+
+    assert colors == [1, -1, 1, -1, 1]
+    edges = square.expected_edges()
+    assert edges['frame'].tolist() == [59, 117, 176, 236, 414]
+    assert edges['vsync'].tolist() == [62, 120, 180, 240, 120]
+    assert edges['color'].tolist() == colors
+    assert edges['segments']['frames'].tolist() == [296, 123]
+
+
+def test_sync_square_record_grows(sync_square):
+    square, colors = sync_square
+    square.OPEN_SEGMENT_CAPACITY = 4
+    square.start_segment("stimulus", 3, frequency=2)
+    # more updates than the segment was started with
+    for vsync in range(5):
+        square.update(vsync)
+    square.start_segment("task", frequency=2)
+    for vsync in range(10):
+        square.update(vsync)
+
+    edges = square.expected_edges()
+    assert edges['segments']['frames'].tolist() == [5, 10]
+    assert edges['vsync'].tolist() == [2, 0, 2, 4, 6, 8]
@@ -0,0 +1,230 @@
+import gc
+import itertools
+
+import numpy as np
+import pytest
+
+from camstim.timing import (FrameProfiler, FrameIntervals, FrameScheduler,
+                            GCControl, allocation_counter,
+                            frame_interval_stats)
+
+
+def fake_clock(step=0.001):
+    ticks = itertools.count()
+    return lambda: next(ticks) * step
+
+
+@pytest.mark.parametrize("frames", [0, 2, 10])
+def test_frame_profiler_records_phases(frames):
+    profiler = FrameProfiler(("a", "b"), frames, clock=fake_clock())
+    for i in range(5):
+        profiler.start(blank=(i == 0))
+        profiler.mark(0)
+        profiler.mark(1)
+        profiler.stop()
+
+    assert profiler.frame_count == 5
+    assert profiler.timestamps.shape == (5, 3)
+    assert np.allclose(profiler.durations(), 0.001)
+    assert profiler.blank.tolist() == [True, False, False, False, False]
+    summary = profiler.summary()
+    assert sorted(summary) == ["a", "b"]
+    assert np.allclose(summary["a"], 1.0)
+
+    data = profiler.to_dict()
+    assert data["phases"] == ["a", "b"]
+    assert len(data["timestamps"]) == 5
+
+
+def test_frame_profiler_disabled():
+    profiler = FrameProfiler(("a",), 10, enabled=False)
+    profiler.start()
+    profiler.mark(0)
+    profiler.stop()
+    assert profiler.frame_count == 0
+    assert profiler.timestamps.shape == (0, 2)
+    assert profiler.to_dict()["timestamps"].nbytes == 0
+    assert profiler.summary() == {}
+    assert "phase" in profiler.summary_text()
+
+
+def test_frame_intervals_buffer():
+    intervals = FrameIntervals([0.016, 0.017], capacity=1)
+    values = np.random.RandomState(0).uniform(0.015, 0.05, 100)
+    intervals.extend(values)
+    all_values = np.concatenate(([0.016, 0.017], values))
+
+    assert len(intervals) == 102
+    assert np.array_equal(np.array(intervals), all_values)
+    assert intervals[1] == 0.017
+    assert list(intervals)[-1] == values[-1]
+    stats = intervals.running_stats()
+    assert np.isclose(stats["mean"], all_values.mean())
+    assert np.isclose(stats["std"], all_values.std())
+    assert stats["min"] == all_values.min()
+    assert stats["max"] == all_values.max()
+    assert np.array_equal(intervals.dropped(0.04),
+                          np.flatnonzero(all_values > 0.04))
+    assert intervals.histogram(bins=5)[0].sum() == 102
+    assert np.allclose(intervals.percentiles((50, 100)),
+                       np.percentile(all_values, (50, 100)))
+
+    intervals.clear()
+    assert len(intervals) == 0
+    assert np.isnan(intervals.running_stats()["mean"])
+
+
+def test_frame_interval_stats():
+    intervals = np.array([16.0, 17.0, 16.0, 50.0, 16.0, 34.0])
+    stats = frame_interval_stats(intervals)
+    mean = intervals.mean()
+    assert stats["total"] == 6
+    assert np.isclose(stats["mean"], mean)
+    assert stats["dropped"].tolist() == [i for i, x in enumerate(intervals)
+                                         if x > 1.5 * mean]
+    assert stats["percentiles"][-1] == 50.0
+    assert frame_interval_stats([])["total"] == 0
+
+
+def run_scheduler(scheduler, flip_frames):
+    """
+    Runs a scheduler where the flip after each shown frame lands on the vsync
+        in `flip_frames`, one vsync per entry.
+    """
+    shown = []
+    frame, vsync = 0, 0
+    while frame < scheduler.total_frames:
+        shown.append(frame)
+        vsync += flip_frames.get(frame, 1)
+        frame = scheduler.next_frame(frame, vsync / 60.0)
+    return shown
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("keep", list(range(10))),
+    ("skip", [0, 1, 2, 3, 6, 7, 8, 9]),
+    ("skip_blank", [0, 1, 2, 3, 5, 6, 7, 8, 9]),
+])
+def test_frame_scheduler_policies(policy, expected):
+    blank = np.zeros(10, dtype=bool)
+    blank[4] = True
+    scheduler = FrameScheduler(10, 60.0, policy, blank)
+    # frame 3's flip takes 3 vsyncs: two drops
+    shown = run_scheduler(scheduler, {3: 3})
+    assert shown == expected
+
+    data = scheduler.to_dict()
+    assert data["frame"].tolist() == [3]
+    assert data["lag"].tolist() == [2]
+    assert data["skipped"].tolist() == [10 - len(expected)]
+    assert scheduler.skipped_frames == 10 - len(expected)
+
+
+def test_frame_scheduler_skip_blank_catches_up():
+    blank = np.zeros(20, dtype=bool)
+    blank[10:] = True
+    scheduler = FrameScheduler(20, 60.0, "skip_blank", blank)
+    # three drops during content, made up once the blank frames come up
+    shown = run_scheduler(scheduler, {2: 4})
+    assert shown == list(range(10)) + list(range(13, 20))
+
+    data = scheduler.to_dict()
+    assert data["frame"].tolist() == [2, 9]
+    assert data["lag"].tolist() == [3, 3]
+    assert data["skipped"].tolist() == [0, 3]
+    assert scheduler.skipped_frames == 3
+
+
+def test_frame_scheduler_end_and_errors():
+    scheduler = FrameScheduler(5, 60.0, "skip")
+    assert run_scheduler(scheduler, {2: 10}) == [0, 1, 2]
+    assert scheduler.to_dict()["skipped"].tolist() == [2]
+    assert len(FrameScheduler(5, 60.0).to_dict()["frame"]) == 0
+    with pytest.raises(ValueError):
+        FrameScheduler(5, 60.0, "fast")
+    with pytest.raises(ValueError):
+        FrameScheduler(5, 60.0, "skip_blank")
+
+
+class Node(object):
+    pass
+
+
+def test_gc_control():
+    was_enabled = gc.isenabled()
+    gc.enable()
+    try:
+        control = GCControl("blank")
+        control.freeze()
+        assert not gc.isenabled()
+        garbage = [Node() for _ in range(gc.get_threshold()[0] + 10)]
+        control.idle()
+        del garbage
+        control.collect(reason="splash")
+        control.restore()
+        assert gc.isenabled()
+        control.restore()  # no-op
+
+        data = control.to_dict()
+        assert data["reason"] == ["freeze", "blank", "splash", "restore"]
+        assert data["generation"].tolist() == [2, 0, 2, 2]
+        assert np.all(data["duration"] >= 0)
+
+        auto = GCControl()
+        auto.freeze()
+        assert gc.isenabled()
+        assert auto.collections == 0
+        with pytest.raises(ValueError):
+            GCControl("never")
+    finally:
+        if not was_enabled:
+            gc.disable()
+
+
+@pytest.mark.parametrize("counts, generation", [
+    ((10**6, 0, 0), 0),
+    ((0, 10**6, 0), 1),
+    ((10**6, 10**6, 10**6), 2),
+    ((0, 0, 0), None),
+])
+def test_gc_control_idle_generations(monkeypatch, counts, generation):
+    was_enabled = gc.isenabled()
+    try:
+        control = GCControl("blank")
+        control.freeze()
+        monkeypatch.setattr(gc, "get_count", lambda: counts)
+        control.idle()
+        monkeypatch.undo()
+        control.restore()
+        generations = control.to_dict()["generation"].tolist()
+        if generation is None:
+            assert generations == [2, 2]
+        else:
+            assert generations == [2, generation, 2]
+    finally:
+        if was_enabled:
+            gc.enable()
+        else:
+            gc.disable()
+
+
+def test_frame_profiler_allocations():
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        profiler = FrameProfiler(("alloc", "none"), 2, clock=allocation_counter,
+                                 scale=1, units="objects")
+        kept = []
+        for _ in range(3):
+            profiler.start()
+            kept.append([Node() for _ in range(10)])
+            profiler.mark(0)
+            profiler.mark(1)
+            profiler.stop()
+        durations = profiler.durations()
+        assert np.all(durations[:, 0] >= 10)
+        assert np.all(durations[:, 1] == 0)
+        assert "phase (objects)" in profiler.summary_text()
+    finally:
+        if was_enabled:
+            gc.enable()
@@ -0,0 +1,194 @@
+"""
+test_warpmesh.py
+
+Checks the indexed warp meshes against the GL_QUADS arrays the original
+    `Window` projection loops built.
+
+"""
+import os
+
+import numpy as np
+import pytest
+
+from camstim import warpmesh
+from camstim.warpmesh import grid_indices, quad_mesh, projection_mesh, \
+    warpfile_mesh, parse_warpfile, read_warpfile
+
+
+def reference_projection(grid, width_cm, height_cm, dist_cm, eyepoint,
+                         isCylindrical=False, isCurvilinear=False):
+    xEye = eyepoint[0] * width_cm
+    yEye = eyepoint[1] * height_cm
+    vertices = np.zeros(((grid-1)*(grid-1)*4, 2), dtype='float32')
+    tcoords = np.zeros(((grid-1)*(grid-1)*4, 2), dtype='float32')
+    equalDistanceX = np.linspace(0, width_cm, grid)
+    equalDistanceY = np.linspace(0, height_cm, grid)
+    x_c = np.linspace(-1.0, 1.0, grid)
+    y_c = np.linspace(-1.0, 1.0, grid)
+    x_coords, y_coords = np.meshgrid(x_c, y_c)
+    x = np.zeros((grid, grid), dtype='float32')
+    y = np.zeros((grid, grid), dtype='float32')
+    x[:, :] = equalDistanceX - xEye
+    y[:, :] = equalDistanceY - yEye
+    y = np.transpose(y)
+    r = np.sqrt(np.square(x) + np.square(y) + np.square(dist_cm))
+    azimuth = np.arctan(x / dist_cm)
+    altitude = np.arcsin(y / r)
+    if isCylindrical:
+        tx = dist_cm * np.sin(azimuth)
+        ty = dist_cm * np.sin(altitude)
+    else:
+        tx = dist_cm * (1 + x / r) - dist_cm
+        ty = dist_cm * (1 + y / r) - dist_cm
+    azimuth[azimuth == 0] = np.finfo(np.float32).eps
+    altitude[altitude == 0] = np.finfo(np.float32).eps
+    if isCylindrical or isCurvilinear:
+        tx = tx * azimuth / np.sin(azimuth)
+        ty = ty * altitude / np.sin(altitude)
+    else:
+        centralAngle = np.arccos(np.cos(altitude) * np.cos(np.abs(azimuth)))
+        arcLength = centralAngle * dist_cm
+        theta = np.arctan2(ty, tx)
+        tx = arcLength * np.cos(theta)
+        ty = arcLength * np.sin(theta)
+    u_coords = tx / width_cm + 0.5
+    v_coords = ty / height_cm + 0.5
+
+    vdex = 0
+    for y in xrange(0, grid-1):
+        for x in xrange(0, grid-1):
+            corners = [(y, x), (y, x+1), (y+1, x+1), (y+1, x)]
+            for i, corner in enumerate(corners):
+                vertices[vdex+i] = (x_coords[corner], y_coords[corner])
+                tcoords[vdex+i] = (u_coords[corner], v_coords[corner])
+            vdex += 4
+    return vertices, tcoords
+
+
+def as_quads(array, indices):
+    """
+    Expands an indexed mesh back into GL_QUADS order.
+    """
+    return array[indices.reshape(-1, 6)[:, [0, 1, 2, 5]].ravel()]
+
+
+def test_grid_indices():
+    indices = grid_indices(3, 2)
+    assert indices.dtype == np.uint32
+    assert indices.tolist() == [0, 1, 4, 0, 4, 3, 1, 2, 5, 1, 5, 4]
+    # both triangles of a cell share the quad's first diagonal
+    triangles = grid_indices(300, 300).reshape(-1, 2, 3)
+    assert len(triangles) == 299 * 299
+    assert np.array_equal(triangles[:, 0, [0, 2]], triangles[:, 1, [0, 1]])
+
+
+@pytest.mark.parametrize("projection, kwargs", [
+    ("spherical", {}),
+    ("cylindrical", {"isCylindrical": True}),
+    ("curvilinear", {"isCurvilinear": True}),
+])
+@pytest.mark.parametrize("eyepoint", [(0.5, 0.5), (0.25, 0.6)])
+def test_projection_mesh(projection, kwargs, eyepoint):
+    expected = reference_projection(40, 51.0, 31.875, 15.0, eyepoint,
+                                    **kwargs)
+    vertices, tcoords, indices = projection_mesh(40, 40, 51.0, 31.875, 15.0,
+                                                 eyepoint, projection)
+    assert vertices.shape == tcoords.shape == (40 * 40, 2)
+    assert len(indices) == 39 * 39 * 6
+    assert np.array_equal(as_quads(vertices, indices), expected[0])
+    assert np.array_equal(as_quads(tcoords, indices), expected[1])
+
+
+def test_projection_mesh_unknown():
+    with pytest.raises(ValueError):
+        projection_mesh(4, 4, 50.0, 30.0, 15.0, projection="fisheye")
+
+
+def test_warpfile_mesh():
+    cols, rows = 4, 3
+    warpdata = np.random.RandomState(0).rand(cols * rows, 5)
+    vertices, tcoords, opacity, indices = warpfile_mesh(warpdata, cols, rows)
+    quads = as_quads(np.arange(cols * rows), indices)
+    reference = []
+    for y in range(rows - 1):
+        for x in range(cols - 1):
+            index = y * cols + x
+            reference.extend([index, index + 1, index + cols + 1,
+                              index + cols])
+    assert quads.tolist() == reference
+    assert np.array_equal(vertices, warpdata[:, :2].astype('float32'))
+    assert np.array_equal(tcoords, warpdata[:, 2:4].astype('float32'))
+    assert np.array_equal(opacity[:, 3], warpdata[:, 4].astype('float32'))
+    assert np.all(opacity[:, :3] == 1)
+
+
+def test_quad_mesh():
+    vertices, tcoords, indices = quad_mesh()
+    assert as_quads(vertices, indices).tolist() == vertices.tolist()
+    assert as_quads(tcoords, indices).tolist() == tcoords.tolist()
+
+
+def write_warpfile(path, cols, rows, seed=0):
+    warpdata = np.random.RandomState(seed).rand(cols * rows, 5)
+    with open(path, "w") as f:
+        f.write("2\n%d %d\n" % (cols, rows))
+        np.savetxt(f, warpdata, fmt="%.6f")
+    return np.loadtxt(path, skiprows=2)
+
+
+def test_parse_warpfile(tmpdir):
+    path = str(tmpdir.join("warp.data"))
+    expected = write_warpfile(path, 7, 5)
+    cols, rows, warpdata = parse_warpfile(open(path).read())
+    assert (cols, rows) == (7, 5)
+    assert np.array_equal(warpdata, expected)
+    # windows line endings
+    cols, rows, warpdata = parse_warpfile(
+        open(path).read().replace("\n", "\r\n"))
+    assert np.array_equal(warpdata, expected)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "2\n",
+    "1\n2 2\n" + "0 0 0 0 1\n" * 4,
+    "2\n2\n" + "0 0 0 0 1\n" * 4,
+    "2\n1 4\n" + "0 0 0 0 1\n" * 4,
+    "2\n2 2\n" + "0 0 0 0 1\n" * 3,
+    "2\n2 2\n" + "0 0 0 0 1\n" * 5,
+    "2\n2 2\n" + "0 0 0 0 1\n" * 2 + "0 0 x 0 1\n" + "0 0 0 0 1\n",
+    "2\n2 2\n" + "0 0 0 0 1\n" * 3 + "0 0 0 0 nan\n",
+])
+def test_parse_warpfile_invalid(text):
+    with pytest.raises(ValueError):
+        parse_warpfile(text)
+
+
+def test_read_warpfile_sidecar(tmpdir, monkeypatch):
+    path = str(tmpdir.join("warp.data"))
+    expected = write_warpfile(path, 6, 4)
+    cols, rows, warpdata = read_warpfile(path)
+    assert (cols, rows) == (6, 4)
+    assert np.array_equal(warpdata, expected)
+    assert os.path.isfile(path + ".npz")
+
+    # the sidecar is used while the warpfile is unchanged
+    def fail(text):
+        raise AssertionError("warpfile was parsed")
+    monkeypatch.setattr(warpmesh, "parse_warpfile", fail)
+    cols, rows, warpdata = read_warpfile(path)
+    assert np.array_equal(warpdata, expected)
+    monkeypatch.undo()
+
+    # rewritten with the same modification time
+    mtime = os.path.getmtime(path)
+    expected = write_warpfile(path, 6, 4, seed=1)
+    os.utime(path, (mtime, mtime))
+    assert np.array_equal(read_warpfile(path)[2], expected)
+
+    expected = write_warpfile(path, 3, 8, seed=2)
+    cols, rows, warpdata = read_warpfile(path)
+    assert (cols, rows) == (3, 8)
+    assert np.array_equal(warpdata, expected)
+
+    assert sorted(os.listdir(str(tmpdir))) == ["warp.data", "warp.data.npz"]
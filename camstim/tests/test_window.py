@@ -5,7 +5,8 @@ Just tests that the major programs in the package are all compatible with
     a psychopy stimulus window.
 
 """
-from camstim import Window, SweepStim, Behavior, VisualObject
+from camstim import Window, Warp, SweepStim, Behavior, VisualObject
+import numpy as np
 import pytest
 
 
@@ -30,3 +31,54 @@ def test_behavior(window):
 def test_visual_obj(window):
     vo = VisualObject(window=window)
     vo.update(0)
+
+
+@pytest.mark.parametrize("mesh_warp, shader_warp", [
+    (Warp.Spherical, Warp.SphericalShader),
+    (Warp.Cylindrical, Warp.CylindricalShader),
+])
+def test_warp_shader_matches_mesh(mesh_warp, shader_warp):
+    """
+    Renders the same frame through the warp mesh and the warp shader.  Run
+        under Mesa's software renderer (LIBGL_ALWAYS_SOFTWARE=1) so the
+        result doesn't depend on the graphics driver.
+    """
+    from psychopy import visual
+    frames = []
+    for warp in (mesh_warp, shader_warp):
+        w = Window(size=(320, 200), warp=warp, warpGridsize=300,
+                   warpCache=False, eyepoint=(0.4, 0.55), units="norm")
+        grating = visual.GratingStim(w, tex="sin", sf=8, size=2)
+        grating.draw()
+        w.flip()
+        frames.append(np.asarray(w.getMovieFrame(), dtype=np.float32))
+        w.close()
+    mesh, shader = frames
+    # the mesh is a piecewise linear version of the shader's mapping
+    assert np.mean(np.abs(mesh - shader)) < 2.0
+    assert np.percentile(np.abs(mesh - shader), 99) < 32.0
+
+
+def test_dlp180hz_subframes():
+    """
+    Each of the three subframes ends up in its own channel of the output
+        frame: green, red, then blue.
+    """
+    from psychopy import visual
+    from camstim.window import Projector
+    w = Window(size=(64, 64), projectorType=Projector.DLP180Hz, units="norm",
+               color=-1)
+    rect = visual.Rect(w, width=2, height=2, lineColor=None)
+    w.setRecordFrameIntervals(True)
+    levels = [-0.5, 0.0, 0.5]
+    for level in levels:
+        rect.setFillColor([level, level, level])
+        rect.draw()
+        w.flip()
+    frame = np.asarray(w.getMovieFrame(), dtype=np.float32)
+    w.close()
+    expected = [(level + 1) / 2 * 255 for level in levels]
+    for channel, value in zip([1, 0, 2], expected):
+        assert np.allclose(frame[..., channel], value, atol=2.0)
+    assert len(w.frameIntervals) == 2
+    assert len(w.refreshIntervals) == 0
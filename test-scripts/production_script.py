@@ -1,6 +1,7 @@
 
 import camstim
 from camstim import Stimulus, SweepStim, Foraging, Window, Warp
+from camstim.schedule import drift_phases
 from psychopy import monitors, visual
 import os
 import time
@@ -157,19 +158,11 @@ def create_drift(window, n_repeats, frame_rate, current_start_time,
     # sequence that is passed in as a vector of floating-point values ranging 
     # from -1 to 1, where for vertical stripes -1 is the maximum speed in 
     # leftward direction and +1 is maximum speed in rightward direction.
-    list_of_phases = []
-
-    for drift_coefficient in drift_rates:
-        current_phase = 0.0
-
-        for drift_direction in list_of_drifts:
-            # we operate in degrees here (0-360)
-            current_phase = current_phase + drift_coefficient*drift_direction/frame_rate
-            current_phase = np.mod(current_phase, 360)
-            list_of_phases.append(current_phase)
+    # we operate in degrees here (0-360)
+    list_of_phases = drift_phases(list_of_drifts, drift_rates, frame_rate)
 
     # psychopy is unconventional in that phases have modulus 1
-    list_of_phases = [x/360 for x in list_of_phases]
+    list_of_phases = list_of_phases/360
 
     stimulus_obj = Stimulus(visual.GratingStim(window,
                         pos=(0, 0),